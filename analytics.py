@@ -1,11 +1,23 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from typing import Optional, Dict, Any
-import mysql.connector
+from typing import Optional, Dict, Any, List, Tuple
+from collections import defaultdict
+from contextlib import contextmanager
 from mysql.connector import Error
 import uuid
 import json as json_lib
 import hashlib
+import base64
+import os
+from db_pool import ConnectionPool
+from event_writer import AnalyticsEventWriter, ActiveConversationCache, _UNSET
+from rollups import (
+    RollupCompactor, MARK_CONVERSATION_DIRTY, MARK_SESSION_DIRTY, MARK_TIME_DIRTY,
+    average as rollup_average, daily_view, totals as rollup_totals,
+)
+from response_cache import ResponseCache, cached_endpoint
+from live_events import AnalyticsEventBus
 
 router = APIRouter()
 
@@ -18,22 +30,40 @@ MYSQL_CONFIG = {
     'database': 'chatbot_analytics'
 }
 
-def get_db_connection():
+# Shared connection pool used by execute_query (sized via MYSQL_POOL_* env vars)
+db_pool = ConnectionPool.from_env(MYSQL_CONFIG)
+
+@contextmanager
+def pooled_cursor():
+    """Check out a pooled connection and yield (connection, cursor); rolls back on error"""
     try:
-        connection = mysql.connector.connect(**MYSQL_CONFIG)
-        if connection.is_connected():
-            return connection
+        connection = db_pool.acquire()
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
         raise HTTPException(status_code=500, detail="Database connection error")
-    return None
 
-def execute_query(query: str, params: tuple = None, fetch: bool = True) -> Optional[Dict[str, Any]]:
-    connection = None
+    cursor = None
+    discard = False
     try:
-        connection = get_db_connection()
         cursor = connection.cursor(dictionary=True)
-        
+        yield connection, cursor
+    except Error as e:
+        print(f"Error executing query: {e}")
+        try:
+            connection.rollback()
+        except Error:
+            discard = True
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+        db_pool.release(connection, discard=discard)
+
+def execute_query(query: str, params: tuple = None, fetch: bool = True) -> Optional[Dict[str, Any]]:
+    with pooled_cursor() as (connection, cursor):
         if params:
             cursor.execute(query, params)
         else:
@@ -46,179 +76,192 @@ def execute_query(query: str, params: tuple = None, fetch: bool = True) -> Optio
             result = None
             
         return result
-    except Error as e:
-        print(f"Error executing query: {e}")
-        if connection:
-            connection.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if connection and connection.is_connected():
-            cursor.close()
-            connection.close()
+
+def execute_transaction(statements: List[Tuple[str, tuple]]):
+    """Run several write statements on one connection and commit them together"""
+    with pooled_cursor() as (connection, cursor):
+        for query, params in statements:
+            cursor.execute(query, params)
+        connection.commit()
+
+# Counter deltas pushed to dashboards over GET /analytics/live (see live_events.py)
+event_bus = AnalyticsEventBus.from_env()
+
+def start_live_events():
+    """Must be called from the running event loop"""
+    if AnalyticsEventBus.enabled_from_env():
+        event_bus.start()
+
+def stop_live_events():
+    event_bus.stop()
+
+# Short-TTL cache in front of the dashboard read endpoints; ANALYTICS_CACHE_TTL=0 disables it
+response_cache = ResponseCache(
+    ttl=float(os.getenv("ANALYTICS_CACHE_TTL", "5")),
+    max_entries=int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "512")),
+)
+
+# Cached endpoints each kind of user event can change; other events invalidate everything
+EVENT_INVALIDATES = {
+    "session_start": ("analytics", "sessions", "conversations", "messages", "users"),
+    "session_end": ("analytics", "sessions", "conversations", "messages", "users"),
+    "question_asked": ("analytics", "conversations", "messages", "users"),
+    "bot_response": ("analytics", "conversations", "messages", "users"),
+    "user_identified": ("analytics", "users"),
+}
 
 def record_user_event(user_id: str, session_id: str, event_type: str, event_data: Dict = None):
     if not user_id:
         return
+    if event_writer.running:
+        event_writer.submit_event(user_id, session_id, event_type, event_data)
+    else:
+        _record_user_event_sync(user_id, session_id, event_type, event_data)
+    # Invalidated at submit time: a read racing the queued write can still
+    # cache the old row, for at most the TTL
+    response_cache.invalidate(*EVENT_INVALIDATES.get(event_type, ()))
+    event_bus.publish(event_type, session_id)
+
+def execute_write(query: str, params: tuple = None):
+    """Run a write statement, queued behind pending analytics events when the writer is running"""
+    if event_writer.running:
+        event_writer.submit_query(query, params)
+    else:
+        execute_query(query, params, fetch=False)
+    # Only used for session updates
+    response_cache.invalidate("analytics", "sessions")
+
+# Creates the user on first sight and applies the event's counter deltas in
+# the same statement. total_duration is read from the conversation that a
+# session_end just closed (the subquery yields NULL for other events).
+USER_UPSERT = """
+    INSERT INTO users
+      (user_id, first_seen_at, last_active_at, total_sessions, total_messages,
+       total_duration, total_conversations, is_active, last_page_url)
+    VALUES (%s, %s, %s, %s, %s,
+            COALESCE((SELECT duration FROM conversations WHERE conversation_id = %s), 0),
+            %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      last_active_at = VALUES(last_active_at),
+      total_sessions = total_sessions + VALUES(total_sessions),
+      total_messages = total_messages + VALUES(total_messages),
+      total_duration = total_duration + VALUES(total_duration),
+      total_conversations = total_conversations + VALUES(total_conversations),
+      is_active = IF(%s, VALUES(is_active), is_active),
+      last_page_url = IF(%s, VALUES(last_page_url), last_page_url)
+"""
+
+# session_id -> active conversation_id, filled at session_start
+active_conversations = ActiveConversationCache()
 
-    timestamp = datetime.now().isoformat()
-    page_url = event_data.get('page_url') if event_data else None
-    duration = event_data.get('duration') if event_data else 0
+def user_upsert(user_id: str, timestamp: str, sessions: int = 0, messages: int = 0,
+                closed_conversation_id: str = None, is_active: Optional[bool] = None,
+                page_url=_UNSET) -> Tuple[str, tuple]:
+    return USER_UPSERT, (
+        user_id, timestamp, timestamp, sessions, messages,
+        closed_conversation_id,
+        1 if closed_conversation_id else 0,
+        True if is_active is None else is_active,
+        None if page_url is _UNSET else page_url,
+        is_active is not None,
+        page_url is not _UNSET,
+    )
+
+def get_active_conversation(session_id: str) -> Optional[str]:
+    conversation_id = active_conversations.get(session_id)
+    if conversation_id:
+        return conversation_id
+    # Session started before this process (or was evicted); fall back to the DB
+    conv = execute_query(
+        """
+        SELECT conversation_id
+          FROM conversations
+         WHERE session_id = %s
+           AND status = 'active'
+         ORDER BY start_time DESC
+         LIMIT 1
+        """,
+        (session_id,)
+    )
+    if not conv:
+        return None
+    conversation_id = conv[0]["conversation_id"]
+    active_conversations.set(session_id, conversation_id)
+    return conversation_id
+
+def _record_user_event_sync(user_id: str, session_id: str, event_type: str, event_data: Dict = None,
+                            timestamp: str = None):
+    if not user_id:
+        return
+
+    timestamp = timestamp or datetime.now().isoformat()
+    event_data = event_data or {}
 
     try:
         print(f"Updating user {user_id} at {timestamp} for {event_type}")
-        # Check if user exists
-        user = execute_query(
-            "SELECT * FROM users WHERE user_id = %s",
-            (user_id,)
-        )
-
-        if not user:
-            # Create new user with all counters initialized to 0
-            execute_query(
-                """
-                INSERT INTO users 
-                  (user_id, first_seen_at, last_active_at, total_sessions, total_messages, total_duration, total_conversations, is_active)
-                VALUES (%s, %s, %s, 0, 0, 0, 0, TRUE)
-                """,
-                (user_id, timestamp, timestamp),
-                fetch=False
-            )
-        else:
-            # Always update last_active_at for any event
-            execute_query(
-                """
-                UPDATE users 
-                SET last_active_at = %s
-                WHERE user_id = %s
-                """,
-                (timestamp, user_id),
-                fetch=False
-            )
 
-        # Update user stats based on event type
         if event_type == "session_start":
-            execute_query(
-                """
-                UPDATE users 
-                  SET total_sessions = total_sessions + 1,
-                      is_active = TRUE,
-                      last_page_url = %s
-                WHERE user_id = %s
-                """,
-                (page_url, user_id),
-                fetch=False
-            )
-            # Record new session row
-            execute_query(
-                """
-                INSERT INTO sessions 
-                  (session_id, user_id, start_time, page_url, message_count, status) 
-                VALUES (%s, %s, %s, %s, 0, 'active')
-                """,
-                (session_id, user_id, timestamp, page_url),
-                fetch=False
-            )
-            # Create new conversation for this session
             conversation_id = str(uuid.uuid4())
-            execute_query(
-                """
-                INSERT INTO conversations 
-                  (conversation_id, session_id, user_id, start_time, status)
-                VALUES (%s, %s, %s, %s, 'active')
-                """,
-                (conversation_id, session_id, user_id, timestamp),
-                fetch=False
-            )
-            # Insert a "session_start" system message
-            execute_query(
-                """
-                INSERT INTO messages 
-                  (message_id, conversation_id, user_id, message_type, content, timestamp)
-                VALUES (UUID(), %s, %s, 'system', 'session_start', %s)
-                """,
-                (conversation_id, user_id, timestamp),
-                fetch=False
-            )
-
-        elif event_type == "question_asked":
-            # Find the active conversation for this session
-            conv = execute_query(
-                """
-                SELECT conversation_id
-                  FROM conversations
-                 WHERE session_id = %s
-                   AND status = 'active'
-                 ORDER BY start_time DESC
-                 LIMIT 1
-                """,
-                (session_id,)
-            )
-            if conv:
-                conversation_id = conv[0]["conversation_id"]
-                # Insert the user's question into messages
-                execute_query(
+            execute_transaction([
+                user_upsert(user_id, timestamp, sessions=1, is_active=True,
+                            page_url=event_data.get('page_url')),
+                (
                     """
-                    INSERT INTO messages 
-                      (message_id, conversation_id, user_id, message_type, content, timestamp)
-                    VALUES (UUID(), %s, %s, 'user', %s, %s)
+                    INSERT INTO sessions 
+                      (session_id, user_id, start_time, page_url, message_count, status) 
+                    VALUES (%s, %s, %s, %s, 0, 'active')
                     """,
-                    (conversation_id, user_id, event_data.get("question", ""), timestamp),
-                    fetch=False
-                )
-                # Update user row: bump total_messages
-                execute_query(
+                    (session_id, user_id, timestamp, event_data.get('page_url'))
+                ),
+                (
                     """
-                    UPDATE users
-                      SET total_messages = total_messages + 1
-                    WHERE user_id = %s
+                    INSERT INTO conversations 
+                      (conversation_id, session_id, user_id, start_time, status)
+                    VALUES (%s, %s, %s, %s, 'active')
                     """,
-                    (user_id,),
-                    fetch=False
-                )
-
-        elif event_type == "bot_response":
-            # Find the active conversation for this session
-            conv = execute_query(
-                """
-                SELECT conversation_id
-                  FROM conversations
-                 WHERE session_id = %s
-                   AND status = 'active'
-                 ORDER BY start_time DESC
-                 LIMIT 1
-                """,
-                (session_id,)
-            )
-            if conv:
-                conversation_id = conv[0]["conversation_id"]
-                # Insert the bot's response
-                execute_query(
+                    (conversation_id, session_id, user_id, timestamp)
+                ),
+                (
                     """
                     INSERT INTO messages 
                       (message_id, conversation_id, user_id, message_type, content, timestamp)
-                    VALUES (UUID(), %s, %s, 'bot', %s, %s)
+                    VALUES (UUID(), %s, %s, 'system', 'session_start', %s)
+                    """,
+                    (conversation_id, user_id, timestamp)
+                ),
+            ])
+            active_conversations.set(session_id, conversation_id)
+
+        elif event_type in ("question_asked", "bot_response"):
+            conversation_id = get_active_conversation(session_id)
+            if not conversation_id:
+                execute_query(*user_upsert(user_id, timestamp), fetch=False)
+                return
+            if event_type == "question_asked":
+                message_type, content, messages = 'user', event_data.get("question", ""), 1
+            else:
+                message_type, content, messages = 'bot', event_data.get("response", ""), 0
+            execute_transaction([
+                user_upsert(user_id, timestamp, messages=messages),
+                (
+                    """
+                    INSERT INTO messages 
+                      (message_id, conversation_id, user_id, message_type, content, timestamp,
+                       response_time, time_to_first_token)
+                    VALUES (UUID(), %s, %s, %s, %s, %s, %s, %s)
                     """,
-                    (conversation_id, user_id, event_data.get("response", ""), timestamp),
-                    fetch=False
-                )
+                    (conversation_id, user_id, message_type, content, timestamp,
+                     event_data.get("response_time"), event_data.get("time_to_first_token"))
+                ),
+            ])
 
         elif event_type == "session_end":
-            # 1) Find the active conversation
-            conv = execute_query(
-                """
-                SELECT conversation_id
-                  FROM conversations
-                 WHERE session_id = %s
-                   AND status = 'active'
-                 ORDER BY start_time DESC
-                 LIMIT 1
-                """,
-                (session_id,)
-            )
-            if conv:
-                conversation_id = conv[0]["conversation_id"]
-                # 2) Compute the duration in seconds, set conversation to "completed"
-                execute_query(
+            conversation_id = get_active_conversation(session_id)
+            if not conversation_id:
+                execute_query(*user_upsert(user_id, timestamp), fetch=False)
+                return
+            execute_transaction([
+                (
                     """
                     UPDATE conversations
                       SET end_time = %s,
@@ -226,62 +269,67 @@ def record_user_event(user_id: str, session_id: str, event_type: str, event_data
                           duration = TIMESTAMPDIFF(SECOND, start_time, %s)
                      WHERE conversation_id = %s
                     """,
-                    (timestamp, timestamp, conversation_id),
-                    fetch=False
-                )
-                # 3) Add a "session_end" system message
-                execute_query(
+                    (timestamp, timestamp, conversation_id)
+                ),
+                (MARK_CONVERSATION_DIRTY, (conversation_id,)),
+                (
                     """
                     INSERT INTO messages 
                       (message_id, conversation_id, user_id, message_type, content, timestamp)
                     VALUES (UUID(), %s, %s, 'system', 'session_end', %s)
                     """,
-                    (conversation_id, user_id, timestamp),
-                    fetch=False
-                )
-                # 4) Retrieve that duration we just computed
-                result = execute_query(
-                    """
-                    SELECT duration
-                      FROM conversations
-                     WHERE conversation_id = %s
-                    """,
-                    (conversation_id,)
-                )
-                if result:
-                    session_duration = result[0]["duration"] or 0
-                else:
-                    session_duration = 0
-                # 5) Update the user row:
-                execute_query(
+                    (conversation_id, user_id, timestamp)
+                ),
+                user_upsert(user_id, timestamp, closed_conversation_id=conversation_id, is_active=False),
+            ])
+            active_conversations.pop(session_id)
+
+        elif event_type == "user_identified":
+            execute_transaction([
+                user_upsert(user_id, timestamp),
+                (
                     """
-                    UPDATE users
-                      SET is_active = FALSE,
-                          last_active_at = %s,
-                          total_duration = total_duration + %s,
-                          total_conversations = total_conversations + 1
+                    UPDATE users 
+                    SET user_type = 'returning'
                     WHERE user_id = %s
                     """,
-                    (timestamp, session_duration, user_id),
-                    fetch=False
-                )
+                    (user_id,)
+                ),
+            ])
 
-        elif event_type == "user_identified":
-            execute_query(
-                """
-                UPDATE users 
-                SET last_active_at = %s,
-                    user_type = 'returning'
-                WHERE user_id = %s
-                """,
-                (timestamp, user_id),
-                fetch=False
-            )
+        else:
+            execute_query(*user_upsert(user_id, timestamp), fetch=False)
 
     except Error as e:
         print(f"Error recording user event: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Write-behind queue for analytics events (see event_writer.py)
+event_writer = AnalyticsEventWriter.from_env(db_pool, _record_user_event_sync, execute_query,
+                                            conversations=active_conversations)
+
+def start_event_writer():
+    if AnalyticsEventWriter.enabled_from_env():
+        event_writer.start()
+
+def stop_event_writer():
+    """Flush all queued analytics writes; called on application shutdown"""
+    event_writer.stop()
+
+# Hourly/daily counters behind the dashboard stats (see rollups.py)
+rollup_compactor = RollupCompactor.from_env(db_pool)
+
+def start_rollups():
+    if RollupCompactor.enabled_from_env():
+        rollup_compactor.start()
+
+def stop_rollups():
+    rollup_compactor.stop()
+
+def read_rollups(since=None, until=None) -> dict:
+    with pooled_cursor() as (connection, cursor):
+        return rollup_totals(cursor, since, until)
+
 def generate_short_id():
     """Generate a shorter, more readable ID"""
     return hashlib.md5(str(uuid.uuid4()).encode()).hexdigest()[:8]
@@ -292,108 +340,219 @@ def generate_user_id():
     random_part = hashlib.md5(str(uuid.uuid4()).encode()).hexdigest()[:4]
     return f"user_{timestamp}_{random_part}"
 
+# --- Pagination ---
+
+# Lists are ordered newest first on (time column, primary key). A cursor
+# encodes the last row of the previous page, so the next page is an index
+# range scan no matter how deep it is; `offset` is still accepted for old
+# clients but costs O(offset). The time column must be NOT NULL in practice
+# and never updated, or rows would be skipped or repeated between pages.
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(sort_value, key) -> str:
+    if sort_value is None:
+        raise ValueError("Cannot build a cursor on a NULL sort value")
+    raw = json_lib.dumps([str(sort_value), key])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, key = json_lib.loads(raw)
+        if sort_value is None or sort_value == "None":
+            raise ValueError("NULL sort value")
+        return sort_value, key
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def date_range_filters(column: str, start_date: Optional[datetime], end_date: Optional[datetime]):
+    clauses, params = [], []
+    if start_date:
+        clauses.append(f"{column} >= %s")
+        params.append(start_date)
+    if end_date:
+        clauses.append(f"{column} < %s")
+        params.append(end_date)
+    return clauses, params
+
+def keyset_page(select: str, sort_column: str, key_column: str, filters: List[str], params: list,
+                cursor: Optional[str], offset: int, limit: int) -> Tuple[list, Optional[str]]:
+    """Run `select` (without WHERE/ORDER BY) for one page; returns (rows, next_cursor)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    where, params = list(filters), list(params)
+    if cursor:
+        sort_value, key = decode_cursor(cursor)
+        where.append(f"({sort_column} < %s OR ({sort_column} = %s AND {key_column} < %s))")
+        params += [sort_value, sort_value, key]
+    query = select
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    # One extra row tells whether there is a next page
+    query += f" ORDER BY {sort_column} DESC, {key_column} DESC LIMIT %s"
+    params.append(limit + 1)
+    if offset and not cursor:
+        query += " OFFSET %s"
+        params.append(offset)
+
+    rows = execute_query(query, tuple(params)) or []
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[sort_column.split(".")[-1]], last[key_column.split(".")[-1]])
+    return rows, next_cursor
+
 # --- Analytics Endpoints ---
 
+def _event_payload(data):
+    if not data:
+        return None
+    try:
+        return json_lib.loads(data)
+    except:
+        return data
+
+def load_session_histories(cursor, user_id: str = None) -> Dict[str, list]:
+    """user_id -> session_history list, built with two queries instead of one per session.
+
+    Events are the messages whose conversation_id equals the session_id and a
+    session's message_count is the number of those events, as in the
+    original per-session queries.
+    """
+    user_clause = "WHERE s.user_id = %s" if user_id else ""
+    params = (user_id,) if user_id else None
+
+    cursor.execute(f"""
+        SELECT s.session_id, s.user_id, s.start_time, s.end_time, s.duration
+        FROM sessions s
+        {user_clause}
+        ORDER BY s.user_id, s.start_time DESC
+    """, params)
+    sessions = cursor.fetchall()
+
+    cursor.execute(f"""
+        SELECT 
+            m.conversation_id,
+            m.message_type as type,
+            m.timestamp,
+            m.content as data
+        FROM sessions s
+        JOIN messages m ON m.conversation_id = s.session_id
+        {user_clause}
+        ORDER BY m.conversation_id, m.timestamp
+    """, params)
+    events_by_session = defaultdict(list)
+    for event in cursor.fetchall():
+        events_by_session[event['conversation_id']].append({
+            "type": event['type'],
+            "timestamp": event['timestamp'],
+            "data": _event_payload(event['data'])
+        })
+
+    histories = defaultdict(list)
+    for session in sessions:
+        events = events_by_session.get(session['session_id'], [])
+        histories[session['user_id']].append({
+            "session_id": session['session_id'],
+            "start_time": session['start_time'],
+            "end_time": session['end_time'],
+            "duration": session['duration'],
+            "message_count": len(events),
+            "events": events
+        })
+    return histories
+
 @router.get("/analytics")
-async def get_analytics():
+@cached_endpoint(response_cache, "analytics")
+def get_analytics():
     try:
-        # Get total users
-        total_users = execute_query("SELECT COUNT(*) as count FROM users")[0]['count']
-        
-        # Get total sessions
-        total_sessions = execute_query("SELECT SUM(total_sessions) as count FROM users")[0]['count'] or 0
-        
-        # Get total questions
-        total_questions = execute_query("SELECT SUM(total_messages) as count FROM users")[0]['count'] or 0
-        
-        # Get total chatbot opens
-        total_opens = execute_query("SELECT COUNT(*) as count FROM users WHERE total_sessions > 0")[0]['count'] or 0
-        
-        # Get all users with their stats
-        users = execute_query("""
-            SELECT 
-                u.*,
-                COUNT(DISTINCT s.session_id) as session_count,
-                AVG(s.duration) as avg_session_duration
-            FROM users u
-            LEFT JOIN sessions s ON u.user_id = s.user_id
-            GROUP BY u.user_id
-        """)
-        
+        # One connection and four queries, however many users and sessions there are
+        with pooled_cursor() as (connection, cursor):
+            cursor.execute("""
+                SELECT 
+                    COUNT(*) as total_users,
+                    SUM(total_sessions) as total_sessions,
+                    SUM(total_messages) as total_questions,
+                    COUNT(CASE WHEN total_sessions > 0 THEN 1 END) as total_opens
+                FROM users
+            """)
+            totals = cursor.fetchall()[0]
+
+            cursor.execute("SELECT * FROM users ORDER BY user_id")
+            users = cursor.fetchall()
+
+            histories = load_session_histories(cursor)
+
         users_data = {}
         for user in users:
-            user_id = user['user_id']
-            # Get user's sessions
-            sessions = execute_query("""
-                SELECT 
-                    s.*,
-                    COUNT(m.message_id) as message_count
-                FROM sessions s
-                LEFT JOIN messages m ON s.session_id = m.conversation_id
-                WHERE s.user_id = %s
-                GROUP BY s.session_id
-                ORDER BY s.start_time DESC
-            """, (user_id,))
-            
-            sessions_data = []
-            for session in sessions:
-                # Get events for this session
-                events = execute_query("""
-                    SELECT 
-                        message_type as type,
-                        timestamp,
-                        content as data
-                    FROM messages 
-                    WHERE conversation_id = %s
-                    ORDER BY timestamp
-                """, (session['session_id'],))
-                
-                events_data = []
-                for event in events:
-                    event_data = None
-                    if event['data']:
-                        try:
-                            event_data = json_lib.loads(event['data'])
-                        except:
-                            event_data = event['data']
-                            
-                    events_data.append({
-                        "type": event['type'],
-                        "timestamp": event['timestamp'],
-                        "data": event_data
-                    })
-                
-                sessions_data.append({
-                    "session_id": session['session_id'],
-                    "start_time": session['start_time'],
-                    "end_time": session['end_time'],
-                    "duration": session['duration'],
-                    "message_count": session['message_count'],
-                    "events": events_data
-                })
-            
-            users_data[user_id] = {
+            users_data[user['user_id']] = {
                 "sessions": user['total_sessions'],
                 "total_messages": user['total_messages'],
                 "total_duration": user['total_duration'],
                 "last_active": user['last_active_at'],
                 "created_at": user['first_seen_at'],
                 "is_active": user['is_active'],
-                "session_history": sessions_data
+                "session_history": histories.get(user['user_id'], [])
             }
         
         return {
-            "total_users": total_users,
-            "total_sessions": total_sessions,
-            "total_questions": total_questions,
-            "total_chatbot_opens": total_opens,
+            "total_users": totals['total_users'],
+            "total_sessions": totals['total_sessions'] or 0,
+            "total_questions": totals['total_questions'] or 0,
+            "total_chatbot_opens": totals['total_opens'] or 0,
             "users": users_data
         }
     except Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/analytics/pool", tags=["analytics"])
+async def get_pool_stats():
+    return db_pool.stats()
+
+@router.get("/analytics/writer", tags=["analytics"])
+async def get_writer_stats():
+    return event_writer.stats()
+
+@router.get("/analytics/rollups", tags=["analytics"])
+async def get_rollup_stats():
+    return rollup_compactor.stats()
+
+@router.get("/analytics/cache", tags=["analytics"])
+async def get_cache_stats():
+    return response_cache.stats()
+
+@router.get("/analytics/live", tags=["analytics"])
+async def stream_live_analytics():
+    """Server-sent events: a snapshot of the in-process counters, then their deltas"""
+    if not event_bus.running:
+        raise HTTPException(status_code=503, detail="Live analytics is disabled")
+
+    async def events():
+        async for message in event_bus.stream():
+            yield f"event: {message['type']}\ndata: {json_lib.dumps(message)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/analytics/live/stats", tags=["analytics"])
+async def get_live_stats():
+    return event_bus.stats()
+
 @router.get("/analytics/sessions", tags=["analytics"])
-async def get_session_analytics():
+@cached_endpoint(response_cache, "sessions")
+def get_session_analytics(
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+):
     try:
         # Get active sessions
         active_sessions = execute_query("""
@@ -402,22 +561,21 @@ async def get_session_analytics():
             WHERE status = 'active'
         """)[0]['active_count']
 
-        # Get total sessions today
-        today_sessions = execute_query("""
-            SELECT COUNT(*) as today_count 
-            FROM sessions 
-            WHERE DATE(start_time) = CURDATE()
-        """)[0]['today_count']
+        # Sessions today and average duration come from the rollups
+        today = datetime.now().date()
+        today_sessions = read_rollups(since=today)['sessions']
+        avg_duration = rollup_average(read_rollups(), "session_duration")
 
-        # Get average session duration
-        avg_duration = execute_query("""
-            SELECT AVG(duration) as avg_duration 
-            FROM sessions 
-            WHERE duration > 0
-        """)[0]['avg_duration']
-
-        # Get recent sessions with details
-        recent_sessions = execute_query("""
+        # Get recent sessions with details, one page at a time
+        filters, params = date_range_filters("s.start_time", start_date, end_date)
+        if user_id:
+            filters.append("s.user_id = %s")
+            params.append(user_id)
+        if status:
+            filters.append("s.status = %s")
+            params.append(status)
+        recent_sessions, next_cursor = keyset_page(
+            """
             SELECT 
                 s.session_id,
                 s.user_id,
@@ -427,15 +585,16 @@ async def get_session_analytics():
                 s.message_count,
                 s.status
             FROM sessions s
-            ORDER BY s.start_time DESC
-            LIMIT 10
-        """)
+            """,
+            "s.start_time", "s.session_id", filters, params, cursor, offset, limit
+        )
 
         return {
             "active_sessions": active_sessions or 0,
-            "today_sessions": today_sessions or 0,
-            "average_duration": round(avg_duration, 2) if avg_duration else 0,
-            "recent_sessions": recent_sessions or []
+            "today_sessions": int(today_sessions),
+            "average_duration": avg_duration,
+            "recent_sessions": recent_sessions,
+            "next_cursor": next_cursor
         }
     except Error as e:
         print(f"Error in session analytics: {str(e)}")
@@ -443,50 +602,79 @@ async def get_session_analytics():
             "active_sessions": 0,
             "today_sessions": 0,
             "average_duration": 0,
-            "recent_sessions": []
+            "recent_sessions": [],
+            "next_cursor": None
         }
 
 @router.get("/analytics/conversations", tags=["analytics"])
-async def get_conversation_analytics():
+@cached_endpoint(response_cache, "conversations")
+def get_conversation_analytics(
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+):
     try:
-        # Get conversation statistics
-        stats = execute_query("""
-            SELECT 
-                COUNT(*) as total_conversations,
-                COUNT(CASE WHEN status = 'active' THEN 1 END) as active_conversations,
-                COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_conversations,
-                COUNT(CASE WHEN status = 'handover' THEN 1 END) as handover_conversations,
-                AVG(duration) as avg_duration,
-                COUNT(CASE WHEN message_type = 'user' THEN 1 END) as user_messages
-            FROM conversations c
-            LEFT JOIN messages m ON c.conversation_id = m.conversation_id
-            GROUP BY c.conversation_id
-        """)[0]
+        # Totals, average duration and user messages come from the rollups; the
+        # open statuses are a range count on idx_conversations_status_start
+        rollup = read_rollups()
+        open_counts = execute_query("""
+            SELECT status, COUNT(*) as count
+            FROM conversations
+            WHERE status IN ('active', 'handover')
+            GROUP BY status
+        """)
+        open_counts = {row['status']: row['count'] for row in open_counts}
+        total_conversations = int(rollup['conversations'])
+        active_conversations = open_counts.get('active', 0)
+        handover_conversations = open_counts.get('handover', 0)
 
-        # Get recent conversations with message counts
-        recent_conversations = execute_query("""
+        # Get recent conversations, one page at a time, then the user message
+        # counts of just that page
+        filters, params = date_range_filters("c.start_time", start_date, end_date)
+        if user_id:
+            filters.append("c.user_id = %s")
+            params.append(user_id)
+        if status:
+            filters.append("c.status = %s")
+            params.append(status)
+        recent_conversations, next_cursor = keyset_page(
+            """
             SELECT 
                 c.conversation_id,
                 c.user_id,
                 c.start_time,
                 c.duration,
-                c.status,
-                COUNT(CASE WHEN m.message_type = 'user' THEN 1 END) as message_count
+                c.status
             FROM conversations c
-            LEFT JOIN messages m ON c.conversation_id = m.conversation_id
-            GROUP BY c.conversation_id
-            ORDER BY c.start_time DESC
-            LIMIT 10
-        """)
+            """,
+            "c.start_time", "c.conversation_id", filters, params, cursor, offset, limit
+        )
+        if recent_conversations:
+            ids = [c['conversation_id'] for c in recent_conversations]
+            counts = execute_query(f"""
+                SELECT conversation_id, COUNT(*) as message_count
+                FROM messages
+                WHERE message_type = 'user'
+                  AND conversation_id IN ({", ".join(["%s"] * len(ids))})
+                GROUP BY conversation_id
+            """, tuple(ids))
+            counts = {row['conversation_id']: row['message_count'] for row in counts}
+            for conversation in recent_conversations:
+                conversation['message_count'] = counts.get(conversation['conversation_id'], 0)
 
         return {
-            "total_conversations": stats['total_conversations'] or 0,
-            "active_conversations": stats['active_conversations'] or 0,
-            "completed_conversations": stats['completed_conversations'] or 0,
-            "handover_conversations": stats['handover_conversations'] or 0,
-            "average_duration": round(stats['avg_duration'], 2) if stats['avg_duration'] else 0,
-            "total_messages": stats['user_messages'] or 0,
-            "recent_conversations": recent_conversations or []
+            "total_conversations": total_conversations,
+            "active_conversations": active_conversations,
+            "completed_conversations": max(0, total_conversations - active_conversations - handover_conversations),
+            "handover_conversations": handover_conversations,
+            "average_duration": rollup_average(rollup, "conversation_duration"),
+            "total_messages": int(rollup['questions']),
+            "recent_conversations": recent_conversations,
+            "next_cursor": next_cursor
         }
     except Error as e:
         print(f"Error in conversation analytics: {str(e)}")
@@ -497,56 +685,82 @@ async def get_conversation_analytics():
             "handover_conversations": 0,
             "average_duration": 0,
             "total_messages": 0,
-            "recent_conversations": []
+            "recent_conversations": [],
+            "next_cursor": None
         }
 
+MESSAGE_STATS_QUERY = """
+    SELECT 
+        COUNT(CASE WHEN message_type = 'user' AND last_bot_at > timestamp THEN 1 END) as total_messages,
+        COUNT(CASE WHEN message_type = 'user' THEN 1 END) as user_messages,
+        COUNT(CASE WHEN message_type = 'bot' THEN 1 END) as bot_messages,
+        COUNT(CASE WHEN message_type = 'system' THEN 1 END) as system_messages,
+        AVG(CASE WHEN message_type = 'bot' THEN response_time END) as avg_response_time,
+        AVG(CASE WHEN message_type = 'bot' THEN time_to_first_token END) as avg_time_to_first_token
+    FROM (
+        SELECT 
+            message_type,
+            timestamp,
+            response_time,
+            time_to_first_token,
+            MAX(CASE WHEN message_type = 'bot' THEN timestamp END)
+                OVER (PARTITION BY conversation_id) as last_bot_at
+        FROM messages
+    ) m
+"""
+
 @router.get("/analytics/messages", tags=["analytics"])
-async def get_message_analytics():
+@cached_endpoint(response_cache, "messages")
+def get_message_analytics(
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    status: Optional[str] = Query(None, description="Message type: user, bot or system"),
+):
     try:
-        # Get message statistics - count each user-bot interaction as 1
-        stats = execute_query("""
-            SELECT 
-                COUNT(DISTINCT CASE 
-                    WHEN m1.message_type = 'user' AND m2.message_type = 'bot' 
-                    AND m1.conversation_id = m2.conversation_id 
-                    THEN m1.message_id 
-                END) as total_messages,
-                COUNT(CASE WHEN m1.message_type = 'user' THEN 1 END) as user_messages,
-                COUNT(CASE WHEN m1.message_type = 'bot' THEN 1 END) as bot_messages,
-                COUNT(CASE WHEN m1.message_type = 'system' THEN 1 END) as system_messages
-            FROM messages m1
-            LEFT JOIN messages m2 ON m1.conversation_id = m2.conversation_id 
-                AND m2.message_type = 'bot'
-                AND m2.timestamp > m1.timestamp
-                AND NOT EXISTS (
-                    SELECT 1 FROM messages m3 
-                    WHERE m3.conversation_id = m1.conversation_id 
-                    AND m3.message_type = 'bot'
-                    AND m3.timestamp > m1.timestamp 
-                    AND m3.timestamp < m2.timestamp
-                )
-        """)[0]
+        # Get message statistics - count each user-bot interaction as 1.
+        # A user message is answered when a bot message follows it in the same
+        # conversation; the latest bot timestamp per conversation comes from a
+        # window over the (conversation_id, timestamp) index, so this is one
+        # linear pass instead of a self-join with a correlated NOT EXISTS.
+        stats = execute_query(MESSAGE_STATS_QUERY)[0]
 
-        # Get recent messages with details
-        recent_messages = execute_query("""
+        # Get recent messages with details, one page at a time
+        filters, params = date_range_filters("m.timestamp", start_date, end_date)
+        if user_id:
+            filters.append("m.user_id = %s")
+            params.append(user_id)
+        if status:
+            filters.append("m.message_type = %s")
+            params.append(status)
+        recent_messages, next_cursor = keyset_page(
+            """
             SELECT 
                 m.message_id,
                 m.conversation_id,
                 m.user_id,
                 m.message_type,
                 m.content,
-                m.timestamp
+                m.timestamp,
+                m.response_time,
+                m.time_to_first_token
             FROM messages m
-            ORDER BY m.timestamp DESC
-            LIMIT 20
-        """)
+            """,
+            "m.timestamp", "m.message_id", filters, params, cursor, offset, limit
+        )
 
         return {
             "total_messages": stats['total_messages'] or 0,
             "user_messages": stats['user_messages'] or 0,
             "bot_messages": stats['bot_messages'] or 0,
             "system_messages": stats['system_messages'] or 0,
-            "recent_messages": recent_messages or []
+            "average_response_time": round(stats['avg_response_time'], 3) if stats['avg_response_time'] else 0,
+            "average_time_to_first_token": round(stats['avg_time_to_first_token'], 3) if stats['avg_time_to_first_token'] else 0,
+            "recent_messages": recent_messages,
+            "next_cursor": next_cursor
         }
     except Error as e:
         print(f"Error in message analytics: {str(e)}")
@@ -555,11 +769,89 @@ async def get_message_analytics():
             "user_messages": 0,
             "bot_messages": 0,
             "system_messages": 0,
-            "recent_messages": []
+            "average_response_time": 0,
+            "average_time_to_first_token": 0,
+            "recent_messages": [],
+            "next_cursor": None
+        }
+
+@router.get("/analytics/users", tags=["analytics"])
+@cached_endpoint(response_cache, "users")
+def get_users_analytics(
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    status: Optional[str] = Query(None, description="active, inactive, new or returning"),
+):
+    try:
+        stats = execute_query("""
+            SELECT 
+                COUNT(*) as total_users,
+                COUNT(CASE WHEN is_active THEN 1 END) as active_users,
+                COUNT(CASE WHEN user_type = 'returning' THEN 1 END) as returning_users,
+                AVG(total_sessions) as avg_sessions,
+                AVG(total_messages) as avg_messages
+            FROM users
+        """)[0]
+
+        # Newest users first: first_seen_at never changes, unlike last_active_at,
+        # so a user cannot move between pages; the date range still filters on
+        # last activity
+        filters, params = date_range_filters("u.last_active_at", start_date, end_date)
+        if user_id:
+            filters.append("u.user_id = %s")
+            params.append(user_id)
+        if status in ("active", "inactive"):
+            filters.append("u.is_active = %s")
+            params.append(status == "active")
+        elif status == "returning":
+            filters.append("u.user_type = 'returning'")
+        elif status == "new":
+            filters.append("(u.user_type IS NULL OR u.user_type <> 'returning')")
+        recent_users, next_cursor = keyset_page(
+            """
+            SELECT 
+                u.user_id,
+                u.first_seen_at,
+                u.last_active_at,
+                u.total_sessions,
+                u.total_messages,
+                u.is_active,
+                u.user_type
+            FROM users u
+            """,
+            "u.first_seen_at", "u.user_id", filters, params, cursor, offset, limit
+        )
+
+        total_users = stats['total_users'] or 0
+        return {
+            "total_users": total_users,
+            "active_users": stats['active_users'] or 0,
+            "new_users": total_users - (stats['returning_users'] or 0),
+            "returning_users": stats['returning_users'] or 0,
+            "average_sessions_per_user": round(stats['avg_sessions'], 2) if stats['avg_sessions'] else 0,
+            "average_messages_per_user": round(stats['avg_messages'], 2) if stats['avg_messages'] else 0,
+            "recent_users": recent_users,
+            "next_cursor": next_cursor
+        }
+    except Error as e:
+        print(f"Error in user analytics: {str(e)}")
+        return {
+            "total_users": 0,
+            "active_users": 0,
+            "new_users": 0,
+            "returning_users": 0,
+            "average_sessions_per_user": 0,
+            "average_messages_per_user": 0,
+            "recent_users": [],
+            "next_cursor": None
         }
 
 @router.get("/analytics/user/{user_id}", tags=["analytics"])
-async def get_user_analytics_by_id(user_id: str):
+def get_user_analytics_by_id(user_id: str):
     try:
         # Get user data
         user = execute_query("""
@@ -577,55 +869,9 @@ async def get_user_analytics_by_id(user_id: str):
             raise HTTPException(status_code=404, detail="User not found")
         
         user = user[0]
-        
-        # Get user's sessions
-        sessions = execute_query("""
-            SELECT 
-                s.*,
-                COUNT(m.message_id) as message_count
-            FROM sessions s
-            LEFT JOIN messages m ON s.session_id = m.conversation_id
-            WHERE s.user_id = %s
-            GROUP BY s.session_id
-            ORDER BY s.start_time DESC
-        """, (user_id,))
-        
-        sessions_data = []
-        for session in sessions:
-            # Get events for this session
-            events = execute_query("""
-                SELECT 
-                    message_type as type,
-                    timestamp,
-                    content as data
-                FROM messages 
-                WHERE conversation_id = %s
-                ORDER BY timestamp
-            """, (session['session_id'],))
-            
-            events_data = []
-            for event in events:
-                event_data = None
-                if event['data']:
-                    try:
-                        event_data = json_lib.loads(event['data'])
-                    except:
-                        event_data = event['data']
-                        
-                events_data.append({
-                    "type": event['type'],
-                    "timestamp": event['timestamp'],
-                    "data": event_data
-                })
-            
-            sessions_data.append({
-                "session_id": session['session_id'],
-                "start_time": session['start_time'],
-                "end_time": session['end_time'],
-                "duration": session['duration'],
-                "message_count": session['message_count'],
-                "events": events_data
-            })
+
+        with pooled_cursor() as (connection, cursor):
+            sessions_data = load_session_histories(cursor, user_id).get(user_id, [])
         
         user_data = {
             "user_id": user['user_id'],
@@ -644,7 +890,7 @@ async def get_user_analytics_by_id(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analytics/leads", tags=["analytics"])
-async def capture_lead(lead_data: dict):
+def capture_lead(lead_data: dict):
     try:
         # Generate a unique lead ID
         lead_id = str(uuid.uuid4())
@@ -665,6 +911,8 @@ async def capture_lead(lead_data: dict):
             ),
             fetch=False
         )
+        response_cache.invalidate("leads")
+        event_bus.publish("lead_captured")
         
         return {"status": "success", "lead_id": lead_id}
     except Error as e:
@@ -672,77 +920,138 @@ async def capture_lead(lead_data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/analytics/leads", tags=["analytics"])
-async def get_lead_analytics():
+@cached_endpoint(response_cache, "leads")
+def get_lead_analytics(
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    status: Optional[str] = Query(None, description="Lead type, e.g. appointment_scheduled"),
+):
     try:
-        # Get lead statistics
-        stats = execute_query("""
-            SELECT 
+        if status:
+            # Per-type counts are not rolled up; group the raw rows
+            date_column = "created_at"
+            filters, params = date_range_filters(date_column, start_date, end_date)
+            filters.append("lead_type = %s")
+            params.append(status)
+            source = "lead_analytics"
+            select = """
                 COUNT(*) as total_leads,
                 COUNT(CASE WHEN lead_type = 'appointment_scheduled' THEN 1 END) as scheduled_leads,
                 DATE(created_at) as date,
                 COUNT(*) as daily_leads
-            FROM lead_analytics
-            GROUP BY DATE(created_at)
+            """
+            group = "GROUP BY DATE(created_at)"
+            total_expression = "COUNT(*)"
+        else:
+            date_column = "bucket"
+            filters, params = date_range_filters(date_column, start_date, end_date)
+            filters.append("leads > 0")
+            source = daily_view("lead_analytics", ("leads", "scheduled_leads")) + " d"
+            select = """
+                SUM(leads) as total_leads,
+                SUM(scheduled_leads) as scheduled_leads,
+                bucket as date,
+                SUM(leads) as daily_leads
+            """
+            group = "GROUP BY bucket"
+            total_expression = "COALESCE(SUM(leads), 0)"
+        where = " WHERE " + " AND ".join(filters)
+        total_leads = execute_query(f"SELECT {total_expression} as count FROM {source}{where}",
+                                    tuple(params))[0]['count']
+
+        # Days are unique, so the cursor only needs the last day shown
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if cursor:
+            filters.append(f"{date_column} < %s")
+            params.append(decode_cursor(cursor)[0])
+        where = " WHERE " + " AND ".join(filters)
+        query = f"""
+            SELECT {select}
+            FROM {source}{where}
+            {group}
             ORDER BY date DESC
-            LIMIT 30
-        """)
+            LIMIT %s
+        """
+        params.append(limit + 1)
+        if offset and not cursor:
+            query += " OFFSET %s"
+            params.append(offset)
+        stats = execute_query(query, tuple(params)) or []
+        next_cursor = None
+        if len(stats) > limit:
+            stats = stats[:limit]
+            next_cursor = encode_cursor(stats[-1]['date'], None)
         
         return {
-            "total_leads": len(stats) or 0,
-            "daily_leads": stats or []
+            "total_leads": int(total_leads or 0),
+            "daily_leads": stats,
+            "next_cursor": next_cursor
         }
     except Error as e:
         print(f"Error in lead analytics: {str(e)}")
         return {
             "total_leads": 0,
-            "daily_leads": []
+            "daily_leads": [],
+            "next_cursor": None
         }
 
+def client_time(value: Optional[str], name: str) -> str:
+    """MySQL DATETIME in server local time from a client ISO 8601 time; now when missing or invalid.
+
+    The widget sends UTC ("...Z"), which stored as-is would be hours off and
+    often fall in an hour the rollups have already compacted.
+    """
+    if value:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)
+            return parsed.strftime('%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError, AttributeError) as e:
+            print(f"Error parsing {name}:", e)
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
 @router.post("/analytics/human_handover", tags=["analytics"])
-async def record_human_handover(data: dict = Body(...)):
+def record_human_handover(data: dict = Body(...)):
     try:
         print("Received handover data:", data)
-        # Convert ISO 8601 to MySQL DATETIME
-        requested_at = data.get('requested_at')
-        if requested_at:
-            try:
-                if requested_at.endswith('Z'):
-                    requested_at = requested_at[:-1]
-                if '.' in requested_at:
-                    requested_at = requested_at.split('.')[0]
-                requested_at = requested_at.replace('T', ' ')
-            except Exception as e:
-                print("Error parsing requested_at:", e)
-                requested_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            requested_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        execute_query(
-            """
-            INSERT INTO human_handover
-                (user_id, session_id, requested_at, method, issues, other_text, support_option, last_message, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending')
-            """,
+        requested_at = client_time(data.get('requested_at'), 'requested_at')
+        execute_transaction([
             (
-                data.get('user_id'),
-                data.get('session_id'),
-                requested_at,
-                data.get('method'),
-                json_lib.dumps(data.get('issues', [])),
-                data.get('other_text', ''),
-                data.get('support_option', ''),
-                data.get('last_message', ''),
+                """
+                INSERT INTO human_handover
+                    (user_id, session_id, requested_at, method, issues, other_text, support_option, last_message, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending')
+                """,
+                (
+                    data.get('user_id'),
+                    data.get('session_id'),
+                    requested_at,
+                    data.get('method'),
+                    json_lib.dumps(data.get('issues', [])),
+                    data.get('other_text', ''),
+                    data.get('support_option', ''),
+                    data.get('last_message', ''),
+                ),
             ),
-            fetch=False
-        )
+            # The client sends requested_at, so it can fall in an hour already rolled up
+            (MARK_TIME_DIRTY, (requested_at,)),
+        ])
+        response_cache.invalidate("human_handover")
+        event_bus.publish("human_handover", data.get('session_id'))
         return {"status": "success"}
     except Error as e:
         print(f"Error recording human handover: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/analytics/human_handover", tags=["analytics"])
-async def get_human_handover_analytics():
+@cached_endpoint(response_cache, "human_handover")
+def get_human_handover_analytics():
     try:
-        count = execute_query("SELECT COUNT(*) as count FROM human_handover")[0]['count']
+        count = int(read_rollups()['handovers'])
         recent = execute_query("""
             SELECT handover_id, user_id, session_id, requested_at, method, issues, other_text, support_option, status
             FROM human_handover
@@ -755,73 +1064,57 @@ async def get_human_handover_analytics():
         return {"total_handover": 0, "recent_handover": []}
 
 @router.post("/analytics/chatbot_close", tags=["analytics"])
-async def record_chatbot_close(data: dict = Body(...)):
+def record_chatbot_close(data: dict = Body(...)):
     try:
-        closed_at = data.get('closed_at')
-        if closed_at:
-            try:
-                if closed_at.endswith('Z'):
-                    closed_at = closed_at[:-1]
-                if '.' in closed_at:
-                    closed_at = closed_at.split('.')[0]
-                closed_at = closed_at.replace('T', ' ')
-            except Exception as e:
-                print("Error parsing closed_at:", e)
-                closed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            closed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        execute_query(
-            """
-            INSERT INTO chatbot_close_events
-                (user_id, session_id, closed_at, time_spent_seconds, last_user_message, last_bot_message)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
+        closed_at = client_time(data.get('closed_at'), 'closed_at')
+        execute_transaction([
             (
-                data.get('user_id'),
-                data.get('session_id'),
-                closed_at,
-                data.get('time_spent_seconds', 0),
-                data.get('last_user_message', ''),
-                data.get('last_bot_message', ''),
+                """
+                INSERT INTO chatbot_close_events
+                    (user_id, session_id, closed_at, time_spent_seconds, last_user_message, last_bot_message)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    data.get('user_id'),
+                    data.get('session_id'),
+                    closed_at,
+                    data.get('time_spent_seconds', 0),
+                    data.get('last_user_message', ''),
+                    data.get('last_bot_message', ''),
+                ),
             ),
-            fetch=False
-        )
+            # The client sends closed_at, so it can fall in an hour already rolled up
+            (MARK_TIME_DIRTY, (closed_at,)),
+        ])
+        event_bus.publish("chatbot_close", data.get('session_id'))
         return {"status": "success"}
     except Error as e:
         print(f"Error recording chatbot close: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analytics/session_end", tags=["analytics"])
-async def record_session_end(data: dict = Body(...)):
+def record_session_end(data: dict = Body(...)):
     try:
-        end_time = data.get('end_time')
-        if end_time:
-            try:
-                if end_time.endswith('Z'):
-                    end_time = end_time[:-1]
-                if '.' in end_time:
-                    end_time = end_time.split('.')[0]
-                end_time = end_time.replace('T', ' ')
-            except Exception as e:
-                print("Error parsing end_time:", e)
-                end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        execute_query(
-            """
-            UPDATE sessions
-            SET end_time = %s,
-                duration = %s,
-                status = 'completed'
-            WHERE session_id = %s
-            """,
+        end_time = client_time(data.get('end_time'), 'end_time')
+        execute_transaction([
             (
-                end_time,
-                data.get('duration', 0),
-                data.get('session_id'),
+                """
+                UPDATE sessions
+                SET end_time = %s,
+                    duration = %s,
+                    status = 'completed'
+                WHERE session_id = %s
+                """,
+                (
+                    end_time,
+                    data.get('duration', 0),
+                    data.get('session_id'),
+                ),
             ),
-            fetch=False
-        )
+            (MARK_SESSION_DIRTY, (data.get('session_id'),)),
+        ])
+        response_cache.invalidate("analytics", "sessions")
+        event_bus.publish("session_end", data.get('session_id'))
         return {"status": "success"}
     except Error as e:
         print(f"Error recording session end: {e}")
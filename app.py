@@ -1,37 +1,105 @@
 import os
 os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
 
+import time
+_IMPORT_START = time.perf_counter()
+
 import uuid
-from analytics import generate_short_id, generate_user_id, record_user_event, execute_query
+from analytics import (
+    generate_short_id, generate_user_id, record_user_event, execute_query, execute_write,
+    start_event_writer, stop_event_writer, start_rollups, stop_rollups,
+    start_live_events, stop_live_events,
+)
+from rollups import MARK_SESSION_DIRTY
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import pandas as pd
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain.chains import ConversationalRetrievalChain
-from langchain_core.documents import Document
-
-from langchain.prompts import PromptTemplate
+from chains import ChainFactory, ANSWER_MODES, rewrite_query
+from semantic_cache import SemanticCache
+from chat_history import ChatHistoryStore, SQLiteChatHistoryStore
+from embedding_cache import CachedEmbeddings
+from context_budget import BudgetedRetriever, ContextBudgeter
+from hybrid_retrieval import BM25Index, HybridRetriever, RetrievalStats, documents_from_store, lexical_search
+from ingestion import load_documents, sync_vector_store, FILTERABLE_METADATA
+
+from langchain_core.prompts import PromptTemplate
 import json
-import time
 from collections import defaultdict
-import mysql.connector
+from contextlib import asynccontextmanager
 from mysql.connector import Error
 import json as json_lib
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import hashlib
-from analytics import router as analytics_router
+import hmac
+import secrets
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from analytics import router as analytics_router, db_pool
+from migrations import migrate, check as check_schema
 
 # Load environment
 from dotenv import load_dotenv
 load_dotenv()
 
+# Heavy components (embeddings, vector store, LLMs, chains) are built by
+# warm_up() after the server has bound its port; until then /ready is 503
+STARTUP = {
+    "ready": False,
+    "error": None,
+    "import_seconds": None,
+    "startup_seconds": None,
+    "steps": {},
+}
+
+def timed_step(name, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        STARTUP["steps"][name] = round(time.perf_counter() - start, 3)
+        print(f"Startup step '{name}' took {STARTUP['steps'][name]:.3f}s")
+
+async def warm_up():
+    """Build everything the chat endpoints need; independent pieces run in parallel"""
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(
+            loop.run_in_executor(None, timed_step, "vector_store", init_vector_store),
+            loop.run_in_executor(None, timed_step, "llms", init_llms),
+            run_db(timed_step, "schema", init_schema),
+        )
+        # Pre-built chains capture their retriever, so the BM25 index comes first
+        await loop.run_in_executor(None, timed_step, "lexical_index", init_lexical_index)
+        await loop.run_in_executor(None, timed_step, "chains", init_chains)
+        STARTUP["ready"] = True
+    except Exception as e:
+        STARTUP["error"] = f"{type(e).__name__}: {e}"
+        print(f"Startup failed: {STARTUP['error']}")
+    finally:
+        STARTUP["startup_seconds"] = round(time.perf_counter() - start, 3)
+        print(f"Startup report: {json.dumps(STARTUP)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_event_writer()
+    start_live_events()
+    warm_up_task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        stop_live_events()
+        stop_rollups()
+        # Drain queued analytics writes before the worker exits
+        stop_event_writer()
+        DB_EXECUTOR.shutdown(wait=True)
+
 # Initialize FastAPI with WebSocket support
-app = FastAPI(title="Google Gen AI RAG App with ChromaDB")
+app = FastAPI(title="Google Gen AI RAG App with ChromaDB", lifespan=lifespan)
 
 # Add CORS middleware with specific origins
 app.add_middleware(
@@ -42,78 +110,146 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load CSV into DataFrame
+# CSV the vector store is built from
 CSV_PATH = os.getenv("CSV_PATH")
-print(f"Current working directory: {os.getcwd()}")
-print(f"Looking for CSV at: {CSV_PATH}")
-print(f"File exists: {os.path.exists(CSV_PATH)}")
-if not os.path.exists(CSV_PATH):
-    raise FileNotFoundError(f"CSV file not found at {CSV_PATH}")
 
 # Prepare embeddings
 EMBED_MODEL = os.getenv("EMBED_MODEL", "models/embedding-001")
-embeddings = GoogleGenerativeAIEmbeddings(model=EMBED_MODEL, google_api_key=os.getenv("GEMINI_API_KEY"))
 
 # Initialize ChromaDB vector store
 PERSIST_DIRECTORY = os.getenv("PERSIST_DIRECTORY", "chroma_db")
 
+# "chroma" (default) or "numpy": an in-process float32 matrix with brute-force
+# cosine search, which is faster than Chroma for an index of this size
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+if VECTOR_BACKEND not in ("chroma", "numpy"):
+    raise ValueError(f"VECTOR_BACKEND must be 'chroma' or 'numpy', got {VECTOR_BACKEND!r}")
+NUMPY_INDEX_DIRECTORY = os.getenv("NUMPY_INDEX_DIRECTORY", "numpy_index")
+
+# Re-sync the index with the CSV on startup (only new/changed chunks are embedded)
+SYNC_ON_STARTUP = os.getenv("SYNC_ON_STARTUP", "true").lower() == "true"
+
+# Worker processes; more than 1 runs the pre-fork server in prefork.py
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Set by preload_index() once the pre-fork parent has synced the index, so
+# forked workers only open it and never write to it concurrently
+INDEX_SYNCED = False
+
 def get_vector_store():
-    # Check if vector store already exists
-    if os.path.exists(PERSIST_DIRECTORY):
-        print("Loading existing vector store...")
-        return Chroma(
-            persist_directory=PERSIST_DIRECTORY,
+    directory = NUMPY_INDEX_DIRECTORY if VECTOR_BACKEND == "numpy" else PERSIST_DIRECTORY
+    exists = os.path.exists(directory)
+    print("Loading existing vector store..." if exists else "Creating new vector store...")
+    # Only the selected backend is imported
+    if VECTOR_BACKEND == "numpy":
+        from numpy_store import NumpyVectorStore
+        vector_store = NumpyVectorStore(embeddings, persist_directory=directory)
+    else:
+        from langchain_chroma import Chroma
+        vector_store = Chroma(
+            persist_directory=directory,
             embedding_function=embeddings
         )
+    if not INDEX_SYNCED and (not exists or SYNC_ON_STARTUP):
+        # Chunk IDs are content hashes, so this only embeds what changed
+        sync_vector_store(vector_store, load_documents(CSV_PATH))
+    return vector_store
+
+# Set by warm_up()
+embeddings = None
+vector_store = None
+llm = None
+answer_llm = None
+lexical_index = None
+chain_factory = None
+
+def init_vector_store():
+    global embeddings, vector_store
+    print(f"Looking for CSV at: {CSV_PATH}")
+    if not CSV_PATH or not os.path.exists(CSV_PATH):
+        raise FileNotFoundError(f"CSV file not found at {CSV_PATH}")
+    # The Google SDK is slow to import, so it is loaded here rather than at module level
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    # Cached per model + normalized text; set EMBED_CACHE_PATH to keep vectors across restarts
+    embeddings = CachedEmbeddings(
+        GoogleGenerativeAIEmbeddings(model=EMBED_MODEL, google_api_key=os.getenv("GEMINI_API_KEY")),
+        model_name=EMBED_MODEL,
+        max_entries=int(os.getenv("EMBED_CACHE_SIZE", "10000")),
+        path=os.getenv("EMBED_CACHE_PATH") or None
+    )
+    if vector_store is not None:
+        # Inherited from the pre-fork parent; only the API client is per process
+        vector_store.embeddings = embeddings
+        return
+    vector_store = get_vector_store()
+
+def close_chroma(store):
+    """Stop a Chroma client's SQLite handles and threads, and forget the cached client for its path"""
+    client = store._client
+    system = getattr(client, "_system", None)
+    if system is not None:
+        system.stop()
+    clear = getattr(client, "clear_system_cache", None)
+    if clear is not None:
+        clear()
+
+def preload_index():
+    """Pre-fork parent: sync the index once before forking.
+
+    The NumPy index is then inherited by every worker. Chroma's client holds
+    SQLite handles and threads that do not survive a fork, so the parent
+    closes it after syncing and each worker opens the synced store read-only.
+    """
+    global vector_store, INDEX_SYNCED
+    if VECTOR_BACKEND == "chroma" and not PERSIST_DIRECTORY:
+        # An in-memory Chroma would be a separate, empty index in every worker
+        raise RuntimeError("WORKERS > 1 with VECTOR_BACKEND=chroma needs PERSIST_DIRECTORY")
+    # Workers create their own Gemini clients after the fork (see init_vector_store)
+    os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "true")
+    timed_step("vector_store", init_vector_store)
+    INDEX_SYNCED = True
+    if VECTOR_BACKEND == "numpy":
+        timed_step("lexical_index", init_lexical_index)
     else:
-        print("Creating new vector store...")
-        # Load and process CSV only when creating new vector store
-        df = pd.read_csv(CSV_PATH)
-        print(f"CSV columns: {df.columns.tolist()}")
-        print(f"CSV shape: {df.shape}")
-        print(f"First row: {df.iloc[0].to_dict()}")
-
-        # Split text into chunks
-        splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-
-        # Process all columns of the CSV
-        documents = []
-        for idx, row in df.iterrows():
-            # Convert the entire row to a string representation
-            row_dict = row.to_dict()
-            content = "\n".join([f"{k}: {v}" for k, v in row_dict.items()])
-            
-            # Use the first column as the source identifier
-            # source = str(row.iloc[0])
-            
-            # Split the content into chunks
-            chunks = splitter.split_text(content)
-            for chunk in chunks:
-                documents.append(Document(page_content=chunk))
-
-        print(f"Created {len(documents)} document chunks")
-        
-        # Generate unique IDs for documents
-        ids = [str(uuid.uuid4()) for _ in documents]
-        
-        vector_store = Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            persist_directory=PERSIST_DIRECTORY,
-            ids=ids
-        )
-        # Persist the vector store
-        return vector_store
+        close_chroma(vector_store)
+        vector_store = None
 
-# Initialize vector store
-vector_store = get_vector_store()
+# Apply pending schema migrations (see migrations.py) during warm-up;
+# SCHEMA_CHECK=true also EXPLAINs the hot queries and logs full table scans
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "false").lower() == "true"
 
-# Initialize LLM
-llm = ChatGoogleGenerativeAI(
-    model=os.getenv("LLM_MODEL", "gemini-2.0-flash"),
-    google_api_key=os.getenv("GEMINI_API_KEY"),
-    disable_streaming=True  # Changed from streaming=False
-)
+def init_schema():
+    try:
+        if MIGRATE_ON_STARTUP:
+            migrate(db_pool)
+        if SCHEMA_CHECK:
+            check_schema(db_pool)
+    except Error as e:
+        # Analytics is best-effort; the chat endpoints work without it
+        print(f"Error migrating analytics schema: {e}")
+    # The rollup tables exist once migrations have run
+    start_rollups()
+
+# Stream answer tokens over /ws as they are generated (clients can opt out per message with "stream": false)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+
+# Tag carried by the answer model's runs, so only its tokens are streamed
+# (the condense-question step keeps using the non-streaming llm)
+ANSWER_TAG = "final_answer"
+
+def init_llms():
+    global llm, answer_llm
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    llm = ChatGoogleGenerativeAI(
+        model=os.getenv("LLM_MODEL", "gemini-2.0-flash"),
+        google_api_key=os.getenv("GEMINI_API_KEY"),
+        disable_streaming=True  # Changed from streaming=False
+    )
+    answer_llm = ChatGoogleGenerativeAI(
+        model=os.getenv("LLM_MODEL", "gemini-2.0-flash"),
+        google_api_key=os.getenv("GEMINI_API_KEY")
+    ).with_config(tags=[ANSWER_TAG])
 
 # Define system prompt
 SYSTEM_PROMPT = PromptTemplate(
@@ -137,8 +273,194 @@ Question: {question}
 Answer:"""
 )
 
-# Store chat histories for different sessions
-chat_histories = {}
+# Bounded pool for blocking DB work issued from async handlers, so a slow
+# MySQL round trip never stalls the event loop
+DB_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_EXECUTOR_THREADS", "8")),
+    thread_name_prefix="db"
+)
+
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, partial(func, *args, **kwargs))
+
+# Number of chunks retrieved per question
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "5"))
+
+# "condense" rewrites follow-ups with an extra LLM call before retrieval;
+# "single" answers with one call (see chains.ANSWER_MODES)
+ANSWER_MODE = os.getenv("ANSWER_MODE", "condense")
+if ANSWER_MODE not in ANSWER_MODES:
+    raise ValueError(f"ANSWER_MODE must be one of {ANSWER_MODES}, got {ANSWER_MODE!r}")
+
+def resolve_answer_mode(requested: Optional[str]) -> str:
+    return requested if requested in ANSWER_MODES else ANSWER_MODE
+
+def resolve_filter(requested) -> Optional[Dict[str, Any]]:
+    """Metadata filter from a request, limited to FILTERABLE_METADATA string fields"""
+    if not isinstance(requested, dict):
+        return None
+    conditions = [
+        {key: value} for key, value in requested.items()
+        if key in FILTERABLE_METADATA and isinstance(value, str) and value
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+# "hybrid" fuses a local BM25 index with Chroma (and skips embedding on confident
+# exact matches); "vector" uses Chroma only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_LEXICAL_MARGIN = float(os.getenv("HYBRID_LEXICAL_MARGIN", "1.5"))
+retrieval_stats = RetrievalStats()
+
+def init_lexical_index():
+    global lexical_index
+    # Already set when inherited from the pre-fork parent
+    if RETRIEVAL_MODE == "hybrid" and lexical_index is None:
+        lexical_index = BM25Index.from_vector_store(vector_store)
+
+# Merge/dedupe retrieved chunks and cap the context at this many (estimated)
+# tokens before it reaches SYSTEM_PROMPT; 0 disables the budget
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+context_budgeter = ContextBudgeter(max_tokens=CONTEXT_TOKEN_BUDGET)
+
+def make_retriever(k: int, retrieval_filter=None):
+    if lexical_index is None:
+        search_kwargs = {"k": k}
+        if retrieval_filter:
+            search_kwargs["filter"] = retrieval_filter
+        retriever = vector_store.as_retriever(search_kwargs=search_kwargs)
+    else:
+        retriever = HybridRetriever(
+            vector_store=vector_store,
+            lexical_index=lexical_index,
+            k=k,
+            filter=retrieval_filter,
+            lexical_margin=HYBRID_LEXICAL_MARGIN,
+            stats=retrieval_stats
+        )
+    if CONTEXT_TOKEN_BUDGET > 0:
+        retriever = BudgetedRetriever(retriever=retriever, budgeter=context_budgeter)
+    return retriever
+
+def init_chains():
+    """Retrievers and chains are built once per config and shared across requests"""
+    global chain_factory
+    chain_factory = ChainFactory(vector_store, llm, SYSTEM_PROMPT, answer_llm=answer_llm,
+                                 retriever_fn=make_retriever)
+    chain_factory.get(k=RETRIEVER_K, mode=ANSWER_MODE)
+    chain_factory.get(k=RETRIEVER_K, streaming=True, mode=ANSWER_MODE)
+
+# Semantic answer cache for standalone questions ("OPD timings", "emergency number", ...)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+
+def index_version():
+    """Changes whenever the vector index on disk is rebuilt or modified"""
+    if VECTOR_BACKEND == "numpy":
+        path = os.path.join(NUMPY_INDEX_DIRECTORY, "vectors.npy")
+    else:
+        path = os.path.join(PERSIST_DIRECTORY, "chroma.sqlite3")
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+    version_fn=index_version
+)
+
+async def lookup_cached_answer(question: str, chat_history, retrieval_filter=None):
+    """Return (cacheable, query_vector, cached_answer).
+
+    The cache only applies to unfiltered questions that stand on their own,
+    i.e. there is no history or rewrite_query() does not treat it as a
+    follow-up; otherwise (False, None, None) is returned and nothing should
+    be stored.
+
+    Questions the hybrid retriever will answer from BM25 alone are not
+    embedded here either, or its lexical fast path would save nothing: they
+    are matched on their exact text and query_vector is None.
+    """
+    if (not SEMANTIC_CACHE_ENABLED or retrieval_filter
+            or rewrite_query(question, chat_history) != question):
+        return False, None, None
+    if lexical_index is not None and lexical_search(
+            lexical_index, question, RETRIEVER_K, lexical_margin=HYBRID_LEXICAL_MARGIN)[1]:
+        return True, None, answer_cache.lookup_question(question)
+    vector = await embeddings.aembed_query(question)
+    return True, vector, answer_cache.lookup(vector)
+
+async def stream_answer(qa, inputs: dict, send_partial):
+    """Run the chain, passing the answer text accumulated so far to send_partial on every token.
+
+    Returns (answer, first_token_time); first_token_time is None if nothing was streamed.
+    """
+    answer = ""
+    first_token_time = None
+    root_run_id = None
+    result = None
+    async for event in qa.astream_events(inputs, version="v2"):
+        if root_run_id is None:
+            root_run_id = event["run_id"]
+        kind = event["event"]
+        if kind == "on_chat_model_stream" and ANSWER_TAG in event.get("tags", []):
+            token = event["data"]["chunk"].content
+            if isinstance(token, str) and token:
+                if first_token_time is None:
+                    first_token_time = datetime.now()
+                answer += token
+                await send_partial(answer)
+        elif kind == "on_chain_end" and event["run_id"] == root_run_id:
+            result = event["data"].get("output")
+    if isinstance(result, dict) and result.get("answer"):
+        answer = result["answer"]
+    return answer, first_token_time
+
+# Chat histories per session, bounded in sessions, idle time, turns and bytes.
+# "memory" keeps them in this process; "sqlite" shares them between the
+# workers of a pre-fork deployment (the default when WORKERS > 1)
+CHAT_HISTORY_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", "sqlite" if WORKERS > 1 else "memory")
+CHAT_HISTORY_LIMITS = dict(
+    max_sessions=int(os.getenv("CHAT_HISTORY_MAX_SESSIONS", "10000")),
+    ttl=float(os.getenv("CHAT_HISTORY_TTL", "1800")),
+    max_turns=int(os.getenv("CHAT_HISTORY_MAX_TURNS", "10")),
+    max_bytes=int(os.getenv("CHAT_HISTORY_MAX_BYTES", "32768"))
+)
+if CHAT_HISTORY_BACKEND == "sqlite":
+    chat_histories = SQLiteChatHistoryStore(
+        os.getenv("CHAT_HISTORY_PATH", "chat_history.sqlite3"), **CHAT_HISTORY_LIMITS
+    )
+elif CHAT_HISTORY_BACKEND == "memory":
+    chat_histories = ChatHistoryStore(**CHAT_HISTORY_LIMITS)
+else:
+    raise ValueError(f"CHAT_HISTORY_BACKEND must be 'memory' or 'sqlite', got {CHAT_HISTORY_BACKEND!r}")
+
+# Signs the history tokens /ws hands out. Set it to keep tokens valid across
+# restarts; the generated default is created before the pre-fork and so is
+# shared by all workers
+SESSION_SECRET = os.getenv("SESSION_SECRET") or secrets.token_hex(32)
+
+def sign_history_id(history_id: str) -> str:
+    digest = hmac.new(SESSION_SECRET.encode(), history_id.encode(), hashlib.sha256).hexdigest()
+    return f"{history_id}.{digest}"
+
+def verify_history_token(token: Optional[str]) -> Optional[str]:
+    """The history id of a token from sign_history_id, or None if it was not issued by this server"""
+    history_id = (token or "").rpartition(".")[0]
+    if history_id and hmac.compare_digest(sign_history_id(history_id), token):
+        return history_id
+    return None
+
+async def run_history(method, *args):
+    """Call a chat_histories method; the SQLite store does file I/O, so it runs on DB_EXECUTOR"""
+    if CHAT_HISTORY_BACKEND == "memory":
+        return method(*args)
+    return await run_db(method, *args)
 
 # Add analytics storage
 user_analytics = defaultdict(lambda: {
@@ -153,40 +475,43 @@ user_analytics = defaultdict(lambda: {
 class QueryRequest(BaseModel):
     question: str
     session_id: str = None
+    answer_mode: Optional[str] = None
+    # Restrict retrieval by chunk metadata, e.g. {"page": "cardiology"}
+    filter: Optional[Dict[str, str]] = None
+
+def require_ready():
+    if not STARTUP["ready"]:
+        raise HTTPException(status_code=503, detail="Service is starting up")
 
 @app.post("/query")
 async def query_qa(req: QueryRequest):
-    # Build retriever
-    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-    
+    require_ready()
     # Use session_id to maintain separate chat histories
     session_id = req.session_id or "default"
+    chat_history = await run_history(chat_histories.get, session_id)
     
-    if session_id not in chat_histories:
-        chat_histories[session_id] = []
-    
-    # Use ConversationalRetrievalChain instead of RetrievalQA
-    qa = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
-        # return_source_documents=True,
-        combine_docs_chain_kwargs={"prompt": SYSTEM_PROMPT}
-    )
+    # Shared retrieval chain, built once at startup
+    mode = resolve_answer_mode(req.answer_mode)
+    retrieval_filter = resolve_filter(req.filter)
+    qa = chain_factory.get(k=RETRIEVER_K, mode=mode, filter=retrieval_filter)
+    print(f"Answering /query for session {session_id} in '{mode}' mode")
     
     try:
-        # Get answer using chat history
-        result = qa({
-            "question": req.question,
-            "chat_history": chat_histories[session_id]
-        })
-        answer = result["answer"]
-        
-        # Update chat history with the new Q&A pair
-        chat_histories[session_id].append((req.question, answer))
+        cacheable, cache_vector, answer = await lookup_cached_answer(
+            req.question, chat_history, retrieval_filter
+        )
+        if answer is None:
+            # Get answer using chat history
+            result = await qa.ainvoke({
+                "question": req.question,
+                "chat_history": chat_history
+            })
+            answer = result["answer"]
+            if cacheable:
+                answer_cache.store(cache_vector, req.question, answer)
         
-        # Limit chat history length to prevent context overflow
-        if len(chat_histories[session_id]) > 10:
-            chat_histories[session_id] = chat_histories[session_id][-10:]
+        # Update chat history with the new Q&A pair (the store keeps the last CHAT_HISTORY_MAX_TURNS)
+        await run_history(chat_histories.append, session_id, req.question, answer)
         
         # Get source documents
         # source_docs = result.get("source_documents", [])
@@ -201,6 +526,10 @@ app.include_router(analytics_router)
 
 @app.websocket("/ws")
 async def websocket_endpoint_ws(websocket: WebSocket):
+    if not STARTUP["ready"]:
+        # 1013 = try again later
+        await websocket.close(code=1013)
+        return
     try:
         print("New WebSocket connection attempt...")
         await websocket.accept()
@@ -210,7 +539,13 @@ async def websocket_endpoint_ws(websocket: WebSocket):
         session_id = generate_short_id()
         user_id = generate_user_id()  # Generate a meaningful user ID
         session_start_time = datetime.now()
-        chat_histories[session_id] = []
+        # Chat history is keyed on a server-issued id. The client gets it as a
+        # signed token and passes it back (?session_token=) when it reconnects,
+        # to any worker, to continue the conversation; ids it made up itself
+        # are never trusted. The analytics session stays per connection
+        history_id = verify_history_token(websocket.query_params.get("session_token")) or session_id
+        answered = 0
+        await websocket.send_json({"type": "session", "session_token": sign_history_id(history_id)})
         print(f"Created new session: {session_id} for user: {user_id}")
         
         # Get client info
@@ -218,7 +553,8 @@ async def websocket_endpoint_ws(websocket: WebSocket):
         page_url = "unknown"  # Default value
         
         # Record session start
-        record_user_event(
+        await run_db(
+            record_user_event,
             user_id=user_id,
             session_id=session_id,
             event_type="session_start",
@@ -244,14 +580,14 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                 if "page_url" in message:
                     page_url = message["page_url"]
                     # Update session with page URL
-                    execute_query(
+                    await run_db(
+                        execute_write,
                         """
                         UPDATE sessions 
                         SET page_url = %s 
                         WHERE session_id = %s
                         """,
-                        (page_url, session_id),
-                        fetch=False
+                        (page_url, session_id)
                     )
                 
                 # Extract user_id from message if provided
@@ -259,7 +595,8 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                     new_user_id = message["user_id"]
                     
                     # First ensure the user exists by recording the identification event
-                    record_user_event(
+                    await run_db(
+                        record_user_event,
                         new_user_id,
                         session_id,
                         "user_identified",
@@ -270,14 +607,14 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                     )
                     
                     # Now that we know the user exists, update the session
-                    execute_query(
+                    await run_db(
+                        execute_write,
                         """
                         UPDATE sessions 
                         SET user_id = %s 
                         WHERE session_id = %s
                         """,
-                        (new_user_id, session_id),
-                        fetch=False
+                        (new_user_id, session_id)
                     )
                     
                     user_id = new_user_id
@@ -288,14 +625,15 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                     print(f"Processing user input: {message['user_input'][:50]}...")
                     
                     # Record the user's question
-                    record_user_event(
+                    await run_db(
+                        record_user_event,
                         user_id,
                         session_id,
                         "question_asked",
                         {
                             "question": message["user_input"],
                             "timestamp": message_start_time.isoformat(),
-                            "chat_history_length": len(chat_histories[session_id])
+                            "chat_history_length": len(await run_history(chat_histories.get, history_id))
                         }
                     )
                     
@@ -303,30 +641,49 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                     chat_history = message.get("chat_history", [])
                     if chat_history:
                         formatted_history = [(msg["content"], "") for msg in chat_history if msg["role"] == "user"]
-                        chat_histories[session_id] = formatted_history
+                        await run_history(chat_histories.replace, history_id, formatted_history)
+                    chat_history = await run_history(chat_histories.get, history_id)
                     
-                    # Build retriever
-                    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-                    
-                    # Use ConversationalRetrievalChain
-                    qa = ConversationalRetrievalChain.from_llm(
-                        llm=llm,
-                        retriever=retriever,
-                        # return_source_documents=True,
-                        combine_docs_chain_kwargs={"prompt": SYSTEM_PROMPT}
-                    )
+                    stream = message.get("stream", STREAM_RESPONSES)
+                    mode = resolve_answer_mode(message.get("answer_mode"))
+                    retrieval_filter = resolve_filter(message.get("filter"))
+                    qa = chain_factory.get(k=RETRIEVER_K, streaming=stream, mode=mode, filter=retrieval_filter)
+                    print(f"Answering session {session_id} in '{mode}' mode (streaming={stream})")
+                    inputs = {
+                        "question": message["user_input"],
+                        "chat_history": chat_history
+                    }
                     
                     try:
-                        # Get answer using chat history
-                        result = qa({
-                            "question": message["user_input"],
-                            "chat_history": chat_histories[session_id]
-                        })
-                        answer = result["answer"]
+                        cacheable, cache_vector, answer = await lookup_cached_answer(
+                            message["user_input"], chat_history, retrieval_filter
+                        )
+                        cache_hit = answer is not None
+                        first_token_time = None
+                        if cache_hit:
+                            print(f"Semantic cache hit for session {session_id}")
+                        elif stream:
+                            # Forward partial answers; the client replaces the incomplete
+                            # assistant message with each frame's text
+                            async def send_partial(text):
+                                await websocket.send_json({"text": text, "done": False})
+
+                            answer, first_token_time = await stream_answer(qa, inputs, send_partial)
+                        else:
+                            # Get answer using chat history
+                            result = await qa.ainvoke(inputs)
+                            answer = result["answer"]
+                        if cacheable and not cache_hit:
+                            answer_cache.store(cache_vector, message["user_input"], answer)
                         response_time = (datetime.now() - message_start_time).total_seconds()
+                        time_to_first_token = (
+                            (first_token_time - message_start_time).total_seconds()
+                            if first_token_time else response_time
+                        )
                         
                         # Record the bot's response
-                        record_user_event(
+                        await run_db(
+                            record_user_event,
                             user_id,
                             session_id,
                             "bot_response",
@@ -334,29 +691,29 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                                 "response": answer,
                                 "timestamp": datetime.now().isoformat(),
                                 # "sources": [doc.metadata["source"] for doc in result.get("source_documents", [])],
-                                "response_time": response_time
+                                "response_time": response_time,
+                                "time_to_first_token": time_to_first_token,
+                                "answer_mode": mode,
+                                "cache_hit": cache_hit
                             }
                         )
                         
                         # Update chat history
-                        chat_histories[session_id].append((message["user_input"], answer))
+                        await run_history(chat_histories.append, history_id, message["user_input"], answer)
+                        answered += 1
                         
                         # Update message count in sessions table (count each interaction as 1)
-                        execute_query(
+                        await run_db(
+                            execute_write,
                             """
                             UPDATE sessions 
                             SET message_count = message_count + 1,
                                 last_message_time = %s
                             WHERE session_id = %s
                             """,
-                            (datetime.now().isoformat(), session_id),
-                            fetch=False
+                            (datetime.now().isoformat(), session_id)
                         )
                         
-                        # Limit chat history length
-                        if len(chat_histories[session_id]) > 10:
-                            chat_histories[session_id] = chat_histories[session_id][-10:]
-                        
                         # Get source documents
                         # source_docs = result.get("source_documents", [])
                         # sources = [doc.metadata["source"] for doc in source_docs]
@@ -375,7 +732,8 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                         print(error_msg)
                         
                         # Record error event
-                        record_user_event(
+                        await run_db(
+                            record_user_event,
                             user_id,
                             session_id,
                             "error",
@@ -396,7 +754,8 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                 session_duration = (session_end_time - session_start_time).total_seconds()
                 
                 # Update session with end time and duration
-                execute_query(
+                await run_db(
+                    execute_write,
                     """
                     UPDATE sessions 
                     SET end_time = %s,
@@ -404,17 +763,19 @@ async def websocket_endpoint_ws(websocket: WebSocket):
                         status = 'completed'
                     WHERE session_id = %s
                     """,
-                    (session_end_time.isoformat(), session_duration, session_id),
-                    fetch=False
+                    (session_end_time.isoformat(), session_duration, session_id)
                 )
+                # The session's start hour may already be rolled up without its duration
+                await run_db(execute_write, MARK_SESSION_DIRTY, (session_id,))
                 
-                record_user_event(
+                await run_db(
+                    record_user_event,
                     user_id,
                     session_id,
                     "session_end",
                     {
                         "timestamp": session_end_time.isoformat(),
-                        "total_messages": len(chat_histories[session_id]),
+                        "total_messages": answered,
                         "duration": session_duration
                     }
                 )
@@ -422,7 +783,8 @@ async def websocket_endpoint_ws(websocket: WebSocket):
             except Exception as e:
                 print(f"Error in WebSocket loop: {str(e)}")
                 if user_id:
-                    record_user_event(
+                    await run_db(
+                        record_user_event,
                         user_id,
                         session_id,
                         "error",
@@ -440,9 +802,8 @@ async def websocket_endpoint_ws(websocket: WebSocket):
     except Exception as e:
         print(f"Fatal WebSocket error: {str(e)}")
     finally:
+        # The history is left for a reconnect with the token; the TTL expires it
         print(f"Cleaning up session {session_id}")
-        if session_id in chat_histories:
-            del chat_histories[session_id]
         try:
             await websocket.close()
         except:
@@ -453,11 +814,56 @@ async def websocket_endpoint_ws(websocket: WebSocket):
 async def websocket_endpoint_chat(websocket: WebSocket):
     await websocket_endpoint_ws(websocket)
 
-# Add a root endpoint for testing
+@app.post("/index/sync")
+async def sync_index():
+    """Re-read the CSV and embed only new or changed chunks"""
+    require_ready()
+    if WORKERS > 1:
+        # Only this worker would see the new index; the others would keep
+        # serving the old one and their cached answers
+        raise HTTPException(
+            status_code=409,
+            detail="Index sync is not available with WORKERS > 1; restart the server to re-sync"
+        )
+    loop = asyncio.get_running_loop()
+    report = await loop.run_in_executor(None, lambda: sync_vector_store(vector_store, load_documents(CSV_PATH)))
+    if report["added"] or report["removed"]:
+        answer_cache.clear()
+        if lexical_index is not None:
+            lexical_index.rebuild(documents_from_store(vector_store))
+    return report
+
+@app.get("/retrieval/stats")
+async def retrieval_stats_endpoint():
+    return {
+        "mode": RETRIEVAL_MODE,
+        "vector_backend": VECTOR_BACKEND,
+        "lexical_chunks": len(lexical_index) if lexical_index is not None else 0,
+        **retrieval_stats.as_dict(),
+        "context_budget": context_budgeter.stats()
+    }
+
+@app.get("/cache/stats")
+async def semantic_cache_stats():
+    return {
+        "answers": answer_cache.stats(),
+        "embeddings": embeddings.stats() if embeddings is not None else None
+    }
+
+@app.get("/chat_history/stats")
+async def chat_history_stats():
+    return await run_history(chat_histories.stats)
+
+# Add a root endpoint for testing (liveness: answers as soon as the port is bound)
 @app.get("/")
 async def root():
     return {"message": "API is running"}
 
+# Readiness: 200 once warm-up has finished, 503 while starting or after a failed start
+@app.get("/ready")
+async def ready():
+    return JSONResponse(status_code=200 if STARTUP["ready"] else 503, content=STARTUP)
+
 class Person:
     def __init__(self, name, age):
         self.name = name
@@ -466,49 +872,18 @@ class Person:
     def greet(self):
         print("Hello my name is {self,name} and age is ")
 
-# Update the sessions table schema
-def update_sessions_table():
-    try:
-        # Check if columns exist first
-        columns = execute_query("""
-            SELECT COLUMN_NAME 
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = 'sessions' 
-            AND TABLE_SCHEMA = DATABASE()
-        """)
-        existing_columns = [col['COLUMN_NAME'] for col in columns]
-
-        # Add columns if they don't exist
-        if 'message_count' not in existing_columns:
-            execute_query("""
-                ALTER TABLE sessions
-                ADD COLUMN message_count INT DEFAULT 0
-            """, fetch=False)
-
-        if 'last_message_time' not in existing_columns:
-            execute_query("""
-                ALTER TABLE sessions
-                ADD COLUMN last_message_time DATETIME
-            """, fetch=False)
-
-        if 'status' not in existing_columns:
-            execute_query("""
-                ALTER TABLE sessions
-                ADD COLUMN status ENUM('active', 'completed', 'error') DEFAULT 'active'
-            """, fetch=False)
-
-        print("Sessions table schema updated successfully")
-    except Error as e:
-        print(f"Error updating sessions table: {e}")
-        # Don't raise HTTPException here as this is a startup function
-
-# Call this when the app starts
-update_sessions_table()
+STARTUP["import_seconds"] = round(time.perf_counter() - _IMPORT_START, 3)
+print(f"app imported in {STARTUP['import_seconds']:.3f}s")
 
 if __name__ == "__main__":
-    import uvicorn
-    print("Starting server on http://0.0.0.0:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WORKERS > 1:
+        from prefork import serve_prefork
+        print(f"Starting {WORKERS} workers on http://0.0.0.0:8000")
+        serve_prefork(app, "0.0.0.0", 8000, WORKERS, preload=preload_index)
+    else:
+        import uvicorn
+        print("Starting server on http://0.0.0.0:8000")
+        uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
 
@@ -0,0 +1,141 @@
+"""GET /analytics: the old per-user/per-session queries vs. load_session_histories.
+
+Creates a scratch database next to the configured one, applies the
+migrations, seeds users/sessions/messages, checks both versions return the
+same JSON and times them. The scratch database is dropped afterwards.
+
+    python benchmarks/analytics_bench.py [users] [sessions_per_user] [messages_per_session]
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+import analytics
+from db_pool import ConnectionPool
+from migrations import migrate
+
+BENCH_DATABASE = analytics.MYSQL_CONFIG["database"] + "_bench"
+
+
+def seed(pool, users: int, sessions_per_user: int, messages_per_session: int):
+    start = datetime(2024, 1, 1)
+    user_rows, session_rows, message_rows = [], [], []
+    for u in range(users):
+        user_id = f"user_bench_{u:05d}"
+        user_rows.append((user_id, start, start, sessions_per_user, messages_per_session * sessions_per_user))
+        for s in range(sessions_per_user):
+            session_id = uuid.uuid4().hex[:8]
+            session_start = start + timedelta(minutes=u * sessions_per_user + s)
+            session_rows.append((session_id, user_id, session_start, session_start + timedelta(minutes=5), 300.0))
+            for m in range(messages_per_session):
+                # Keyed on the session id, which is what the analytics events read
+                message_rows.append((str(uuid.uuid4()), session_id, user_id, "user" if m % 2 == 0 else "bot",
+                                     json.dumps({"n": m}), session_start + timedelta(seconds=m)))
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.executemany(
+            """INSERT INTO users (user_id, first_seen_at, last_active_at, total_sessions, total_messages)
+               VALUES (%s, %s, %s, %s, %s)""", user_rows)
+        cursor.executemany(
+            """INSERT INTO sessions (session_id, user_id, start_time, end_time, duration)
+               VALUES (%s, %s, %s, %s, %s)""", session_rows)
+        for i in range(0, len(message_rows), 5000):
+            cursor.executemany(
+                """INSERT INTO messages (message_id, conversation_id, user_id, message_type, content, timestamp)
+                   VALUES (%s, %s, %s, %s, %s, %s)""", message_rows[i:i + 5000])
+        connection.commit()
+        cursor.close()
+    return len(user_rows), len(session_rows), len(message_rows)
+
+
+def legacy_get_analytics():
+    """The pre-rewrite endpoint body: one query per user and one per session"""
+    execute_query = analytics.execute_query
+    total_users = execute_query("SELECT COUNT(*) as count FROM users")[0]['count']
+    total_sessions = execute_query("SELECT SUM(total_sessions) as count FROM users")[0]['count'] or 0
+    total_questions = execute_query("SELECT SUM(total_messages) as count FROM users")[0]['count'] or 0
+    total_opens = execute_query("SELECT COUNT(*) as count FROM users WHERE total_sessions > 0")[0]['count'] or 0
+    users = execute_query("""
+        SELECT u.*, COUNT(DISTINCT s.session_id) as session_count, AVG(s.duration) as avg_session_duration
+        FROM users u LEFT JOIN sessions s ON u.user_id = s.user_id
+        GROUP BY u.user_id ORDER BY u.user_id
+    """)
+    users_data = {}
+    for user in users:
+        sessions = execute_query("""
+            SELECT s.*, COUNT(m.message_id) as message_count
+            FROM sessions s LEFT JOIN messages m ON s.session_id = m.conversation_id
+            WHERE s.user_id = %s GROUP BY s.session_id ORDER BY s.start_time DESC
+        """, (user['user_id'],))
+        sessions_data = []
+        for session in sessions:
+            events = execute_query("""
+                SELECT message_type as type, timestamp, content as data
+                FROM messages WHERE conversation_id = %s ORDER BY timestamp
+            """, (session['session_id'],))
+            sessions_data.append({
+                "session_id": session['session_id'],
+                "start_time": session['start_time'],
+                "end_time": session['end_time'],
+                "duration": session['duration'],
+                "message_count": session['message_count'],
+                "events": [{"type": e['type'], "timestamp": e['timestamp'],
+                            "data": analytics._event_payload(e['data'])} for e in events]
+            })
+        users_data[user['user_id']] = {
+            "sessions": user['total_sessions'],
+            "total_messages": user['total_messages'],
+            "total_duration": user['total_duration'],
+            "last_active": user['last_active_at'],
+            "created_at": user['first_seen_at'],
+            "is_active": user['is_active'],
+            "session_history": sessions_data
+        }
+    return {"total_users": total_users, "total_sessions": total_sessions, "total_questions": total_questions,
+            "total_chatbot_opens": total_opens, "users": users_data}
+
+
+def timed(fn, repeat: int = 3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(users: int = 200, sessions_per_user: int = 5, messages_per_session: int = 10):
+    admin = mysql.connector.connect(**{k: v for k, v in analytics.MYSQL_CONFIG.items() if k != "database"})
+    admin.cursor().execute(f"DROP DATABASE IF EXISTS {BENCH_DATABASE}")
+    admin.cursor().execute(f"CREATE DATABASE {BENCH_DATABASE}")
+    pool = ConnectionPool({**analytics.MYSQL_CONFIG, "database": BENCH_DATABASE})
+    # execute_query and pooled_cursor read the module-level pool
+    analytics.db_pool = pool
+    try:
+        migrate(pool)
+        counts = seed(pool, users, sessions_per_user, messages_per_session)
+        print("seeded users=%d sessions=%d messages=%d" % counts)
+
+        legacy_seconds, legacy = timed(legacy_get_analytics)
+        # Undecorated handler, so the response cache does not serve the repeats
+        new_seconds, new = timed(analytics.get_analytics.__wrapped__)
+        same = json.dumps(legacy, default=str, sort_keys=True) == json.dumps(new, default=str, sort_keys=True)
+
+        print(f"per-user/per-session queries: {legacy_seconds * 1000:9.1f} ms "
+              f"({5 + users + users * sessions_per_user} queries)")
+        print(f"set-based queries:            {new_seconds * 1000:9.1f} ms (4 queries)")
+        print(f"speedup:                      {legacy_seconds / new_seconds:9.1f}x")
+        print(f"identical JSON:               {same}")
+    finally:
+        pool.dispose()
+        admin.cursor().execute(f"DROP DATABASE IF EXISTS {BENCH_DATABASE}")
+        admin.close()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:4]])
@@ -0,0 +1,57 @@
+"""Per-request overhead of building the retrieval chain vs. reusing it from ChainFactory.
+
+Uses a fake chat model and an in-memory vector store so only chain
+construction is measured (no network calls).
+
+    python benchmarks/chain_factory_bench.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.chains import ConversationalRetrievalChain
+from langchain.prompts import PromptTemplate
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from chains import ChainFactory
+
+PROMPT = PromptTemplate(
+    input_variables=["context", "question", "chat_history"],
+    template="Context: {context}\nChat History: {chat_history}\nQuestion: {question}\n\nAnswer:"
+)
+
+
+def main(iterations: int = 2000):
+    llm = FakeListChatModel(responses=["ok"])
+    vector_store = InMemoryVectorStore(DeterministicFakeEmbedding(size=64))
+    vector_store.add_texts(["OPD timings are 9am to 5pm", "Emergency number is 108"])
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        retriever = vector_store.as_retriever(search_kwargs={"k": 5})
+        ConversationalRetrievalChain.from_llm(
+            llm=llm,
+            retriever=retriever,
+            combine_docs_chain_kwargs={"prompt": PROMPT}
+        )
+    per_build = (time.perf_counter() - start) / iterations
+
+    factory = ChainFactory(vector_store, llm, PROMPT)
+    factory.get(k=5)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        factory.get(k=5)
+    per_lookup = (time.perf_counter() - start) / iterations
+
+    print(f"iterations:            {iterations}")
+    print(f"build per request:     {per_build * 1e6:9.1f} us")
+    print(f"factory lookup:        {per_lookup * 1e6:9.1f} us")
+    print(f"saved per request:     {(per_build - per_lookup) * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,116 @@
+"""Q/A pairing in /analytics/messages: self-join + NOT EXISTS vs. the window query.
+
+Seeds a scratch database with conversations of `messages_per_conversation`
+alternating user/bot messages, doubling the table size each round, and
+times both queries. The window query's ms-per-1k-rows should stay flat
+(linear growth); the legacy query's grows with conversation length and
+table size. Both must return the same numbers.
+
+    python benchmarks/message_pairing_bench.py [start_rows] [rounds] [messages_per_conversation]
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+import analytics
+from db_pool import ConnectionPool
+from migrations import migrate
+
+BENCH_DATABASE = analytics.MYSQL_CONFIG["database"] + "_bench"
+
+LEGACY_QUERY = """
+    SELECT
+        COUNT(DISTINCT CASE
+            WHEN m1.message_type = 'user' AND m2.message_type = 'bot'
+            AND m1.conversation_id = m2.conversation_id
+            THEN m1.message_id
+        END) as total_messages,
+        COUNT(CASE WHEN m1.message_type = 'user' THEN 1 END) as user_messages,
+        COUNT(CASE WHEN m1.message_type = 'bot' THEN 1 END) as bot_messages,
+        COUNT(CASE WHEN m1.message_type = 'system' THEN 1 END) as system_messages
+    FROM messages m1
+    LEFT JOIN messages m2 ON m1.conversation_id = m2.conversation_id
+        AND m2.message_type = 'bot'
+        AND m2.timestamp > m1.timestamp
+        AND NOT EXISTS (
+            SELECT 1 FROM messages m3
+            WHERE m3.conversation_id = m1.conversation_id
+            AND m3.message_type = 'bot'
+            AND m3.timestamp > m1.timestamp
+            AND m3.timestamp < m2.timestamp
+        )
+"""
+
+COMPARED = ("total_messages", "user_messages", "bot_messages", "system_messages")
+
+
+def seed(pool, rows: int, messages_per_conversation: int):
+    start = datetime(2024, 1, 1)
+    batch = []
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        for i in range(rows):
+            conversation = i // messages_per_conversation
+            position = i % messages_per_conversation
+            # Every third conversation ends on an unanswered question
+            message_type = "user" if position % 2 == 0 else "bot"
+            if conversation % 3 == 0 and position == messages_per_conversation - 1:
+                message_type = "user"
+            batch.append((str(uuid.uuid4()), f"conv_{conversation:07d}", "user_bench", message_type, "x",
+                          start + timedelta(minutes=conversation, seconds=position)))
+            if len(batch) == 5000:
+                cursor.executemany(
+                    """INSERT INTO messages (message_id, conversation_id, user_id, message_type, content, timestamp)
+                       VALUES (%s, %s, %s, %s, %s, %s)""", batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                """INSERT INTO messages (message_id, conversation_id, user_id, message_type, content, timestamp)
+                   VALUES (%s, %s, %s, %s, %s, %s)""", batch)
+        connection.commit()
+        cursor.close()
+
+
+def timed(query: str):
+    start = time.perf_counter()
+    result = analytics.execute_query(query)[0]
+    return time.perf_counter() - start, result
+
+
+def main(start_rows: int = 5000, rounds: int = 4, messages_per_conversation: int = 10):
+    admin = mysql.connector.connect(**{k: v for k, v in analytics.MYSQL_CONFIG.items() if k != "database"})
+    admin.cursor().execute(f"DROP DATABASE IF EXISTS {BENCH_DATABASE}")
+    admin.cursor().execute(f"CREATE DATABASE {BENCH_DATABASE}")
+    pool = ConnectionPool({**analytics.MYSQL_CONFIG, "database": BENCH_DATABASE})
+    # execute_query reads the module-level pool
+    analytics.db_pool = pool
+    try:
+        migrate(pool)
+        print(f"{'rows':>9} {'legacy ms':>11} {'window ms':>11} {'window ms/1k rows':>18} {'same':>6}")
+        for round_ in range(rounds):
+            rows = start_rows * 2 ** round_
+            with pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("DELETE FROM messages")
+                connection.commit()
+                cursor.close()
+            seed(pool, rows, messages_per_conversation)
+            legacy_seconds, legacy = timed(LEGACY_QUERY)
+            window_seconds, window = timed(analytics.MESSAGE_STATS_QUERY)
+            same = all(int(legacy[key] or 0) == int(window[key] or 0) for key in COMPARED)
+            print(f"{rows:>9} {legacy_seconds * 1000:>11.1f} {window_seconds * 1000:>11.1f} "
+                  f"{window_seconds * 1e6 / rows:>18.3f} {str(same):>6}")
+    finally:
+        pool.dispose()
+        admin.cursor().execute(f"DROP DATABASE IF EXISTS {BENCH_DATABASE}")
+        admin.close()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:4]])
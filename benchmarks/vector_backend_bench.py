@@ -0,0 +1,146 @@
+"""Query latency and memory of NumpyVectorStore vs. Chroma on the same random vectors.
+
+Both stores get identical pre-computed embeddings (no network calls);
+single-query search and a batched multi-query search are timed. Each
+backend runs in a fresh subprocess so its memory numbers are not mixed with
+the other's: the tracemalloc peak (Python and NumPy allocations) and the RSS
+growth (which also covers Chroma's native HNSW index) are reported after
+loading the index and after the query batches, relative to the process with
+the test data built but no store.
+
+    python benchmarks/vector_backend_bench.py [chunks] [queries] [dimensions]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from ingestion import _add_embedded
+from numpy_store import NumpyVectorStore
+
+BACKENDS = ("numpy", "chroma")
+
+
+class LookupEmbeddings(Embeddings):
+    """Returns pre-computed vectors so only search time is measured"""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def rss_mb() -> float:
+    """Current resident set size; Linux only, like the pre-fork server"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def make_store(backend: str, embeddings: Embeddings):
+    if backend == "numpy":
+        return NumpyVectorStore(embeddings)
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=tempfile.mkdtemp(), embedding_function=embeddings,
+                  collection_metadata={"hnsw:space": "cosine"})
+
+
+def run_backend(backend: str, chunks: int, queries: int, dimensions: int) -> dict:
+    """Load and query one backend in this process; returns its timings and memory"""
+    rng = np.random.default_rng(0)
+    doc_vectors = rng.standard_normal((chunks, dimensions), dtype=np.float32)
+    query_vectors = rng.standard_normal((queries, dimensions), dtype=np.float32)
+    texts = [f"chunk {i}" for i in range(chunks)]
+    questions = [f"question {i}" for i in range(queries)]
+    embeddings = LookupEmbeddings({
+        **dict(zip(texts, doc_vectors.tolist())),
+        **dict(zip(questions, query_vectors.tolist())),
+    })
+    ids = [str(i) for i in range(chunks)]
+    documents = [Document(page_content=t, metadata={"page": f"p{i % 20}"}) for i, t in enumerate(texts)]
+
+    baseline = rss_mb()
+    tracemalloc.start()
+    store = make_store(backend, embeddings)
+    for start in range(0, chunks, 1000):
+        _add_embedded(store, ids[start:start + 1000], documents[start:start + 1000],
+                      doc_vectors[start:start + 1000].tolist())
+    result = {
+        "backend": backend,
+        "load_peak_mb": tracemalloc.get_traced_memory()[1] / 2 ** 20,
+        "load_rss_mb": rss_mb() - baseline,
+    }
+    tracemalloc.reset_peak()
+
+    result["single_us"] = timed(lambda: [store.similarity_search(q, k=10) for q in questions], 3) / queries * 1e6
+    result["filtered_us"] = timed(
+        lambda: [store.similarity_search(q, k=10, filter={"page": "p3"}) for q in questions], 3
+    ) / queries * 1e6
+    if hasattr(store, "similarity_search_batch"):
+        result["batched_us"] = timed(lambda: store.similarity_search_batch(questions, k=10), 3) / queries * 1e6
+    result["query_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    result["query_rss_mb"] = rss_mb() - baseline
+    tracemalloc.stop()
+
+    result["top1"] = [store.similarity_search(q, k=1)[0].page_content for q in questions]
+    return result
+
+
+def main(chunks: int = 2000, queries: int = 200, dimensions: int = 768):
+    print(f"chunks: {chunks}, queries: {queries}, dimensions: {dimensions}")
+    results = {}
+    for backend in BACKENDS:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--backend", backend,
+             str(chunks), str(queries), str(dimensions)],
+            capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            print(f"{backend} backend failed; skipping it\n{process.stderr.strip().splitlines()[-1:]}")
+            continue
+        results[backend] = json.loads(process.stdout.strip().splitlines()[-1])
+
+    for name, result in results.items():
+        print(f"{name:>6} single query:    {result['single_us']:9.1f} us")
+        print(f"{name:>6} filtered query:  {result['filtered_us']:9.1f} us")
+        if "batched_us" in result:
+            print(f"{name:>6} batched (per q): {result['batched_us']:9.1f} us")
+        print(f"{name:>6} after load:      {result['load_peak_mb']:9.1f} MB traced peak, "
+              f"{result['load_rss_mb']:+.1f} MB RSS")
+        print(f"{name:>6} after queries:   {result['query_peak_mb']:9.1f} MB traced peak, "
+              f"{result['query_rss_mb']:+.1f} MB RSS")
+
+    if len(results) == len(BACKENDS):
+        # Top-1 agreement: Chroma's HNSW is approximate, the numpy scan is exact
+        agree = sum(a == b for a, b in zip(results["numpy"]["top1"], results["chroma"]["top1"]))
+        print(f"top-1 agreement:       {agree}/{queries}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--backend"]:
+        args = [int(a) for a in sys.argv[3:6]]
+        print(json.dumps(run_backend(sys.argv[2], *args)))
+    else:
+        args = [int(a) for a in sys.argv[1:4]]
+        main(*args)
@@ -0,0 +1,166 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
+
+# "condense": ConversationalRetrievalChain, which asks the LLM to rewrite a
+#             follow-up into a standalone question before retrieval (two calls)
+# "single":   history goes straight into the answer prompt and retrieval uses
+#             rewrite_query() below (one call)
+ANSWER_MODES = ("condense", "single")
+
+# Words that usually mean the question leans on the previous turn
+FOLLOW_UP_WORDS = {
+    "it", "its", "they", "them", "their", "there", "that", "this", "those",
+    "these", "he", "she", "his", "her", "him", "same", "also", "more", "else",
+    "another", "other",
+}
+FOLLOW_UP_PREFIXES = ("and ", "what about", "how about", "also ", "then ", "ok ", "okay ")
+
+
+def format_chat_history(chat_history: List[Tuple[str, str]]) -> str:
+    """Render (question, answer) pairs the way ConversationalRetrievalChain does"""
+    lines = []
+    for human, ai in chat_history:
+        lines.append(f"Human: {human}")
+        if ai:
+            lines.append(f"Assistant: {ai}")
+    return "\n".join(lines)
+
+
+def rewrite_query(question: str, chat_history: List[Tuple[str, str]]) -> str:
+    """Cheap local stand-in for the condense-question LLM call.
+
+    Short questions, or ones that refer back with pronouns ("what are its
+    timings?"), are prefixed with the previous user question so retrieval
+    still finds the right hospital/department. Self-contained questions are
+    used as they are.
+    """
+    if not chat_history:
+        return question
+    lowered = question.strip().lower()
+    tokens = re.findall(r"[a-z0-9']+", lowered)
+    follow_up = (
+        len(tokens) <= 3
+        or lowered.startswith(FOLLOW_UP_PREFIXES)
+        or any(token in FOLLOW_UP_WORDS for token in tokens)
+    )
+    if not follow_up:
+        return question
+    previous = next((human for human, _ in reversed(chat_history) if human), "")
+    return f"{previous} {question}".strip()
+
+
+def _format_docs(docs) -> str:
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+class ChainFactory:
+    """Builds retrievers and ConversationalRetrievalChains once per distinct config.
+
+    Chains hold no per-request state (chat history is passed in with each
+    call), so one instance can serve concurrent requests. Building them in the
+    request path re-creates the retriever, prompt wiring and sub-chains on
+    every message; here each (k, prompt, streaming, mode, filter) combination
+    is built on first use and then reused. At most `max_chains` are kept, since
+    metadata filters can come from requests.
+
+    Every chain takes {"question", "chat_history"} and returns {"answer"}.
+    """
+
+    def __init__(self, vector_store, llm, prompt: PromptTemplate, answer_llm=None, max_chains: int = 64,
+                 retriever_fn: Callable = None):
+        self.vector_store = vector_store
+        # Optional (k, filter) -> retriever override, e.g. the hybrid BM25 retriever
+        self.retriever_fn = retriever_fn
+        self.llm = llm
+        self.prompt = prompt
+        # Model used for the final answer when streaming; the condense-question
+        # step always uses `llm`
+        self.answer_llm = answer_llm or llm
+        self.max_chains = max_chains
+        self._chains: Dict[Tuple, Runnable] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k: int = 5, prompt: PromptTemplate = None, streaming: bool = False,
+            mode: str = "condense", filter: Optional[Dict] = None) -> Runnable:
+        """`filter` is a metadata filter passed to the vector store, e.g. {"page": "cardiology"}"""
+        if mode not in ANSWER_MODES:
+            raise ValueError(f"Unknown answer mode: {mode}")
+        prompt = prompt or self.prompt
+        filter_key = json.dumps(filter, sort_keys=True) if filter else None
+        key = (k, prompt.template, tuple(prompt.input_variables), streaming, mode, filter_key)
+        # Lookups take the lock too: move_to_end/popitem reorder the OrderedDict
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is not None:
+                self._chains.move_to_end(key)
+                return chain
+            if mode == "single":
+                chain = self._build_single_call(k, prompt, streaming, filter)
+            else:
+                chain = self._build(k, prompt, streaming, filter)
+            self._chains[key] = chain
+            while len(self._chains) > self.max_chains:
+                self._chains.popitem(last=False)
+        return chain
+
+    def _retriever(self, k: int, filter: Optional[Dict]):
+        if self.retriever_fn is not None:
+            return self.retriever_fn(k, filter)
+        search_kwargs = {"k": k}
+        if filter:
+            search_kwargs["filter"] = filter
+        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
+
+    def _build(self, k: int, prompt: PromptTemplate, streaming: bool,
+               filter: Optional[Dict] = None) -> Runnable:
+        # Imported here: `langchain.chains` is slow to import and only needed
+        # once the first chain is built during warm-up
+        from langchain.chains import ConversationalRetrievalChain
+
+        retriever = self._retriever(k, filter)
+        return ConversationalRetrievalChain.from_llm(
+            llm=self.answer_llm if streaming else self.llm,
+            condense_question_llm=self.llm,
+            retriever=retriever,
+            # return_source_documents=True,
+            combine_docs_chain_kwargs={"prompt": prompt}
+        )
+
+    def _build_single_call(self, k: int, prompt: PromptTemplate, streaming: bool,
+                           filter: Optional[Dict] = None):
+        retriever = self._retriever(k, filter)
+        llm = self.answer_llm if streaming else self.llm
+        answer = (
+            RunnableLambda(lambda x: {
+                "context": x["context"],
+                "question": x["question"],
+                "chat_history": format_chat_history(x["chat_history"]),
+            })
+            | prompt
+            | llm
+            | StrOutputParser()
+        )
+        return (
+            RunnablePassthrough.assign(
+                context=RunnableLambda(lambda x: rewrite_query(x["question"], x["chat_history"]))
+                | retriever
+                | _format_docs
+            )
+            | {"answer": answer, "question": itemgetter("question")}
+        ).with_config(run_name="SingleCallRetrievalChain")
+
+    def clear(self):
+        """Drop cached chains, e.g. after the vector store has been replaced"""
+        with self._lock:
+            self._chains.clear()
+
+    def __len__(self):
+        return len(self._chains)
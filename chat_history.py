@@ -0,0 +1,352 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Iterable, List, Tuple
+
+
+def _utf8_size(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def _truncate_utf8(text: str, limit: int) -> str:
+    return text.encode("utf-8")[:max(limit, 0)].decode("utf-8", errors="ignore")
+
+
+class Turn:
+    """One (question, answer) exchange; slotted, since every live session keeps several"""
+
+    __slots__ = ("question", "answer", "size")
+
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self.answer = answer
+        self.size = _utf8_size(question) + _utf8_size(answer)
+
+
+def _fitted_turn(question: str, answer: str, max_bytes: int) -> Tuple[Turn, bool]:
+    """The turn, cut to `max_bytes` (answer first) when larger; and whether it was cut"""
+    turn = Turn(question, answer)
+    if turn.size <= max_bytes:
+        return turn, False
+    question = _truncate_utf8(question, max_bytes)
+    return Turn(question, _truncate_utf8(answer, max_bytes - _utf8_size(question))), True
+
+
+class _Session:
+    __slots__ = ("turns", "size", "last_used")
+
+    def __init__(self, max_turns: int):
+        self.turns = deque(maxlen=max_turns)
+        self.size = 0
+        self.last_used = time.monotonic()
+
+
+class ChatHistoryStore:
+    """Bounded per-session chat histories.
+
+    Sessions are kept in LRU order: at most `max_sessions` of them, each
+    dropped after `ttl` idle seconds. A session keeps its last `max_turns`
+    turns and at most `max_bytes` of UTF-8 text; older turns go first and a
+    single turn larger than the cap has its answer (then question) cut.
+    Reads return plain (question, answer) tuples, the format the chains take.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800, max_turns: int = 10,
+                 max_bytes: int = 32 * 1024):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.total_bytes = 0
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+        self.trimmed_turns = 0
+        self.truncated_turns = 0
+
+    def _expire(self, now: float):
+        # LRU order is also idle order, so expired sessions are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl:
+                break
+            self._drop(session_id)
+            self.ttl_evictions += 1
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= session.size
+
+    def _session(self, session_id: str, create: bool):
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = _Session(self.max_turns)
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+                self.lru_evictions += 1
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _add(self, session: _Session, question: str, answer: str):
+        turn, truncated = _fitted_turn(question, answer, self.max_bytes)
+        self.truncated_turns += truncated
+        if len(session.turns) == session.turns.maxlen:
+            self._pop_oldest(session)
+        session.turns.append(turn)
+        session.size += turn.size
+        self.total_bytes += turn.size
+        while session.size > self.max_bytes:
+            self._pop_oldest(session)
+
+    def _pop_oldest(self, session: _Session):
+        oldest = session.turns.popleft()
+        session.size -= oldest.size
+        self.total_bytes -= oldest.size
+        self.trimmed_turns += 1
+
+    def get(self, session_id: str) -> List[Tuple[str, str]]:
+        """The session's turns, oldest first (empty for unknown or expired sessions)"""
+        with self._lock:
+            session = self._session(session_id, create=False)
+            if session is None:
+                return []
+            return [(turn.question, turn.answer) for turn in session.turns]
+
+    def append(self, session_id: str, question: str, answer: str):
+        with self._lock:
+            self._add(self._session(session_id, create=True), question, answer)
+
+    def replace(self, session_id: str, turns: Iterable[Tuple[str, str]] = ()):
+        """Start the session over with `turns` (e.g. history sent by the client)"""
+        with self._lock:
+            self._drop(session_id)
+            session = self._session(session_id, create=True)
+            for question, answer in turns:
+                self._add(session, question, answer)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return self._session(session_id, create=False) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "turns": sum(len(session.turns) for session in self._sessions.values()),
+                "bytes": self.total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+                "max_bytes_per_session": self.max_bytes,
+                "ttl": self.ttl,
+                "lru_evictions": self.lru_evictions,
+                "ttl_evictions": self.ttl_evictions,
+                "trimmed_turns": self.trimmed_turns,
+                "truncated_turns": self.truncated_turns,
+            }
+
+
+class SQLiteChatHistoryStore:
+    """ChatHistoryStore with the same bounds, kept in a SQLite file.
+
+    Every worker process on the host opens the same file (WAL mode), so a
+    client that reconnects to a different worker with the same session id
+    keeps its history. Reads are plain SELECTs that never wait for the write
+    lock; a session's idle time counts from its last written turn. Idle and
+    over-limit sessions are swept at most every `sweep_interval` seconds.
+    All methods block on file I/O: call them off the event loop. The connection is opened lazily and again after a fork, since a
+    SQLite connection must not be shared between processes. Eviction and
+    trim counters in `stats()` are per process; sizes are for the file.
+    """
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl: float = 1800, max_turns: int = 10,
+                 max_bytes: int = 32 * 1024, sweep_interval: float = 30.0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        self._last_sweep = 0.0
+
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+        self.trimmed_turns = 0
+        self.truncated_turns = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None or self._pid != os.getpid():
+            # isolation_level=None: transactions are explicit (BEGIN IMMEDIATE)
+            self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    last_used REAL NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    next_seq INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_used ON chat_sessions (last_used)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS chat_turns (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                )
+            """)
+            self._pid = os.getpid()
+        return self._db
+
+    def _transaction(self, work):
+        """Run `work(db)` in one write transaction under the process lock"""
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(db)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                self._sweep(db)
+            return result
+
+    def _sweep(self, db: sqlite3.Connection):
+        self._last_sweep = time.monotonic()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            cutoff = time.time() - self.ttl
+            db.execute(
+                "DELETE FROM chat_turns WHERE session_id IN "
+                "(SELECT session_id FROM chat_sessions WHERE last_used < ?)", (cutoff,)
+            )
+            self.ttl_evictions += db.execute("DELETE FROM chat_sessions WHERE last_used < ?", (cutoff,)).rowcount
+            excess = db.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0] - self.max_sessions
+            if excess > 0:
+                oldest = "SELECT session_id FROM chat_sessions ORDER BY last_used LIMIT ?"
+                db.execute(f"DELETE FROM chat_turns WHERE session_id IN ({oldest})", (excess,))
+                self.lru_evictions += db.execute(
+                    f"DELETE FROM chat_sessions WHERE session_id IN ({oldest})", (excess,)
+                ).rowcount
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _drop(self, db: sqlite3.Connection, session_id: str):
+        db.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+        db.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+
+    def _add(self, db: sqlite3.Connection, session_id: str, question: str, answer: str):
+        turn, truncated = _fitted_turn(question, answer, self.max_bytes)
+        self.truncated_turns += truncated
+        db.execute(
+            "INSERT OR IGNORE INTO chat_sessions (session_id, last_used) VALUES (?, ?)", (session_id, time.time())
+        )
+        seq = db.execute("SELECT next_seq FROM chat_sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+        db.execute(
+            "INSERT INTO chat_turns (session_id, seq, question, answer, size) VALUES (?, ?, ?, ?, ?)",
+            (session_id, seq, turn.question, turn.answer, turn.size)
+        )
+        # Keep the newest turns that fit both max_turns and max_bytes
+        rows = db.execute(
+            "SELECT seq, size FROM chat_turns WHERE session_id = ? ORDER BY seq DESC", (session_id,)
+        ).fetchall()
+        kept, size = 0, 0
+        for _, turn_size in rows:
+            if kept == self.max_turns or size + turn_size > self.max_bytes:
+                break
+            kept += 1
+            size += turn_size
+        if kept < len(rows):
+            db.execute("DELETE FROM chat_turns WHERE session_id = ? AND seq < ?", (session_id, rows[kept - 1][0]))
+            self.trimmed_turns += len(rows) - kept
+        db.execute(
+            "UPDATE chat_sessions SET next_seq = ?, size = ?, last_used = ? WHERE session_id = ?",
+            (seq + 1, size, time.time(), session_id)
+        )
+
+    def get(self, session_id: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._connection().execute(
+                """
+                SELECT t.question, t.answer
+                  FROM chat_sessions s JOIN chat_turns t ON t.session_id = s.session_id
+                 WHERE s.session_id = ? AND s.last_used >= ?
+                 ORDER BY t.seq
+                """,
+                (session_id, time.time() - self.ttl)
+            ).fetchall()
+
+    def append(self, session_id: str, question: str, answer: str):
+        self._transaction(lambda db: self._add(db, session_id, question, answer))
+
+    def replace(self, session_id: str, turns: Iterable[Tuple[str, str]] = ()):
+        def work(db):
+            self._drop(db, session_id)
+            db.execute("INSERT INTO chat_sessions (session_id, last_used) VALUES (?, ?)", (session_id, time.time()))
+            for question, answer in turns:
+                self._add(db, session_id, question, answer)
+        self._transaction(work)
+
+    def discard(self, session_id: str):
+        self._transaction(lambda db: self._drop(db, session_id))
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT 1 FROM chat_sessions WHERE session_id = ? AND last_used >= ?",
+                (session_id, time.time() - self.ttl)
+            ).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self._connection()
+            sessions, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chat_sessions").fetchone()
+            turns = db.execute("SELECT COUNT(*) FROM chat_turns").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": sessions,
+            "turns": turns,
+            "bytes": size,
+            "max_sessions": self.max_sessions,
+            "max_turns": self.max_turns,
+            "max_bytes_per_session": self.max_bytes,
+            "ttl": self.ttl,
+            "lru_evictions": self.lru_evictions,
+            "ttl_evictions": self.ttl_evictions,
+            "trimmed_turns": self.trimmed_turns,
+            "truncated_turns": self.truncated_turns,
+        }
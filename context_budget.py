@@ -0,0 +1,182 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (~4 characters per token); good enough for budgeting"""
+    return math.ceil(len(text) / 4)
+
+
+def _split_prefix(text: str):
+    """Chunks start with a "[page] section" line (see ingestion.load_documents)"""
+    if text.startswith("[") and "\n" in text:
+        head, body = text.split("\n", 1)
+        return head + "\n", body
+    return "", text
+
+
+def _overlap(a: str, b: str, min_overlap: int = 20, max_overlap: int = 400) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b`"""
+    for size in range(min(len(a), len(b), max_overlap), min_overlap - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextBudgeter:
+    """Post-retrieval stage that shrinks the chunks handed to the prompt.
+
+    1. Chunks of the same page section that continue each other (the end of
+       one is the start of the next, from chunk_overlap) are merged, and the
+       shared text is kept once.
+    2. Chunks whose 5-word shingles overlap an earlier, better-ranked chunk by
+       at least `duplicate_threshold` (Jaccard) are dropped.
+    3. Chunks are kept in rank order until `max_tokens` is reached; the last
+       one is truncated to fit if at least `min_tail_tokens` remain.
+    """
+
+    def __init__(self, max_tokens: int = 1500, duplicate_threshold: float = 0.8, min_tail_tokens: int = 50):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_tail_tokens = min_tail_tokens
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def merge_adjacent(self, documents: List[Document]) -> List[Document]:
+        # Only chunks of the same section can be neighbours; positions are not
+        # stored (they go stale when rows move), so chunk_overlap is the evidence
+        by_section = defaultdict(list)
+        for rank, doc in enumerate(documents):
+            source = doc.metadata.get("source")
+            if source is not None:
+                key = (source, doc.metadata.get("page"), doc.metadata.get("section_path"))
+                by_section[key].append(rank)
+
+        # rank -> merged document, or None when absorbed into a better-ranked one
+        replacements = {}
+        bodies = [_split_prefix(doc.page_content)[1] for doc in documents]
+
+        for ranks in by_section.values():
+            seen = {}
+            for rank in ranks:
+                if bodies[rank] in seen:
+                    # Same chunk retrieved twice
+                    replacements[rank] = None
+                else:
+                    seen[bodies[rank]] = rank
+            ranks = list(seen.values())
+
+            # successor[a] = (b, shared): b's text starts with the end of a's
+            successor, has_predecessor = {}, set()
+            for a in ranks:
+                for b in ranks:
+                    if b == a or b in has_predecessor:
+                        continue
+                    shared = _overlap(bodies[a], bodies[b])
+                    if shared:
+                        successor[a] = (b, shared)
+                        has_predecessor.add(b)
+                        break
+
+            for head in ranks:
+                if head in has_predecessor or head not in successor:
+                    continue
+                run, text = [head], bodies[head]
+                while run[-1] in successor and successor[run[-1]][0] not in run:
+                    nxt, shared = successor[run[-1]]
+                    run.append(nxt)
+                    text += bodies[nxt][shared:]
+                best = min(run)
+                replacements.update({rank: None for rank in run})
+                replacements[best] = Document(
+                    page_content=_split_prefix(documents[head].page_content)[0] + text,
+                    metadata=dict(documents[best].metadata, merged_chunks=len(run)),
+                )
+
+        merged = [replacements.get(rank, doc) for rank, doc in enumerate(documents)]
+        return [doc for doc in merged if doc is not None]
+
+    def drop_duplicates(self, documents: List[Document]) -> List[Document]:
+        kept, kept_shingles = [], []
+        for doc in documents:
+            shingles = _shingles(_split_prefix(doc.page_content)[1])
+            duplicate = any(
+                len(shingles & other) / len(shingles | other) >= self.duplicate_threshold
+                for other in kept_shingles
+            )
+            if not duplicate:
+                kept.append(doc)
+                kept_shingles.append(shingles)
+        return kept
+
+    def trim(self, documents: List[Document]) -> List[Document]:
+        kept, used = [], 0
+        for doc in documents:
+            tokens = estimate_tokens(doc.page_content)
+            if used + tokens <= self.max_tokens:
+                kept.append(doc)
+                used += tokens
+                continue
+            remaining = self.max_tokens - used
+            if remaining >= self.min_tail_tokens or not kept:
+                kept.append(Document(page_content=doc.page_content[:remaining * 4], metadata=doc.metadata))
+            break
+        return kept
+
+    def apply(self, documents: List[Document]) -> List[Document]:
+        before = sum(estimate_tokens(doc.page_content) for doc in documents)
+        result = self.trim(self.drop_duplicates(self.merge_adjacent(documents)))
+        after = sum(estimate_tokens(doc.page_content) for doc in result)
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += before
+            self.tokens_out += after
+        print(f"Context budget: {len(documents)} -> {len(result)} chunks, "
+              f"{before} -> {after} tokens ({before - after} saved)")
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_tokens": self.max_tokens,
+                "requests": self.requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "avg_tokens_out": round(self.tokens_out / self.requests, 1) if self.requests else 0,
+            }
+
+
+class BudgetedRetriever(BaseRetriever):
+    """Runs another retriever and passes its documents through a ContextBudgeter"""
+
+    retriever: BaseRetriever
+    budgeter: ContextBudgeter
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.budgeter.apply(documents)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self.budgeter.apply(documents)
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class PoolTimeout(Error):
+    """Raised when no connection could be checked out within the pool timeout"""
+
+
+class ConnectionPool:
+    """Bounded MySQL connection pool with overflow, recycling and pre-ping.
+
+    `size` connections are kept idle between checkouts; up to `max_overflow`
+    extra connections may be opened under load and are closed again when
+    returned. Connections older than `recycle` seconds are replaced, and with
+    `pre_ping` an idle connection is pinged before being handed out.
+    """
+
+    def __init__(self, config: dict, size: int = 5, max_overflow: int = 10,
+                 recycle: int = 3600, pre_ping: bool = True, timeout: float = 30.0):
+        self.config = config
+        self.size = size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+
+        self._idle = deque()  # (connection, created_at)
+        self._created_at = {}
+        self._open = 0
+        self._cond = threading.Condition()
+
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, config: dict) -> "ConnectionPool":
+        return cls(
+            config,
+            size=int(os.getenv("MYSQL_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("MYSQL_POOL_MAX_OVERFLOW", "10")),
+            recycle=int(os.getenv("MYSQL_POOL_RECYCLE", "3600")),
+            pre_ping=_env_bool("MYSQL_POOL_PRE_PING", True),
+            timeout=float(os.getenv("MYSQL_POOL_TIMEOUT", "30")),
+        )
+
+    def _connect(self):
+        connection = mysql.connector.connect(**self.config)
+        self._created_at[id(connection)] = time.monotonic()
+        return connection
+
+    def _close(self, connection):
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def _is_usable(self, connection, created_at: float) -> bool:
+        if self.recycle > 0 and time.monotonic() - created_at > self.recycle:
+            with self._cond:
+                self._recycled += 1
+            return False
+        if self.pre_ping:
+            try:
+                connection.ping(reconnect=False)
+            except Error:
+                with self._cond:
+                    self._ping_failures += 1
+                return False
+        return True
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, created_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(msg=f"Connection pool exhausted after {self.timeout}s")
+                self._cond.wait(remaining)
+
+        if connection is not None and not self._is_usable(connection, created_at):
+            self._close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = self._connect()
+            except Error:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return connection
+
+    def release(self, connection, discard: bool = False):
+        # No liveness check here: acquire() pre-pings, and a ping under the
+        # lock would serialize every checkout behind a server round trip
+        with self._cond:
+            close = discard or len(self._idle) >= self.size
+            if close:
+                self._open -= 1
+            else:
+                created_at = self._created_at.get(id(connection), time.monotonic())
+                self._idle.append((connection, created_at))
+            self._cond.notify()
+        if close:
+            self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except Error:
+            # A failed statement may have left the session in a bad state
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def dispose(self):
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        # Closing talks to the server; do it after releasing the lock
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checked_out": self._open - len(self._idle),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "ping_failures": self._ping_failures,
+                "avg_wait_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so trivially different inputs share a key"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """Caching wrapper around another Embeddings object.
+
+    Vectors are cached per (model, kind, normalized text), where kind is
+    "query" or "document" since providers such as Gemini embed the two with
+    different task types. Lookups go to an in-memory LRU first and then, if
+    `path` is set, to a SQLite file that survives restarts, so repeated
+    questions and re-ingestion of unchanged chunks skip the API. Cached
+    vectors are float32 arrays, the format of the SQLite blobs (a Python
+    list of floats is about eight times larger); they become lists when
+    returned.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, max_entries: int = 10000,
+                 path: Optional[str] = None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = path
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        raw = f"{self.model_name}\x00{kind}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_many(self, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.hits += 1
+            missing = [key for key in keys if key not in found]
+            if self._db is not None and missing:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ", ".join(["?"] * len(chunk))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+        return found
+
+    def _put_many(self, items: dict):
+        arrays = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self._lock:
+            for key, vector in arrays.items():
+                self._remember(key, vector)
+            if self._db is not None and arrays:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in arrays.items()]
+                )
+                self._db.commit()
+
+    @staticmethod
+    def _as_list(vector) -> List[float]:
+        return vector.tolist() if isinstance(vector, np.ndarray) else vector
+
+    def _split(self, kind: str, texts: List[str]):
+        keys = [self._key(kind, text) for text in texts]
+        found = self._get_many(list(dict.fromkeys(keys)))
+        # Embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.misses += len(missing)
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split("document", texts)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._put_many(computed)
+            found.update(computed)
+        return [self._as_list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._split("query", [text])
+        if missing:
+            vector = self.underlying.embed_query(text)
+            self._put_many({keys[0]: vector})
+            return vector
+        return self._as_list(found[keys[0]])
+
+    async def _off_loop(self, func, *args):
+        # With a SQLite file, lookups and writes (and _lock, held around them)
+        # go to a worker thread so the event loop never waits on the disk
+        if self._db is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await self._off_loop(self._split, "document", texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await self._off_loop(self._put_many, computed)
+            found.update(computed)
+        return [self._as_list(found[key]) for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = await self._off_loop(self._split, "query", [text])
+        if missing:
+            vector = await self.underlying.aembed_query(text)
+            await self._off_loop(self._put_many, {keys[0]: vector})
+            return vector
+        return self._as_list(found[keys[0]])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_path": self.path,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+            }
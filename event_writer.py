@@ -0,0 +1,465 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict
+
+from mysql.connector import Error
+
+from db_pool import ConnectionPool, _env_bool
+from rollups import MARK_CONVERSATION_DIRTY
+
+
+# Event types whose messages belong to the session's active conversation
+CONVERSATION_EVENTS = ("question_asked", "bot_response", "session_end")
+
+_UNSET = object()
+
+
+class ActiveConversationCache:
+    """Thread-safe, size-bounded map of session_id -> active conversation_id.
+
+    Filled when a session starts and cleared when it ends, so message events
+    can skip the `SELECT conversation_id FROM conversations ...` lookup.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str):
+        with self._lock:
+            conversation_id = self._entries.get(session_id)
+            if conversation_id is not None:
+                self._entries.move_to_end(session_id)
+            return conversation_id
+
+    def set(self, session_id: str, conversation_id: str):
+        with self._lock:
+            self._entries[session_id] = conversation_id
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, session_id: str):
+        with self._lock:
+            return self._entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AnalyticsEventWriter:
+    """Write-behind queue for analytics events.
+
+    `record_user_event` calls are queued here and a background thread applies
+    them in batched transactions: one user upsert per batch, `executemany`
+    inserts for sessions/conversations/messages and one grouped counter
+    update per user. Plain statements (e.g. session UPDATEs
+    from the websocket handler) are applied after the events of their batch,
+    in the order they were queued.
+
+    A batch is flushed once `batch_size` items are waiting or `flush_interval`
+    seconds have passed. When the queue is full the `policy` decides what
+    happens: "sync" writes the item inline, "block" waits up to
+    `block_timeout` seconds for room and then writes inline, "drop" discards it.
+    """
+
+    def __init__(self, pool: ConnectionPool, fallback_event: Callable, fallback_query: Callable,
+                 max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.5,
+                 policy: str = "sync", block_timeout: float = 1.0,
+                 conversations: ActiveConversationCache = None):
+        if policy not in ("sync", "block", "drop"):
+            raise ValueError(f"Unknown analytics queue policy: {policy}")
+        self.pool = pool
+        self.fallback_event = fallback_event
+        self.fallback_query = fallback_query
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.conversations = conversations if conversations is not None else ActiveConversationCache()
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._inline = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._last_flush_ms = 0.0
+
+    @classmethod
+    def from_env(cls, pool: ConnectionPool, fallback_event: Callable, fallback_query: Callable,
+                 conversations: ActiveConversationCache = None):
+        return cls(
+            pool,
+            fallback_event,
+            fallback_query,
+            conversations=conversations,
+            max_queue=int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "200")),
+            flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "0.5")),
+            policy=os.getenv("ANALYTICS_QUEUE_POLICY", "sync"),
+            block_timeout=float(os.getenv("ANALYTICS_BLOCK_TIMEOUT", "1.0")),
+        )
+
+    @staticmethod
+    def enabled_from_env() -> bool:
+        return _env_bool("ANALYTICS_ASYNC_WRITES", True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the worker after draining everything still queued"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # Anything enqueued after the worker exited
+        self._drain()
+
+    # --- Producers ---
+
+    def submit_event(self, user_id: str, session_id: str, event_type: str, event_data: Dict = None):
+        item = ("event", {
+            "user_id": user_id,
+            "session_id": session_id,
+            "event_type": event_type,
+            "event_data": event_data or {},
+            "timestamp": datetime.now().isoformat(),
+        })
+        self._put(item)
+
+    def submit_query(self, query: str, params: tuple = None):
+        self._put(("query", (query, params)))
+
+    def _put(self, item):
+        if not self.running:
+            self._apply_inline(item)
+            return
+        try:
+            if self.policy == "block":
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.policy == "drop":
+                with self._lock:
+                    self._dropped += 1
+                return
+            self._apply_inline(item)
+            return
+        with self._lock:
+            self._enqueued += 1
+
+    def _apply_inline(self, item):
+        with self._lock:
+            self._inline += 1
+        self._replay(item)
+
+    # --- Worker ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+        self._drain()
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            if self._stop.is_set():
+                break
+        return batch
+
+    def _drain(self):
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                try:
+                    started, ended = self._apply_batch(cursor, batch)
+                    connection.commit()
+                except Error:
+                    connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+            # Only publish conversation ids once they are committed
+            for session_id in ended:
+                self.conversations.pop(session_id)
+            for session_id, conversation_id in started.items():
+                self.conversations.set(session_id, conversation_id)
+            with self._lock:
+                self._batches += 1
+                self._written += len(batch)
+        except Exception as e:
+            print(f"Error flushing analytics batch of {len(batch)}: {e}; replaying individually")
+            with self._lock:
+                self._failed_batches += 1
+            for item in batch:
+                self._replay(item)
+        self._last_flush_ms = (time.monotonic() - start) * 1000
+
+    def _replay(self, item):
+        kind, payload = item
+        try:
+            if kind == "event":
+                self.fallback_event(payload["user_id"], payload["session_id"],
+                                    payload["event_type"], payload["event_data"],
+                                    timestamp=payload.get("timestamp"))
+            else:
+                query, params = payload
+                self.fallback_query(query, params, fetch=False)
+        except Exception as e:
+            print(f"Error writing analytics {kind}: {e}")
+
+    def _apply_batch(self, cursor, batch):
+        events = [payload for kind, payload in batch if kind == "event" and payload["user_id"]]
+        queries = [payload for kind, payload in batch if kind == "query"]
+
+        started, ended = {}, []
+        if events:
+            started, ended = self._apply_events(cursor, events)
+
+        for query, params in queries:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+        return started, ended
+
+    def _apply_events(self, cursor, events):
+        # 1) Create any users that do not exist yet
+        first_seen = {}
+        for e in events:
+            first_seen.setdefault(e["user_id"], e["timestamp"])
+        cursor.executemany(
+            """
+            INSERT INTO users
+              (user_id, first_seen_at, last_active_at, total_sessions, total_messages, total_duration, total_conversations, is_active)
+            VALUES (%s, %s, %s, 0, 0, 0, 0, TRUE)
+            ON DUPLICATE KEY UPDATE user_id = user_id
+            """,
+            [(uid, ts, ts) for uid, ts in first_seen.items()]
+        )
+
+        # 2) Resolve active conversations for sessions started in earlier batches
+        conversations = {}
+        lookup = []
+        for session_id in dict.fromkeys(
+            e["session_id"] for e in events if e["event_type"] in CONVERSATION_EVENTS
+        ):
+            cached = self.conversations.get(session_id)
+            if cached:
+                conversations[session_id] = cached
+            else:
+                lookup.append(session_id)
+        if lookup:
+            placeholders = ", ".join(["%s"] * len(lookup))
+            cursor.execute(
+                f"""
+                SELECT session_id, conversation_id
+                  FROM conversations
+                 WHERE session_id IN ({placeholders})
+                   AND status = 'active'
+                 ORDER BY start_time DESC
+                """,
+                tuple(lookup)
+            )
+            for row in cursor.fetchall():
+                conversations.setdefault(row["session_id"], row["conversation_id"])
+
+        # 3) Fold events in order into row lists and per-user counter deltas
+        sessions_rows = []
+        conversation_rows = []
+        message_rows = []
+        completed_rows = []
+        duration_rows = []
+        counters = {}
+        started = {}
+        ended = []
+
+        for e in events:
+            user_id, session_id, ts = e["user_id"], e["session_id"], e["timestamp"]
+            event_type, data = e["event_type"], e["event_data"]
+            c = counters.setdefault(user_id, {
+                "sessions": 0, "messages": 0, "last_active_at": ts,
+                "is_active": None, "page_url": _UNSET, "returning": False,
+            })
+            c["last_active_at"] = max(c["last_active_at"], ts)
+
+            if event_type == "session_start":
+                page_url = data.get("page_url")
+                conversation_id = str(uuid.uuid4())
+                conversations[session_id] = conversation_id
+                started[session_id] = conversation_id
+                sessions_rows.append((session_id, user_id, ts, page_url))
+                conversation_rows.append((conversation_id, session_id, user_id, ts))
+                message_rows.append((conversation_id, user_id, "system", "session_start", ts, None, None))
+                c["sessions"] += 1
+                c["is_active"] = True
+                c["page_url"] = page_url
+
+            elif event_type == "question_asked":
+                conversation_id = conversations.get(session_id)
+                if conversation_id:
+                    message_rows.append((conversation_id, user_id, "user", data.get("question", ""), ts, None, None))
+                    c["messages"] += 1
+
+            elif event_type == "bot_response":
+                conversation_id = conversations.get(session_id)
+                if conversation_id:
+                    message_rows.append((
+                        conversation_id, user_id, "bot", data.get("response", ""), ts,
+                        data.get("response_time"), data.get("time_to_first_token"),
+                    ))
+
+            elif event_type == "session_end":
+                conversation_id = conversations.pop(session_id, None)
+                started.pop(session_id, None)
+                ended.append(session_id)
+                if conversation_id:
+                    completed_rows.append((ts, ts, conversation_id))
+                    message_rows.append((conversation_id, user_id, "system", "session_end", ts, None, None))
+                    duration_rows.append((conversation_id, user_id))
+                    c["is_active"] = False
+
+            elif event_type == "user_identified":
+                c["returning"] = True
+
+        if sessions_rows:
+            cursor.executemany(
+                """
+                INSERT INTO sessions
+                  (session_id, user_id, start_time, page_url, message_count, status)
+                VALUES (%s, %s, %s, %s, 0, 'active')
+                """,
+                sessions_rows
+            )
+        if conversation_rows:
+            cursor.executemany(
+                """
+                INSERT INTO conversations
+                  (conversation_id, session_id, user_id, start_time, status)
+                VALUES (%s, %s, %s, %s, 'active')
+                """,
+                conversation_rows
+            )
+        if message_rows:
+            cursor.executemany(
+                """
+                INSERT INTO messages
+                  (message_id, conversation_id, user_id, message_type, content, timestamp,
+                   response_time, time_to_first_token)
+                VALUES (UUID(), %s, %s, %s, %s, %s, %s, %s)
+                """,
+                message_rows
+            )
+        if completed_rows:
+            cursor.executemany(
+                """
+                UPDATE conversations
+                  SET end_time = %s,
+                      status   = 'completed',
+                      duration = TIMESTAMPDIFF(SECOND, start_time, %s)
+                 WHERE conversation_id = %s
+                """,
+                completed_rows
+            )
+            cursor.executemany(MARK_CONVERSATION_DIRTY, [(conversation_id,) for _, _, conversation_id in completed_rows])
+            cursor.executemany(
+                """
+                UPDATE users
+                  SET total_duration = total_duration + COALESCE(
+                        (SELECT duration FROM conversations WHERE conversation_id = %s), 0),
+                      total_conversations = total_conversations + 1
+                WHERE user_id = %s
+                """,
+                duration_rows
+            )
+
+        # 4) One grouped counter update per user
+        cursor.executemany(
+            """
+            UPDATE users
+              SET total_sessions = total_sessions + %s,
+                  total_messages = total_messages + %s,
+                  last_active_at = %s,
+                  is_active = COALESCE(%s, is_active),
+                  last_page_url = IF(%s, %s, last_page_url),
+                  user_type = IF(%s, 'returning', user_type)
+            WHERE user_id = %s
+            """,
+            [
+                (
+                    c["sessions"],
+                    c["messages"],
+                    c["last_active_at"],
+                    c["is_active"],
+                    c["page_url"] is not _UNSET,
+                    None if c["page_url"] is _UNSET else c["page_url"],
+                    c["returning"],
+                    user_id,
+                )
+                for user_id, c in counters.items()
+            ]
+        )
+        return started, ended
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "policy": self.policy,
+                "queued": self._queue.qsize(),
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "inline": self._inline,
+                "dropped": self._dropped,
+                "batches": self._batches,
+                "failed_batches": self._failed_batches,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+            }
+
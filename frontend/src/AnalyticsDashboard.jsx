@@ -7,10 +7,17 @@ const ENDPOINTS = {
   messages: "http://localhost:8000/analytics/messages",
   users: "http://localhost:8000/analytics/users",
   leads: "http://localhost:8000/analytics/leads",
+  live: "http://localhost:8000/analytics/live",
 };
 
 const PAGE_SIZE = 20;
 
+// Keyset pagination: the first page has no cursor, later pages pass the
+// next_cursor returned with the previous one
+const pageUrl = (endpoint, cursor) =>
+  `${endpoint}?limit=${PAGE_SIZE}` +
+  (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+
 const NAV_ITEMS = [
   { key: "home", label: "Home" },
   { key: "sessions", label: "Sessions" },
@@ -62,36 +69,40 @@ const AnalyticsDashboard = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
-  // Paginated data and offsets
+  // Paginated data; each section keeps the cursor of its next page
   const [sessions, setSessions] = useState([]);
-  const [sessionsOffset, setSessionsOffset] = useState(0);
+  const [sessionsCursor, setSessionsCursor] = useState(null);
   const [sessionsStats, setSessionsStats] = useState({});
   const [sessionsLoading, setSessionsLoading] = useState(false);
   const [sessionsHasMore, setSessionsHasMore] = useState(true);
 
   const [conversations, setConversations] = useState([]);
-  const [conversationsOffset, setConversationsOffset] = useState(0);
+  const [conversationsCursor, setConversationsCursor] = useState(null);
   const [conversationsStats, setConversationsStats] = useState({});
   const [conversationsLoading, setConversationsLoading] = useState(false);
   const [conversationsHasMore, setConversationsHasMore] = useState(true);
 
   const [messages, setMessages] = useState([]);
-  const [messagesOffset, setMessagesOffset] = useState(0);
+  const [messagesCursor, setMessagesCursor] = useState(null);
   const [messagesStats, setMessagesStats] = useState({});
   const [messagesLoading, setMessagesLoading] = useState(false);
   const [messagesHasMore, setMessagesHasMore] = useState(true);
 
   const [users, setUsers] = useState([]);
-  const [usersOffset, setUsersOffset] = useState(0);
+  const [usersCursor, setUsersCursor] = useState(null);
   const [usersStats, setUsersStats] = useState({});
   const [usersLoading, setUsersLoading] = useState(false);
   const [usersHasMore, setUsersHasMore] = useState(true);
 
   const [leads, setLeads] = useState([]);
+  const [leadsCursor, setLeadsCursor] = useState(null);
   const [leadsStats, setLeadsStats] = useState({});
   const [leadsLoading, setLeadsLoading] = useState(false);
   const [leadsHasMore, setLeadsHasMore] = useState(true);
 
+  // Counters pushed over /analytics/live
+  const [live, setLive] = useState(null);
+
   // Helper for safe access
   const safe = (obj, key, fallback = 0) =>
     obj && obj[key] != null ? obj[key] : fallback;
@@ -106,68 +117,116 @@ const AnalyticsDashboard = () => {
       .finally(() => setLoading(false));
   }, []);
 
+  // Live counters: a snapshot, then deltas applied on top of the fetched
+  // summary. EventSource reconnects by itself; deltas may have been missed
+  // while disconnected, so a later snapshot re-fetches the summary. With
+  // several server workers a stream only sees one worker's traffic
+  // (scope "worker"): its counters are shown as such and never added to
+  // the global totals.
+  useEffect(() => {
+    const source = new EventSource(ENDPOINTS.live);
+    let connected = false;
+    source.addEventListener("snapshot", (event) => {
+      const snapshot = JSON.parse(event.data);
+      if (connected) {
+        fetch(ENDPOINTS.main)
+          .then((res) => res.json())
+          .then(setSummary)
+          .catch(() => {});
+      }
+      connected = true;
+      setLive({ ...snapshot.totals, ...snapshot });
+    });
+    source.addEventListener("delta", (event) => {
+      const { deltas, active_sessions, questions_per_minute, scope } =
+        JSON.parse(event.data);
+      setLive((prev) => {
+        const next = { ...prev, active_sessions, questions_per_minute };
+        Object.entries(deltas).forEach(([key, value]) => {
+          next[key] = (next[key] || 0) + value;
+        });
+        return next;
+      });
+      if (scope !== "global") return;
+      setSummary((prev) =>
+        prev && {
+          ...prev,
+          total_sessions: (prev.total_sessions || 0) + (deltas.sessions || 0),
+          total_questions:
+            (prev.total_questions || 0) + (deltas.questions || 0),
+        }
+      );
+    });
+    return () => source.close();
+  }, []);
+
   // Section fetchers
-  const fetchSessions = (offset = 0, append = false) => {
+  const fetchSessions = (cursor = null, append = false) => {
     setSessionsLoading(true);
-    fetch(`${ENDPOINTS.sessions}?offset=${offset}&limit=${PAGE_SIZE}`)
+    fetch(pageUrl(ENDPOINTS.sessions, cursor))
       .then((res) => res.json())
       .then((data) => {
         setSessionsStats(data);
         const newData = data.recent_sessions || [];
         setSessions((prev) => (append ? [...prev, ...newData] : newData));
-        setSessionsHasMore(newData.length === PAGE_SIZE);
+        setSessionsCursor(data.next_cursor || null);
+        setSessionsHasMore(Boolean(data.next_cursor));
       })
       .catch((err) => setError(err.message))
       .finally(() => setSessionsLoading(false));
   };
-  const fetchConversations = (offset = 0, append = false) => {
+  const fetchConversations = (cursor = null, append = false) => {
     setConversationsLoading(true);
-    fetch(`${ENDPOINTS.conversations}?offset=${offset}&limit=${PAGE_SIZE}`)
+    fetch(pageUrl(ENDPOINTS.conversations, cursor))
       .then((res) => res.json())
       .then((data) => {
         setConversationsStats(data);
         const newData = data.recent_conversations || [];
         setConversations((prev) => (append ? [...prev, ...newData] : newData));
-        setConversationsHasMore(newData.length === PAGE_SIZE);
+        setConversationsCursor(data.next_cursor || null);
+        setConversationsHasMore(Boolean(data.next_cursor));
       })
       .catch((err) => setError(err.message))
       .finally(() => setConversationsLoading(false));
   };
-  const fetchMessages = (offset = 0, append = false) => {
+  const fetchMessages = (cursor = null, append = false) => {
     setMessagesLoading(true);
-    fetch(`${ENDPOINTS.messages}?offset=${offset}&limit=${PAGE_SIZE}`)
+    fetch(pageUrl(ENDPOINTS.messages, cursor))
       .then((res) => res.json())
       .then((data) => {
         setMessagesStats(data);
         const newData = data.recent_messages || [];
         setMessages((prev) => (append ? [...prev, ...newData] : newData));
-        setMessagesHasMore(newData.length === PAGE_SIZE);
+        setMessagesCursor(data.next_cursor || null);
+        setMessagesHasMore(Boolean(data.next_cursor));
       })
       .catch((err) => setError(err.message))
       .finally(() => setMessagesLoading(false));
   };
-  const fetchUsers = (offset = 0, append = false) => {
+  const fetchUsers = (cursor = null, append = false) => {
     setUsersLoading(true);
-    fetch(`${ENDPOINTS.users}?offset=${offset}&limit=${PAGE_SIZE}`)
+    fetch(pageUrl(ENDPOINTS.users, cursor))
       .then((res) => res.json())
       .then((data) => {
         setUsersStats(data);
         const newData = data.recent_users || [];
         setUsers((prev) => (append ? [...prev, ...newData] : newData));
-        setUsersHasMore(newData.length === PAGE_SIZE);
+        setUsersCursor(data.next_cursor || null);
+        setUsersHasMore(Boolean(data.next_cursor));
       })
       .catch((err) => setError(err.message))
       .finally(() => setUsersLoading(false));
   };
-  const fetchLeads = (offset = 0, append = false) => {
+  const fetchLeads = (cursor = null, append = false) => {
     setLeadsLoading(true);
-    fetch(`${ENDPOINTS.leads}?offset=${offset}&limit=${PAGE_SIZE}`)
+    fetch(pageUrl(ENDPOINTS.leads, cursor))
       .then((res) => res.json())
       .then((data) => {
         setLeadsStats(data);
         const newData = data.daily_leads || [];
         setLeads((prev) => (append ? [...prev, ...newData] : newData));
-        setLeadsHasMore(newData.length === PAGE_SIZE);
+        setLeadsCursor(data.next_cursor || null);
+        setLeadsHasMore(Boolean(data.next_cursor));
       })
       .catch((err) => setError(err.message))
       .finally(() => setLeadsLoading(false));
@@ -177,29 +236,29 @@ const AnalyticsDashboard = () => {
   useEffect(() => {
     if (selected === "sessions") {
       setSessions([]);
-      setSessionsOffset(0);
+      setSessionsCursor(null);
       setSessionsHasMore(true);
-      fetchSessions(0, false);
+      fetchSessions(null, false);
     } else if (selected === "conversations") {
       setConversations([]);
-      setConversationsOffset(0);
+      setConversationsCursor(null);
       setConversationsHasMore(true);
-      fetchConversations(0, false);
+      fetchConversations(null, false);
     } else if (selected === "messages") {
       setMessages([]);
-      setMessagesOffset(0);
+      setMessagesCursor(null);
       setMessagesHasMore(true);
-      fetchMessages(0, false);
+      fetchMessages(null, false);
     } else if (selected === "users") {
       setUsers([]);
-      setUsersOffset(0);
+      setUsersCursor(null);
       setUsersHasMore(true);
-      fetchUsers(0, false);
+      fetchUsers(null, false);
     } else if (selected === "leads") {
       setLeads([]);
-      setLeadsLoading(0);
+      setLeadsCursor(null);
       setLeadsHasMore(true);
-      fetchLeads(0, false);
+      fetchLeads(null, false);
     }
     // eslint-disable-next-line
   }, [selected]);
@@ -306,6 +365,29 @@ const AnalyticsDashboard = () => {
                 </div>
               </div>
             </div>
+            {live && (
+              <div style={{ display: "flex", gap: 32, marginBottom: 32 }}>
+                {live.scope === "worker" && (
+                  <div>
+                    <i>
+                      Live: one worker of {live.workers} (pid {live.pid})
+                    </i>
+                  </div>
+                )}
+                <div>
+                  Active Sessions: <b>{safe(live, "active_sessions")}</b>
+                </div>
+                <div>
+                  Questions / min: <b>{safe(live, "questions_per_minute")}</b>
+                </div>
+                <div>
+                  Handovers: <b>{safe(live, "handovers")}</b>
+                </div>
+                <div>
+                  Leads: <b>{safe(live, "leads")}</b>
+                </div>
+              </div>
+            )}
           </>
         )}
         {selected === "sessions" && (
@@ -347,9 +429,7 @@ const AnalyticsDashboard = () => {
                   cursor: "pointer",
                 }}
                 onClick={() => {
-                  const nextOffset = sessionsOffset + PAGE_SIZE;
-                  setSessionsOffset(nextOffset);
-                  fetchSessions(nextOffset, true);
+                  fetchSessions(sessionsCursor, true);
                 }}
                 disabled={sessionsLoading}
               >
@@ -414,9 +494,7 @@ const AnalyticsDashboard = () => {
                   cursor: "pointer",
                 }}
                 onClick={() => {
-                  const nextOffset = conversationsOffset + PAGE_SIZE;
-                  setConversationsOffset(nextOffset);
-                  fetchConversations(nextOffset, true);
+                  fetchConversations(conversationsCursor, true);
                 }}
                 disabled={conversationsLoading}
               >
@@ -470,9 +548,7 @@ const AnalyticsDashboard = () => {
                   cursor: "pointer",
                 }}
                 onClick={() => {
-                  const nextOffset = messagesOffset + PAGE_SIZE;
-                  setMessagesOffset(nextOffset);
-                  fetchMessages(nextOffset, true);
+                  fetchMessages(messagesCursor, true);
                 }}
                 disabled={messagesLoading}
               >
@@ -535,9 +611,7 @@ const AnalyticsDashboard = () => {
                   cursor: "pointer",
                 }}
                 onClick={() => {
-                  const nextOffset = usersOffset + PAGE_SIZE;
-                  setUsersOffset(nextOffset);
-                  fetchUsers(nextOffset, true);
+                  fetchUsers(usersCursor, true);
                 }}
                 disabled={usersLoading}
               >
@@ -573,8 +647,7 @@ const AnalyticsDashboard = () => {
                   cursor: "pointer",
                 }}
                 onClick={() => {
-                  const nextOffset = leads.length;
-                  fetchLeads(nextOffset, true);
+                  fetchLeads(leadsCursor, true);
                 }}
                 disabled={leadsLoading}
               >
@@ -3,6 +3,10 @@ import { useRef, useEffect, useCallback, useState } from "react";
 
 const MAX_RETRIES = 5;
 
+// Signed id of this client's chat history on the server; sent back on
+// reconnect so the conversation continues
+const HISTORY_TOKEN_KEY = "healthcare_history_token";
+
 export const useChatSocket = (setChatHistory, setStreaming, customChatUrl) => {
   const [connectionStatus, setConnectionStatus] = useState("DISCONNECTED");
   const ws = useRef(null);
@@ -45,7 +49,12 @@ export const useChatSocket = (setChatHistory, setStreaming, customChatUrl) => {
         ws.current.close();
       }
 
-      ws.current = new WebSocket(chatUrl);
+      const historyToken = localStorage.getItem(HISTORY_TOKEN_KEY);
+      ws.current = new WebSocket(
+        historyToken
+          ? `${chatUrl}${chatUrl.includes("?") ? "&" : "?"}session_token=${encodeURIComponent(historyToken)}`
+          : chatUrl
+      );
 
       ws.current.onopen = () => {
         console.log("Connected to WebSocket server");
@@ -58,6 +67,11 @@ export const useChatSocket = (setChatHistory, setStreaming, customChatUrl) => {
         try {
           const data = JSON.parse(event.data);
 
+          if (data.type === "session") {
+            localStorage.setItem(HISTORY_TOKEN_KEY, data.session_token);
+            return;
+          }
+
           if (data.error) {
             console.error("Error from server:", data.error);
             setChatHistory((prev) => [
@@ -0,0 +1,207 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "me", "my", "of", "on", "or", "please", "tell", "the", "there", "to",
+    "what", "when", "where", "which", "who", "with", "you", "your", "about", "any", "have",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/number tokens; phone numbers like +91-11-48-555-555 also yield the joined digits"""
+    text = text.lower()
+    tokens = re.findall(r"[a-z0-9]+", text)
+    for number in re.findall(r"\+?\d[\d\- ]{6,}\d", text):
+        tokens.append(re.sub(r"\D", "", number))
+    return tokens
+
+
+def matches_filter(metadata: dict, filter: Optional[Dict]) -> bool:
+    """Evaluate the equality / $and filters produced by app.resolve_filter"""
+    if not filter:
+        return True
+    if "$and" in filter:
+        return all(matches_filter(metadata, condition) for condition in filter["$and"])
+    return all(metadata.get(key) == value for key, value in filter.items())
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over the same chunks as the vector store"""
+
+    def __init__(self, documents: List[Document] = None, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._state = None
+        self.rebuild(documents or [])
+
+    @classmethod
+    def from_vector_store(cls, vector_store, **kwargs) -> "BM25Index":
+        return cls(documents_from_store(vector_store), **kwargs)
+
+    def rebuild(self, documents: List[Document]):
+        postings = defaultdict(dict)  # term -> {doc_index: term frequency}
+        lengths = []
+        for index, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term][index] = tf
+        n = len(documents)
+        idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+        avg_length = sum(lengths) / n if n else 0
+        state = (documents, dict(postings), idf, lengths, avg_length)
+        with self._lock:
+            self._state = state
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def query_terms(self, query: str) -> List[str]:
+        return list(dict.fromkeys(t for t in tokenize(query) if t not in STOPWORDS))
+
+    def search(self, query: str, k: int, filter: Optional[Dict] = None) -> List[Tuple[Document, float, float]]:
+        """Top-k (document, score, coverage); coverage is the idf-weighted share of query terms the doc contains"""
+        documents, postings, idf, lengths, avg_length = self._state
+        query_terms = self.query_terms(query)
+        terms = [t for t in query_terms if t in idf]
+        if not terms:
+            return []
+        # Terms missing from the corpus count as the rarest possible term, so
+        # they keep coverage below 1
+        missing_weight = math.log(1 + (len(documents) + 0.5) / 0.5)
+        scores = defaultdict(float)
+        matched = defaultdict(float)
+        for term in terms:
+            weight = idf[term]
+            for index, tf in postings[term].items():
+                norm = self.k1 * (1 - self.b + self.b * lengths[index] / avg_length)
+                scores[index] += weight * tf * (self.k1 + 1) / (tf + norm)
+                matched[index] += weight
+        total_weight = sum(idf.get(t, missing_weight) for t in query_terms)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for index, score in ranked:
+            doc = documents[index]
+            if not matches_filter(doc.metadata, filter):
+                continue
+            results.append((doc, score, matched[index] / total_weight))
+            if len(results) >= k:
+                break
+        return results
+
+
+def documents_from_store(vector_store) -> List[Document]:
+    data = vector_store.get(include=["documents", "metadatas"])
+    metadatas = data.get("metadatas") or [None] * len(data["documents"])
+    return [
+        Document(page_content=text, metadata=metadata or {})
+        for text, metadata in zip(data["documents"], metadatas)
+    ]
+
+
+class RetrievalStats:
+    def __init__(self):
+        self.lexical_only = 0
+        self.hybrid = 0
+        self._lock = threading.Lock()
+
+    def record(self, lexical_only: bool):
+        with self._lock:
+            if lexical_only:
+                self.lexical_only += 1
+            else:
+                self.hybrid += 1
+
+    def as_dict(self) -> dict:
+        total = self.lexical_only + self.hybrid
+        return {
+            "lexical_only": self.lexical_only,
+            "hybrid": self.hybrid,
+            "lexical_only_rate": round(self.lexical_only / total, 4) if total else 0,
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    scores = defaultdict(float)
+    by_key = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.page_content
+            by_key.setdefault(key, doc)
+            scores[key] += 1.0 / (rrf_k + rank + 1)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [by_key[key] for key in ordered[:k]]
+
+
+def lexical_search(index: BM25Index, query: str, k: int, filter: Optional[Dict] = None,
+                   lexical_margin: float = 1.5, min_coverage: float = 0.999):
+    """(BM25 documents, confident); confident means HybridRetriever answers from them alone"""
+    hits = index.search(query, k * 2, filter)
+    if not hits:
+        return [], False
+    top_score, top_coverage = hits[0][1], hits[0][2]
+    runner_up = hits[1][1] if len(hits) > 1 else 0.0
+    confident = (
+        top_coverage >= min_coverage
+        and (runner_up == 0 or top_score / runner_up >= lexical_margin)
+    )
+    return [doc for doc, _, _ in hits], confident
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + vector retrieval fused with reciprocal rank fusion.
+
+    When the best BM25 hit covers at least `min_coverage` of the query terms
+    (idf-weighted) and outscores the runner-up by `lexical_margin`, the
+    lexical results are returned directly and the query is never embedded.
+    This catches exact lookups such as doctor names, phone numbers or
+    "Sector 18 Dwarka".
+    """
+
+    vector_store: object
+    lexical_index: BM25Index
+    k: int = 5
+    filter: Optional[Dict] = None
+    rrf_k: int = 60
+    lexical_margin: float = 1.5
+    min_coverage: float = 0.999
+    stats: RetrievalStats
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _lexical(self, query: str):
+        return lexical_search(self.lexical_index, query, self.k, self.filter,
+                              self.lexical_margin, self.min_coverage)
+
+    def _search_kwargs(self):
+        return {"filter": self.filter} if self.filter else {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        lexical, confident = self._lexical(query)
+        self.stats.record(confident)
+        if confident:
+            return lexical[:self.k]
+        vector = self.vector_store.similarity_search(query, k=self.k * 2, **self._search_kwargs())
+        return reciprocal_rank_fusion([vector, lexical], self.k, self.rrf_k)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        lexical, confident = self._lexical(query)
+        self.stats.record(confident)
+        if confident:
+            return lexical[:self.k]
+        vector = await self.vector_store.asimilarity_search(query, k=self.k * 2, **self._search_kwargs())
+        return reciprocal_rank_fusion([vector, lexical], self.k, self.rrf_k)
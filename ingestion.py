@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Dict, List
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+
+
+# Chunk size for sections that are too long to embed whole
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "80"))
+
+HEADERS_TO_SPLIT_ON = [("#", "h1"), ("##", "h2"), ("###", "h3")]
+
+# Metadata keys that retrieval filters may use (see ChainFactory.get)
+FILTERABLE_METADATA = ("source", "page", "section")
+
+
+def page_name(source: str) -> str:
+    """Short page key from a source URL, e.g. ".../cardiology.php" -> "cardiology" """
+    path = urlparse(source).path.strip("/")
+    if not path:
+        return "home"
+    return os.path.splitext(path.split("/")[-1])[0] or "home"
+
+
+def normalize_markdown(text: str) -> str:
+    """Put inline headers (" ... # Services & Treatments - ...") on their own lines"""
+    return re.sub(r"\s+(#{1,6}) (?=\S)", r"\n\1 ", text.replace("\r\n", "\n")).strip()
+
+
+def section_headers(sections) -> List[List[str]]:
+    """Header path of each split section, with generic sub-headers nested.
+
+    Pages list every department as a flat "# Cardiology" followed by
+    "# Doctors", "# Services Offered", ... headers that repeat for each
+    department, so the splitter gives those sections no department. A
+    header that occurs more than once in the row is treated as generic and
+    nested under the last non-generic header before it.
+    """
+    paths = [[section.metadata[key] for _, key in HEADERS_TO_SPLIT_ON if key in section.metadata]
+             for section in sections]
+    counts = Counter(path[-1] for path in paths if path)
+    parent = None
+    nested = []
+    for path in paths:
+        if path and counts[path[-1]] > 1:
+            if parent is not None and parent not in path:
+                path = [parent] + path
+        elif path:
+            parent = path[-1]
+        nested.append(path)
+    return nested
+
+
+def load_documents(csv_path: str) -> List[Document]:
+    """Read the hospital CSV and split every row into header-aware chunks.
+
+    The first column is the source URL; the remaining columns hold the page as
+    markdown. Each row is split on its #/##/### headers, long sections are
+    split again to CHUNK_SIZE, and every chunk carries `source`, `page`,
+    `section` (the innermost header), `section_path` (with repeated
+    sub-headers nested under their department, see `section_headers`).
+    Positions are not stored: a sync keeps unchanged chunks as they are, so
+    a row or chunk number would go stale once rows move. The page and
+    section path are also prefixed to the chunk text so a chunk is
+    self-describing when it lands in the prompt.
+    """
+    # pandas and the splitters are only needed when (re)indexing
+    import pandas as pd
+    from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+    df = pd.read_csv(csv_path)
+    print(f"CSV columns: {df.columns.tolist()}")
+    print(f"CSV shape: {df.shape}")
+
+    header_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON)
+    size_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    documents = []
+    for _, row in df.iterrows():
+        source = str(row.iloc[0])
+        text = "\n".join(str(value) for value in row.iloc[1:] if pd.notna(value))
+        page = page_name(source)
+
+        sections = header_splitter.split_text(normalize_markdown(text))
+        for section, headers in zip(sections, section_headers(sections)):
+            section_path = " > ".join(headers)
+            prefix = f"[{page}] {section_path}".strip()
+            for chunk in size_splitter.split_text(section.page_content):
+                documents.append(Document(
+                    page_content=f"{prefix}\n{chunk}",
+                    metadata={
+                        "source": source,
+                        "page": page,
+                        "section": headers[-1] if headers else "",
+                        "section_path": section_path,
+                    }
+                ))
+
+    print(f"Created {len(documents)} document chunks")
+    return documents
+
+
+# Metadata that identifies a chunk (all of the metadata load_documents sets
+# except the innermost header, which section_path already contains)
+ID_METADATA = ("source", "page", "section_path")
+
+
+def chunk_id(document: Document) -> str:
+    """Deterministic ID from the chunk's content and its stable metadata"""
+    payload = json.dumps(
+        {
+            "content": document.page_content,
+            "metadata": {key: document.metadata.get(key) for key in ID_METADATA},
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def with_ids(documents: List[Document]) -> Dict[str, Document]:
+    """Map chunk ID -> document; identical chunks collapse into one entry"""
+    return {chunk_id(doc): doc for doc in documents}
+
+
+def sync_vector_store(vector_store, documents: List[Document]) -> Dict:
+    """Bring the vector store in line with `documents`.
+
+    Only chunks whose ID is not in the store yet are embedded; IDs in the
+    store that no longer match any chunk (changed or deleted rows, or the
+    random IDs of older builds) are removed. Because every embedded batch is
+    written straight away, a sync that fails half-way resumes from the
+    missing chunks on the next run. Stores with `deferred_save` (the NumPy
+    store) keep the batches in memory and write their files once when the
+    sync ends, failed or not.
+    """
+    wanted = with_ids(documents)
+    existing = set(vector_store.get(include=[])["ids"])
+
+    new_ids = [doc_id for doc_id in wanted if doc_id not in existing]
+    stale_ids = [doc_id for doc_id in existing if doc_id not in wanted]
+
+    embedding = None
+    with getattr(vector_store, "deferred_save", nullcontext)():
+        if new_ids:
+            embedding = embed_documents_in_batches(vector_store, vector_store.embeddings, new_ids, wanted)
+        if stale_ids:
+            vector_store.delete(ids=stale_ids)
+
+    report = {
+        "added": len(new_ids),
+        "removed": len(stale_ids),
+        "unchanged": len(wanted) - len(new_ids),
+        "embedding": embedding,
+    }
+    print(f"Vector store sync: {report['added']} added, {report['removed']} removed, "
+          f"{report['unchanged']} unchanged")
+    return report
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "resourceexhausted" in text or "resource exhausted" in text or "quota" in text
+
+
+class AdaptiveBackoff:
+    """Delay shared by all embedding workers.
+
+    Every 429 doubles the delay (up to `max_delay`) and every success shrinks
+    it again, so parallel workers slow down together when the quota is hit
+    and speed back up once requests go through.
+    """
+
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 60.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.throttled_count = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self.delay
+        if delay > 0:
+            time.sleep(delay * random.uniform(0.8, 1.2))
+
+    def throttled(self):
+        with self._lock:
+            self.throttled_count += 1
+            self.delay = min(self.max_delay, max(self.initial_delay, self.delay * 2))
+
+    def success(self):
+        with self._lock:
+            self.delay = self.delay / 2 if self.delay > 0.1 else 0.0
+
+
+def _add_embedded(vector_store, ids: List[str], documents: List[Document], vectors: List[List[float]]):
+    """Write pre-computed vectors; this is the per-batch checkpoint"""
+    if hasattr(vector_store, "add_embeddings"):
+        vector_store.add_embeddings(ids=ids, documents=documents, embeddings=vectors)
+        return
+    # Chroma has no public add-with-vectors API; upsert into its collection directly
+    metadatas = [doc.metadata or None for doc in documents]
+    vector_store._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=[doc.page_content for doc in documents],
+        metadatas=metadatas if any(metadatas) else None
+    )
+
+
+def embed_documents_in_batches(vector_store, embeddings, ids: List[str], documents_by_id: Dict[str, Document],
+                               batch_size: int = None, max_workers: int = None, max_retries: int = None) -> Dict:
+    """Embed `ids` in batches with bounded parallelism and add each batch as soon as it is done.
+
+    Batches hitting a 429 are retried after an adaptive, shared backoff.
+    Writes happen on the calling thread, one batch at a time.
+    """
+    batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", "100"))
+    max_workers = max_workers or int(os.getenv("EMBED_CONCURRENCY", "4"))
+    max_retries = max_retries if max_retries is not None else int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+    backoff = AdaptiveBackoff()
+
+    def embed_batch(batch_ids):
+        texts = [documents_by_id[doc_id].page_content for doc_id in batch_ids]
+        for attempt in range(max_retries + 1):
+            backoff.wait()
+            try:
+                vectors = embeddings.embed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                backoff.throttled()
+                print(f"Embedding rate limited (attempt {attempt + 1}); backing off {backoff.delay:.1f}s")
+                continue
+            backoff.success()
+            return batch_ids, vectors
+
+    start = time.monotonic()
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed") as executor:
+        futures = [executor.submit(embed_batch, batch_ids) for batch_ids in batches]
+        try:
+            for future in as_completed(futures):
+                batch_ids, vectors = future.result()
+                _add_embedded(vector_store, batch_ids, [documents_by_id[doc_id] for doc_id in batch_ids], vectors)
+                done += len(batch_ids)
+                elapsed = time.monotonic() - start
+                print(f"Embedded {done}/{len(ids)} chunks ({done * 100 // len(ids)}%), "
+                      f"{done / elapsed if elapsed else 0:.1f} chunks/s")
+        except Exception:
+            for future in futures:
+                future.cancel()
+            print(f"Embedding stopped after {done}/{len(ids)} chunks; the next sync resumes from there")
+            raise
+
+    elapsed = time.monotonic() - start
+    return {
+        "embedded": done,
+        "batches": len(batches),
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(done / elapsed, 2) if elapsed else 0,
+        "rate_limited": backoff.throttled_count,
+    }
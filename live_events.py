@@ -0,0 +1,196 @@
+"""In-process event bus behind the live analytics stream (GET /analytics/live).
+
+Write paths call `publish(event_type, session_id)` from any thread; that only
+bumps counters under a lock. Once per `interval` one asyncio task folds the
+pending counts into a single message for every subscriber, so a dashboard
+viewer costs one small write per tick and no database queries. Counts are
+per process: with several workers (WORKERS > 1, see prefork.py) a stream
+shows only the traffic of the worker serving it, so its messages carry
+`"scope": "worker"` and clients must not add those deltas to global totals.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from db_pool import _env_bool
+
+# Published event type -> counter it increments
+EVENT_COUNTERS = {
+    "session_start": "sessions",
+    "question_asked": "questions",
+    "bot_response": "answers",
+    "human_handover": "handovers",
+    "lead_captured": "leads",
+    "chatbot_close": "closes",
+}
+
+COUNTERS = tuple(EVENT_COUNTERS.values())
+
+# Window of the questions_per_minute rate
+RATE_WINDOW = 60.0
+
+
+class AnalyticsEventBus:
+    """Aggregates published events and fans the deltas out to subscribers"""
+
+    def __init__(self, interval: float = 1.0, keepalive: float = 15.0, queue_size: int = 64,
+                 workers: int = 1):
+        self.interval = interval
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        # "global" when this process serves all traffic, else "worker"
+        self.scope = "global" if workers <= 1 else "worker"
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pending = dict.fromkeys(COUNTERS, 0)
+        self._totals = dict.fromkeys(COUNTERS, 0)
+        self._active_sessions = set()
+        self._questions = deque()  # monotonic times of questions inside RATE_WINDOW
+        self._subscribers = set()
+        self._last_sent = None
+        self._task = None
+        self.started_at = datetime.now().isoformat()
+        self.sequence = 0
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    @classmethod
+    def from_env(cls) -> "AnalyticsEventBus":
+        return cls(
+            interval=float(os.getenv("LIVE_ANALYTICS_INTERVAL", "1")),
+            keepalive=float(os.getenv("LIVE_ANALYTICS_KEEPALIVE", "15")),
+            queue_size=int(os.getenv("LIVE_ANALYTICS_QUEUE_SIZE", "64")),
+            workers=int(os.getenv("WORKERS", "1")),
+        )
+
+    @staticmethod
+    def enabled_from_env() -> bool:
+        return _env_bool("LIVE_ANALYTICS_ENABLED", True)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def publish(self, event_type: str, session_id: Optional[str] = None):
+        """Record one event; thread-safe and cheap, unknown event types only touch the active set"""
+        counter = EVENT_COUNTERS.get(event_type)
+        with self._lock:
+            self.published += 1
+            if counter is not None:
+                self._pending[counter] += 1
+                self._totals[counter] += 1
+            if event_type == "question_asked":
+                self._questions.append(time.monotonic())
+            if session_id:
+                if event_type == "session_start":
+                    self._active_sessions.add(session_id)
+                elif event_type in ("session_end", "chatbot_close"):
+                    # Sets, so the websocket disconnect and the widget's POST
+                    # ending the same session only count once
+                    self._active_sessions.discard(session_id)
+
+    def _scope(self) -> dict:
+        return {"scope": self.scope, "workers": self.workers, "pid": os.getpid()}
+
+    def _gauges(self) -> dict:
+        cutoff = time.monotonic() - RATE_WINDOW
+        while self._questions and self._questions[0] < cutoff:
+            self._questions.popleft()
+        return {
+            "active_sessions": len(self._active_sessions),
+            "questions_per_minute": round(len(self._questions) * 60.0 / RATE_WINDOW, 2),
+        }
+
+    def _snapshot(self) -> dict:
+        return {"type": "snapshot", "since": self.started_at, "totals": dict(self._totals),
+                **self._scope(), **self._gauges()}
+
+    def _broadcast(self, message: Optional[dict]):
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too slow to keep up: end its stream; a reconnect starts from a new snapshot
+                self._subscribers.discard(subscriber)
+                self.dropped_subscribers += 1
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+
+    def tick(self, force: bool = False) -> Optional[dict]:
+        """Send pending deltas to every subscriber; returns the message, or None when nothing changed"""
+        with self._lock:
+            deltas = {counter: count for counter, count in self._pending.items() if count}
+            gauges = self._gauges()
+            if not (deltas or force or gauges != self._last_sent):
+                return None
+            self._pending = dict.fromkeys(COUNTERS, 0)
+            self._last_sent = gauges
+            self.sequence += 1
+            message = {"type": "delta", "seq": self.sequence, "deltas": deltas, "scope": self.scope, **gauges}
+            # Under the lock, so a subscriber joining now gets these counts in
+            # either its snapshot or this message, never both
+            self._broadcast(message)
+        return message
+
+    async def _run(self):
+        idle = 0.0
+        while True:
+            await asyncio.sleep(self.interval)
+            idle += self.interval
+            if self.tick(force=idle >= self.keepalive) is not None:
+                idle = 0.0
+
+    async def stream(self):
+        """Messages for one subscriber: a snapshot, then one delta message per changed tick"""
+        subscriber = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            snapshot = self._snapshot()
+            self._subscribers.add(subscriber)
+        try:
+            yield snapshot
+            while True:
+                message = await subscriber.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def start(self):
+        """Start the tick task on the running event loop"""
+        if self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # End open streams so the server can shut down
+        with self._lock:
+            for subscriber in list(self._subscribers):
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+            self._subscribers.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "interval": self.interval,
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "messages": self.sequence,
+                "dropped_subscribers": self.dropped_subscribers,
+                "since": self.started_at,
+                "totals": dict(self._totals),
+                **self._scope(),
+                **self._gauges(),
+            }
@@ -0,0 +1,337 @@
+"""Versioned schema migrations for the analytics database.
+
+Each migration is applied once and recorded in `schema_migrations`. Steps
+are idempotent (CREATE TABLE IF NOT EXISTS, columns and indexes are only
+added when INFORMATION_SCHEMA says they are missing), so a migration that
+failed half-way, or a database created by an older build, can simply be
+migrated again.
+
+    python migrations.py [migrate|status|check]
+
+`check` runs EXPLAIN on the hot event/analytics queries and warns about
+full table scans.
+"""
+import sys
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from mysql.connector import Error
+
+from rollups import create_rollup_state_tables, create_rollup_tables
+
+VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+"""
+
+# Serializes migrations across workers starting at the same time
+LOCK_NAME = "chatbot_analytics_migrations"
+LOCK_TIMEOUT = 60
+
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(
+        """
+        SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+         WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """,
+        (table, column)
+    )
+    return bool(cursor.fetchall())
+
+
+def _index_exists(cursor, table: str, index: str) -> bool:
+    cursor.execute(
+        """
+        SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS
+         WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """,
+        (table, index)
+    )
+    return bool(cursor.fetchall())
+
+
+def add_column(cursor, table: str, column: str, definition: str):
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def add_index(cursor, table: str, index: str, columns: str):
+    if not _index_exists(cursor, table, index):
+        cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+
+def create_base_tables(cursor):
+    """Tables written by analytics.py, for databases that do not have them yet"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id VARCHAR(64) PRIMARY KEY,
+            first_seen_at DATETIME,
+            last_active_at DATETIME,
+            total_sessions INT DEFAULT 0,
+            total_messages INT DEFAULT 0,
+            total_duration INT DEFAULT 0,
+            total_conversations INT DEFAULT 0,
+            is_active BOOLEAN DEFAULT TRUE,
+            last_page_url TEXT,
+            user_type VARCHAR(20) DEFAULT 'new'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id VARCHAR(64) PRIMARY KEY,
+            user_id VARCHAR(64),
+            start_time DATETIME,
+            end_time DATETIME NULL,
+            duration FLOAT,
+            page_url TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            conversation_id VARCHAR(64) PRIMARY KEY,
+            session_id VARCHAR(64),
+            user_id VARCHAR(64),
+            start_time DATETIME,
+            end_time DATETIME NULL,
+            duration INT,
+            status ENUM('active', 'completed', 'handover') DEFAULT 'active'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id VARCHAR(64) PRIMARY KEY,
+            conversation_id VARCHAR(64),
+            user_id VARCHAR(64),
+            message_type ENUM('user', 'bot', 'system'),
+            content TEXT,
+            timestamp DATETIME(6)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lead_analytics (
+            lead_id VARCHAR(64) PRIMARY KEY,
+            lead_type VARCHAR(50),
+            name VARCHAR(255),
+            created_at DATETIME,
+            updated_at DATETIME
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS human_handover (
+            handover_id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id VARCHAR(64),
+            session_id VARCHAR(64),
+            requested_at DATETIME,
+            method VARCHAR(50),
+            issues TEXT,
+            other_text TEXT,
+            support_option VARCHAR(255),
+            last_message TEXT,
+            status VARCHAR(20) DEFAULT 'pending'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chatbot_close_events (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id VARCHAR(64),
+            session_id VARCHAR(64),
+            closed_at DATETIME,
+            time_spent_seconds INT DEFAULT 0,
+            last_user_message TEXT,
+            last_bot_message TEXT
+        )
+    """)
+
+
+def add_session_columns(cursor):
+    """Formerly app.update_sessions_table(), which probed these on every boot"""
+    add_column(cursor, "sessions", "message_count", "INT DEFAULT 0")
+    add_column(cursor, "sessions", "last_message_time", "DATETIME")
+    add_column(cursor, "sessions", "status", "ENUM('active', 'completed', 'error') DEFAULT 'active'")
+
+
+def add_latency_columns(cursor):
+    add_column(cursor, "messages", "response_time", "FLOAT NULL")
+    add_column(cursor, "messages", "time_to_first_token", "FLOAT NULL")
+
+
+def add_hot_path_indexes(cursor):
+    # Per-user session lists, newest first (/analytics, /analytics/user/{id})
+    add_index(cursor, "sessions", "idx_sessions_user_start", "user_id, start_time")
+    add_index(cursor, "sessions", "idx_sessions_start", "start_time")
+    add_index(cursor, "sessions", "idx_sessions_status", "status")
+    # Active-conversation lookup in get_active_conversation / the event writer
+    add_index(cursor, "conversations", "idx_conversations_session_status_start",
+              "session_id, status, start_time")
+    add_index(cursor, "conversations", "idx_conversations_start", "start_time")
+    # Events of a conversation in order, and recent messages
+    add_index(cursor, "messages", "idx_messages_conversation_ts", "conversation_id, timestamp")
+    add_index(cursor, "messages", "idx_messages_ts", "timestamp")
+    add_index(cursor, "lead_analytics", "idx_lead_analytics_created", "created_at")
+    add_index(cursor, "human_handover", "idx_human_handover_requested", "requested_at")
+
+
+def add_pagination_indexes(cursor):
+    """(filter column, sort column) pairs for the keyset-paginated analytics lists"""
+    add_index(cursor, "users", "idx_users_last_active", "last_active_at")
+    add_index(cursor, "sessions", "idx_sessions_status_start", "status, start_time")
+    add_index(cursor, "conversations", "idx_conversations_user_start", "user_id, start_time")
+    add_index(cursor, "conversations", "idx_conversations_status_start", "status, start_time")
+    add_index(cursor, "messages", "idx_messages_user_ts", "user_id, timestamp")
+    add_index(cursor, "messages", "idx_messages_type_ts", "message_type, timestamp")
+
+
+def add_users_first_seen_index(cursor):
+    """/analytics/users pages on (first_seen_at, user_id); backfill the rare NULLs first"""
+    cursor.execute("""
+        UPDATE users SET first_seen_at = COALESCE(last_active_at, NOW())
+         WHERE first_seen_at IS NULL
+    """)
+    add_index(cursor, "users", "idx_users_first_seen", "first_seen_at")
+
+
+# (version, description, step); append new migrations, never edit applied ones
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "create base analytics tables", create_base_tables),
+    (2, "session message_count/last_message_time/status columns", add_session_columns),
+    (3, "message latency columns", add_latency_columns),
+    (4, "indexes for event and analytics queries", add_hot_path_indexes),
+    (5, "indexes for paginated analytics lists", add_pagination_indexes),
+    (6, "hourly and daily dashboard rollups", create_rollup_tables),
+    (7, "users first_seen_at pagination index", add_users_first_seen_index),
+    (8, "rollup watermark and dirty-hour queue", create_rollup_state_tables),
+]
+
+
+def applied_versions(cursor) -> set:
+    cursor.execute(VERSION_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(pool) -> List[int]:
+    """Apply pending migrations in order; returns the versions applied"""
+    applied = []
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+            if not cursor.fetchall()[0][0]:
+                raise Error(msg=f"Timed out waiting for migration lock {LOCK_NAME}")
+            try:
+                done = applied_versions(cursor)
+                for version, description, step in MIGRATIONS:
+                    if version in done:
+                        continue
+                    print(f"Applying migration {version}: {description}")
+                    # DDL commits implicitly in MySQL; the version row is written
+                    # last, so an interrupted step is simply re-run next time
+                    step(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                        (version, description, datetime.now())
+                    )
+                    connection.commit()
+                    applied.append(version)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchall()
+        finally:
+            cursor.close()
+    if applied:
+        print(f"Schema migrated to version {applied[-1]}")
+    return applied
+
+
+def status(pool) -> dict:
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            done = applied_versions(cursor)
+        finally:
+            cursor.close()
+    return {
+        "current": max(done) if done else 0,
+        "latest": MIGRATIONS[-1][0],
+        "pending": [version for version, _, _ in MIGRATIONS if version not in done],
+    }
+
+
+# (name, query, sample params) for the statements the app runs constantly
+HOT_QUERIES = [
+    ("active conversation lookup",
+     """SELECT conversation_id FROM conversations
+         WHERE session_id = %s AND status = 'active'
+         ORDER BY start_time DESC LIMIT 1""",
+     ("check",)),
+    ("user sessions",
+     "SELECT * FROM sessions WHERE user_id = %s ORDER BY start_time DESC",
+     ("check",)),
+    ("conversation events",
+     """SELECT message_type, timestamp, content FROM messages
+         WHERE conversation_id = %s ORDER BY timestamp""",
+     ("check",)),
+    ("session message counts",
+     """SELECT s.session_id, COUNT(m.message_id) FROM sessions s
+          LEFT JOIN messages m ON s.session_id = m.conversation_id
+         WHERE s.user_id = %s GROUP BY s.session_id""",
+     ("check",)),
+    ("recent sessions",
+     "SELECT * FROM sessions ORDER BY start_time DESC LIMIT 10",
+     None),
+    ("recent conversations",
+     "SELECT * FROM conversations ORDER BY start_time DESC LIMIT 10",
+     None),
+    ("recent messages",
+     "SELECT * FROM messages ORDER BY timestamp DESC LIMIT 20",
+     None),
+    ("recent users",
+     "SELECT * FROM users ORDER BY first_seen_at DESC, user_id DESC LIMIT 20",
+     None),
+    ("sessions page after cursor",
+     """SELECT * FROM sessions
+         WHERE (start_time < %s OR (start_time = %s AND session_id < %s))
+         ORDER BY start_time DESC, session_id DESC LIMIT 21""",
+     ("2024-01-01 00:00:00", "2024-01-01 00:00:00", "check")),
+]
+
+
+def check(pool) -> List[str]:
+    """EXPLAIN the hot queries; returns (and prints) a warning per full table scan"""
+    warnings = []
+    with pool.connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            for name, query, params in HOT_QUERIES:
+                cursor.execute("EXPLAIN " + query, params)
+                for row in cursor.fetchall():
+                    if (row.get("type") or "").upper() == "ALL":
+                        warnings.append(
+                            f"{name}: full scan of {row.get('table')} "
+                            f"(~{row.get('rows')} rows, possible keys: {row.get('possible_keys')})"
+                        )
+        finally:
+            cursor.close()
+    for warning in warnings:
+        print(f"WARNING {warning}")
+    if not warnings:
+        print(f"All {len(HOT_QUERIES)} hot queries use an index")
+    return warnings
+
+
+if __name__ == "__main__":
+    from analytics import db_pool
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "migrate":
+        migrate(db_pool)
+    elif command == "status":
+        print(status(db_pool))
+    elif command == "check":
+        sys.exit(1 if check(db_pool) else 0)
+    else:
+        sys.exit(f"Unknown command {command!r}; use migrate, status or check")
@@ -0,0 +1,298 @@
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from hybrid_retrieval import matches_filter
+
+
+class NumpyVectorStore(VectorStore):
+    """Brute-force vector store over a contiguous float32 matrix.
+
+    Vectors are L2-normalized on insert so a query is one matrix-vector
+    product (cosine similarity). Searches over more than `block_size` rows
+    are done block by block, keeping a running top-k, so the score buffer
+    stays small. The index is persisted as `vectors.npy` + `documents.json`
+    in `persist_directory`; the matrix is memory-mapped on load, so forked
+    workers share its pages.
+
+    Searches never take the write lock: they read an immutable snapshot of
+    (matrix, ids, texts, metadatas) that writers replace. Appends go into a
+    buffer with spare capacity, so adding a batch does not copy the matrix,
+    and inside `deferred_save()` the files are written once at the end
+    instead of after every batch.
+
+    The API mirrors the parts of Chroma the app uses: `get`, `delete`,
+    `add_texts`, `add_embeddings`, `similarity_search` with a metadata
+    `filter`, and `as_retriever`.
+    """
+
+    def __init__(self, embedding_function: Embeddings, persist_directory: Optional[str] = None,
+                 block_size: int = 65536):
+        self._embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._defer_depth = 0
+        self._dirty = False
+
+        # Rows [0, n) of _buffer are the live matrix; the rest is spare capacity
+        self._buffer = None
+        # (matrix, ids, texts, metadatas) read by searches; replaced, never mutated
+        # below len(matrix), so a reader only looks at the rows it was given
+        self._snapshot: Tuple[np.ndarray, List[str], List[str], List[dict]] = (
+            np.zeros((0, 0), dtype=np.float32), [], [], []
+        )
+        if persist_directory and os.path.exists(self._vectors_path):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    @embeddings.setter
+    def embeddings(self, embedding_function: Embeddings):
+        # Pre-fork workers swap in their own API client (see prefork.py)
+        self._embedding_function = embedding_function
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.persist_directory, "vectors.npy")
+
+    @property
+    def _documents_path(self) -> str:
+        return os.path.join(self.persist_directory, "documents.json")
+
+    def _load(self):
+        with open(self._documents_path, encoding="utf-8") as f:
+            data = json.load(f)
+        matrix = np.load(self._vectors_path, mmap_mode="r")
+        self._snapshot = (matrix, data["ids"], data["documents"], data["metadatas"])
+
+    def _save(self):
+        if not self.persist_directory:
+            return
+        if self._defer_depth:
+            self._dirty = True
+            return
+        matrix, ids, texts, metadatas = self._snapshot
+        os.makedirs(self.persist_directory, exist_ok=True)
+        # Write to temp files and rename, so readers never see a half-written index
+        tmp_vectors = self._vectors_path + ".tmp.npy"
+        tmp_documents = self._documents_path + ".tmp"
+        np.save(tmp_vectors, np.ascontiguousarray(matrix))
+        with open(tmp_documents, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documents": texts, "metadatas": metadatas}, f)
+        os.replace(tmp_documents, self._documents_path)
+        os.replace(tmp_vectors, self._vectors_path)
+        self._dirty = False
+
+    @contextmanager
+    def deferred_save(self):
+        """Writes inside the block are persisted once when it exits, also when it raises"""
+        with self._lock:
+            self._defer_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._defer_depth -= 1
+                if not self._defer_depth and self._dirty:
+                    self._save()
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # --- Writes ---
+
+    def _append_rows(self, matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """`matrix` plus `rows`, grown into spare capacity (doubling) instead of copied each time"""
+        n, needed = len(matrix), len(matrix) + len(rows)
+        if self._buffer is None or matrix.base is not self._buffer or len(self._buffer) < needed:
+            dim = rows.shape[1]
+            self._buffer = np.empty((max(needed, 2 * n, 1024), dim), dtype=np.float32)
+            self._buffer[:n] = matrix
+        self._buffer[n:needed] = rows
+        return self._buffer[:needed]
+
+    def add_embeddings(self, ids: List[str], documents: List[Document], embeddings: List[List[float]]) -> List[str]:
+        """Upsert documents with pre-computed vectors"""
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            matrix, ids_, texts, metadatas = self._snapshot
+            position = {doc_id: i for i, doc_id in enumerate(ids_)}
+            updates, new_rows = [], {}
+            for doc_id, doc, vector in zip(ids, documents, vectors):
+                if doc_id in position:
+                    updates.append((position[doc_id], doc, vector))
+                else:
+                    new_rows[doc_id] = (doc, vector)
+            if updates:
+                # Rows readers may be using change: copy instead of writing in place
+                matrix = np.array(matrix, dtype=np.float32)
+                ids_, texts, metadatas = list(ids_), list(texts), list(metadatas)
+                self._buffer = None
+                for i, doc, vector in updates:
+                    matrix[i] = vector
+                    texts[i] = doc.page_content
+                    metadatas[i] = doc.metadata or {}
+            if new_rows:
+                if not len(ids_):
+                    matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+                matrix = self._append_rows(matrix, np.stack([vector for _, vector in new_rows.values()]))
+                # Appending past the end of the lists leaves every older snapshot's rows as they were
+                for doc_id, (doc, _) in new_rows.items():
+                    ids_.append(doc_id)
+                    texts.append(doc.page_content)
+                    metadatas.append(doc.metadata or {})
+            self._snapshot = (matrix, ids_, texts, metadatas)
+            self._save()
+        return list(ids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self._embedding_function.embed_documents(texts)
+        documents = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        return self.add_embeddings(ids, documents, vectors)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        remove = set(ids)
+        with self._lock:
+            matrix, ids_, texts, metadatas = self._snapshot
+            keep = [i for i, doc_id in enumerate(ids_) if doc_id not in remove]
+            matrix = np.ascontiguousarray(np.asarray(matrix)[keep]) if keep else np.zeros((0, 0), dtype=np.float32)
+            self._buffer = None
+            self._snapshot = (
+                matrix, [ids_[i] for i in keep], [texts[i] for i in keep], [metadatas[i] for i in keep]
+            )
+            self._save()
+        return True
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory: Optional[str] = None,
+                   **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding, persist_directory=persist_directory)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    # --- Reads ---
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Chroma-compatible `get`: always returns ids, plus documents/metadatas when included"""
+        include = ["documents", "metadatas"] if include is None else include
+        matrix, ids_, texts, metadatas = self._snapshot
+        rows = range(len(matrix))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [i for i in rows if ids_[i] in wanted]
+        result = {"ids": [ids_[i] for i in rows]}
+        if "documents" in include:
+            result["documents"] = [texts[i] for i in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [metadatas[i] for i in rows]
+        return result
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+    @staticmethod
+    def _mask(metadatas: List[dict], n: int, filter: Optional[Dict]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        return np.fromiter((matches_filter(metadatas[i], filter) for i in range(n)), dtype=bool, count=n)
+
+    def _top_k(self, matrix: np.ndarray, queries: np.ndarray, k: int,
+               mask: Optional[np.ndarray]) -> List[List[Tuple[int, float]]]:
+        n = matrix.shape[0]
+        if n == 0:
+            return [[] for _ in range(len(queries))]
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, n, self.block_size):
+            block = matrix[start:start + self.block_size]
+            scores = queries @ block.T
+            if mask is not None:
+                scores = np.where(mask[start:start + self.block_size], scores, -np.inf)
+            rows = np.broadcast_to(np.arange(start, start + block.shape[0]), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores, best_rows = scores, rows
+        order = np.argsort(-best_scores, axis=1)
+        results = []
+        for q in range(len(queries)):
+            hits = []
+            for j in order[q]:
+                score = float(best_scores[q, j])
+                if score == -np.inf:
+                    break
+                hits.append((int(best_rows[q, j]), score))
+            results.append(hits)
+        return results
+
+    @staticmethod
+    def _documents(snapshot, hits: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        _, ids, texts, metadatas = snapshot
+        return [
+            (Document(page_content=texts[i], metadata=metadatas[i], id=ids[i]), score)
+            for i, score in hits
+        ]
+
+    def _search(self, queries: np.ndarray, k: int, filter: Optional[Dict]):
+        snapshot = self._snapshot
+        matrix, _, _, metadatas = snapshot
+        hits = self._top_k(matrix, queries, k, self._mask(metadatas, len(matrix), filter))
+        return [self._documents(snapshot, h) for h in hits]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        return self._search(self._normalize(embedding), k, filter)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None,
+                                 **kwargs: Any) -> List[Document]:
+        vector = await self._embedding_function.aembed_query(query)
+        return self.similarity_search_by_vector(vector, k, filter)
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity is already in [-1, 1]; map it to [0, 1]
+        return lambda score: (score + 1) / 2
+
+    def similarity_search_batch(self, queries: List[str], k: int = 4,
+                                filter: Optional[Dict] = None) -> List[List[Document]]:
+        """Embed and search several queries with one matrix product"""
+        vectors = self._normalize([self._embedding_function.embed_query(q) for q in queries])
+        return [[doc for doc, _ in hits] for hits in self._search(vectors, k, filter)]
@@ -0,0 +1,103 @@
+"""Pre-fork server: build the index once in the parent, serve from N forked workers.
+
+    WORKERS=4 python app.py
+
+The parent binds the listening socket, runs `preload` (app.preload_index:
+the vector store and BM25 index) and forks. Workers inherit what the parent
+built copy-on-write; the NumPy index matrix is a read-only mmap, so its
+pages stay shared through the page cache. All workers accept on the same
+socket. Anything holding sockets, threads or file handles (API clients, the
+MySQL pool, SQLite connections) must be created after the fork; the app does
+that in its lifespan.
+
+The parent restarts workers that exit and passes SIGINT/SIGTERM on as
+SIGTERM, so each worker shuts down gracefully. POSIX only.
+"""
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+from typing import Callable, Optional
+
+# Pause before replacing a worker that died, so a crash loop does not spin
+RESTART_DELAY = 1.0
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, uvicorn_kwargs: dict):
+    import uvicorn
+
+    # Own process group: a terminal Ctrl-C reaches only the parent, which
+    # then stops the workers once instead of each getting it twice
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, **uvicorn_kwargs))
+    server.run(sockets=[sock])
+
+
+def serve_prefork(app, host: str, port: int, workers: int, preload: Optional[Callable[[], None]] = None,
+                  **uvicorn_kwargs):
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Pre-fork mode needs os.fork(); run a single worker on this platform")
+    sock = bind_socket(host, port)
+    if preload is not None:
+        preload()
+    # Never collect what was built so far: the GC would otherwise write to
+    # those objects' pages in every worker and un-share them
+    gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app, sock, uvicorn_kwargs)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        print(f"Started worker {slot} (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for slot in range(workers):
+        spawn(slot)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        print(f"Worker {slot} (pid {pid}) exited with code {os.waitstatus_to_exitcode(status)}; restarting")
+        time.sleep(RESTART_DELAY)
+        if not stopping:
+            spawn(slot)
+    sock.close()
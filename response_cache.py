@@ -0,0 +1,150 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable
+
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+
+
+class ResponseCache:
+    """Short-TTL cache of endpoint results keyed on (endpoint, query parameters).
+
+    Concurrent requests for a key that is being computed wait for that one
+    computation instead of running their own (single-flight). Writes call
+    `invalidate(endpoint, ...)`, which bumps the endpoint's generation; an
+    entry is only served while its generation is current, so a result that
+    was being computed while a write happened is not reused either.
+    """
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, created_at, generation)
+        self._generations = defaultdict(int)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def invalidate(self, *endpoints: str):
+        """Drop cached results of `endpoints` (all endpoints when none are given); thread-safe"""
+        with self._lock:
+            self.invalidations += 1
+            if not endpoints:
+                endpoints = list(self._generations) + [key[0] for key in self._entries]
+            for endpoint in set(endpoints):
+                self._generations[endpoint] += 1
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created_at, generation = entry
+        if generation != self._generations[key[0]] or time.monotonic() - created_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value, time.monotonic() - created_at
+
+    async def get_or_compute(self, endpoint: str, params: dict, compute: Callable):
+        """Return (value, age_seconds, "HIT" | "MISS" | "COALESCED").
+
+        `compute` is an async callable, run at most once per key at a time.
+        """
+        key = (endpoint, tuple(sorted((name, str(value)) for name, value in params.items())))
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                self.hits += 1
+                return (*cached, "HIT")
+            future = self._inflight.get(key)
+            if future is None:
+                self.misses += 1
+                generation = self._generations[endpoint]
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[key] = future
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            return await asyncio.shield(future), 0.0, "COALESCED"
+
+        try:
+            value = await compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Nobody else may be waiting; don't warn about an unretrieved exception
+                future.exception()
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._entries[key] = (value, time.monotonic(), generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value, 0.0, "MISS"
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "ttl": self.ttl,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0,
+            }
+
+
+def cached_endpoint(cache: ResponseCache, endpoint: str):
+    """Decorator for FastAPI handlers; adds `X-Cache` and `X-Cache-Age` headers.
+
+    The handler's own parameters form the cache key. A `response: Response`
+    parameter is added to the signature FastAPI sees, so the decorated
+    handler can set headers without changing its declared parameters. A
+    cache with ttl <= 0 is bypassed. Plain `def` handlers (blocking DB work)
+    run in the threadpool, as FastAPI would run them undecorated.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        is_async = inspect.iscoroutinefunction(func)
+
+        async def call(kwargs):
+            if is_async:
+                return await func(**kwargs)
+            return await run_in_threadpool(func, **kwargs)
+
+        @functools.wraps(func)
+        async def wrapper(*, response: Response, **kwargs):
+            if cache.ttl <= 0:
+                return await call(kwargs)
+            value, age, status = await cache.get_or_compute(endpoint, kwargs, lambda: call(kwargs))
+            response.headers["X-Cache"] = status
+            response.headers["X-Cache-Age"] = f"{age:.3f}"
+            return value
+
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("response", inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+        ])
+        return wrapper
+
+    return decorator
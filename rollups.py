@@ -0,0 +1,388 @@
+"""Hourly and daily rollups of the dashboard counters.
+
+`analytics_rollup_hourly` holds one row per hour with counts and sums
+(averages are sum / count so they can be re-aggregated), and
+`analytics_rollup_daily` is summed from it. Only whole hours before the
+watermark in `analytics_rollup_state` are rolled up; reads (`totals`,
+`daily_view`) add the raw rows past it, so they are never stale.
+
+Every `interval` seconds a background compactor rolls up the hours that
+became complete since the last pass (an hour counts as complete `settle`
+seconds after it ends, so queued event writes land first), plus the hours
+listed in `analytics_rollup_dirty`: writers that change a row behind the
+watermark, such as a session's duration being set when it ends, mark its
+hour there. A pass reads only the raw rows of those hours. It replaces
+whole buckets, so it is idempotent and safe to run from several workers
+(a MySQL lock skips overlapping passes).
+
+    python rollups.py rebuild    # backfill every bucket from the raw tables
+"""
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from mysql.connector import Error
+
+from db_pool import _env_bool
+
+METRICS = (
+    "sessions", "session_duration_sum", "session_duration_count",
+    "conversations", "conversation_duration_sum", "conversation_duration_count",
+    "questions", "answers", "response_time_sum", "response_time_count",
+    "leads", "scheduled_leads", "handovers", "closes",
+)
+
+LOCK_NAME = "chatbot_analytics_rollups"
+
+# End of the rolled-up hours (exclusive); NULL before the first pass
+WATERMARK = "(SELECT compacted_until FROM analytics_rollup_state WHERE id = 1)"
+
+
+def _hour(column: str) -> str:
+    return f"TIMESTAMP(DATE({column}), MAKETIME(HOUR({column}), 0, 0))"
+
+
+# (time column, query) per raw table; each yields `bucket` plus some METRICS
+SOURCES = [
+    ("start_time", f"""
+        SELECT {_hour('start_time')} as bucket,
+               COUNT(*) as sessions,
+               SUM(CASE WHEN duration > 0 THEN duration ELSE 0 END) as session_duration_sum,
+               COUNT(CASE WHEN duration > 0 THEN 1 END) as session_duration_count
+        FROM sessions"""),
+    ("start_time", f"""
+        SELECT {_hour('start_time')} as bucket,
+               COUNT(*) as conversations,
+               SUM(COALESCE(duration, 0)) as conversation_duration_sum,
+               COUNT(duration) as conversation_duration_count
+        FROM conversations"""),
+    ("timestamp", f"""
+        SELECT {_hour('timestamp')} as bucket,
+               COUNT(CASE WHEN message_type = 'user' THEN 1 END) as questions,
+               COUNT(CASE WHEN message_type = 'bot' THEN 1 END) as answers,
+               SUM(CASE WHEN message_type = 'bot' THEN COALESCE(response_time, 0) ELSE 0 END) as response_time_sum,
+               COUNT(CASE WHEN message_type = 'bot' THEN response_time END) as response_time_count
+        FROM messages"""),
+    ("created_at", f"""
+        SELECT {_hour('created_at')} as bucket,
+               COUNT(*) as leads,
+               COUNT(CASE WHEN lead_type = 'appointment_scheduled' THEN 1 END) as scheduled_leads
+        FROM lead_analytics"""),
+    ("requested_at", f"""
+        SELECT {_hour('requested_at')} as bucket,
+               COUNT(*) as handovers
+        FROM human_handover"""),
+    ("closed_at", f"""
+        SELECT {_hour('closed_at')} as bucket,
+               COUNT(*) as closes
+        FROM chatbot_close_events"""),
+]
+
+
+def mark_dirty_sql(table: str, time_column: str, key_column: str) -> str:
+    """Statement (one param: the row key) that queues the row's hour for recompute if it is rolled up already"""
+    return f"""
+        INSERT IGNORE INTO analytics_rollup_dirty (bucket)
+        SELECT {_hour(time_column)} FROM {table}
+         WHERE {key_column} = %s AND {time_column} < {WATERMARK}
+    """
+
+
+# For rows written with a caller-supplied time; the param is that time
+MARK_TIME_DIRTY = f"""
+    INSERT IGNORE INTO analytics_rollup_dirty (bucket)
+    SELECT {_hour('t.at')} FROM (SELECT CAST(%s AS DATETIME) as at) t
+     WHERE t.at < {WATERMARK}
+"""
+MARK_SESSION_DIRTY = mark_dirty_sql("sessions", "start_time", "session_id")
+MARK_CONVERSATION_DIRTY = mark_dirty_sql("conversations", "start_time", "conversation_id")
+
+
+def create_rollup_tables(cursor):
+    """Migration step (see migrations.py)"""
+    columns = ",\n".join(
+        f"{metric} {'DOUBLE' if metric.endswith('_sum') else 'INT'} NOT NULL DEFAULT 0" for metric in METRICS
+    )
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS analytics_rollup_hourly (bucket DATETIME PRIMARY KEY, {columns})")
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS analytics_rollup_daily (bucket DATE PRIMARY KEY, {columns})")
+
+
+def create_rollup_state_tables(cursor):
+    """Migration step: the compaction watermark and the hours queued for recompute"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+            id TINYINT PRIMARY KEY,
+            compacted_until DATETIME NOT NULL
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS analytics_rollup_dirty (bucket DATETIME PRIMARY KEY)")
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+
+def hour_floor(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def read_watermark(cursor) -> Optional[datetime]:
+    cursor.execute(f"SELECT {WATERMARK} as watermark")
+    return cursor.fetchall()[0]["watermark"]
+
+
+def aggregate(cursor, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[datetime, dict]:
+    """Metrics per hourly bucket from the raw rows in [start, end)"""
+    buckets: Dict[datetime, dict] = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for column, query in SOURCES:
+        clauses, params = [f"{column} IS NOT NULL"], []
+        if start is not None:
+            clauses.append(f"{column} >= %s")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{column} < %s")
+            params.append(end)
+        cursor.execute(query + " WHERE " + " AND ".join(clauses) + " GROUP BY bucket", tuple(params))
+        for row in cursor.fetchall():
+            bucket = row.pop("bucket")
+            for metric, value in row.items():
+                buckets[bucket][metric] += float(value or 0)
+    return buckets
+
+
+def merge_ranges(ranges: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def recompute(cursor, ranges: Optional[List[Tuple[datetime, datetime]]], until: datetime) -> int:
+    """Rebuild the hourly buckets in `ranges` ([start, end) in whole hours) and the days they fall in.
+
+    With `ranges=None` every bucket before `until` is rebuilt and all later ones are dropped.
+    """
+    if ranges is None:
+        buckets = aggregate(cursor, end=until)
+        cursor.execute("DELETE FROM analytics_rollup_hourly")
+        cursor.execute("DELETE FROM analytics_rollup_daily")
+        days = None
+    else:
+        buckets, days = {}, set()
+        for start, end in ranges:
+            buckets.update(aggregate(cursor, start, end))
+            cursor.execute("DELETE FROM analytics_rollup_hourly WHERE bucket >= %s AND bucket < %s", (start, end))
+            day = start.date()
+            while day <= (end - timedelta(microseconds=1)).date():
+                days.add(day)
+                day += timedelta(days=1)
+    if buckets:
+        cursor.executemany(
+            f"INSERT INTO analytics_rollup_hourly (bucket, {', '.join(METRICS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(METRICS))})",
+            [(bucket, *(values[m] for m in METRICS)) for bucket, values in buckets.items()]
+        )
+
+    # Daily rows are summed from the (few) hourly rows of the touched days
+    insert_daily = f"""
+        INSERT INTO analytics_rollup_daily (bucket, {', '.join(METRICS)})
+        SELECT DATE(bucket), {', '.join(f'SUM({m})' for m in METRICS)}
+        FROM analytics_rollup_hourly
+    """
+    if days is None:
+        cursor.execute(insert_daily + " GROUP BY DATE(bucket)")
+    for day in sorted(days or ()):
+        next_day = _as_datetime(day + timedelta(days=1))
+        cursor.execute("DELETE FROM analytics_rollup_daily WHERE bucket = %s", (day,))
+        cursor.execute(insert_daily + " WHERE bucket >= %s AND bucket < %s GROUP BY DATE(bucket)",
+                       (_as_datetime(day), next_day))
+    return len(buckets)
+
+
+def totals(cursor, since=None, until=None) -> dict:
+    """Sum of every metric for [since, until): the daily rollups plus the raw rows past the watermark"""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("bucket >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("bucket < %s")
+        params.append(until)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    cursor.execute(
+        f"SELECT {', '.join(f'COALESCE(SUM({m}), 0) as {m}' for m in METRICS)} FROM analytics_rollup_daily{where}",
+        tuple(params)
+    )
+    result = {metric: float(value or 0) for metric, value in cursor.fetchall()[0].items()}
+
+    # Live tail: at most about an hour of raw rows, on the time-column indexes
+    since, until = _as_datetime(since), _as_datetime(until)
+    start = read_watermark(cursor)
+    if since is not None and (start is None or since > start):
+        start = since
+    if until is None or start is None or until > start:
+        for values in aggregate(cursor, start, until).values():
+            for metric, value in values.items():
+                result[metric] += value
+    return result
+
+
+def daily_view(table: str, metrics: Tuple[str, ...]) -> str:
+    """Derived table of (bucket, *metrics) rows per day: the daily rollups plus `table`'s rows past the watermark.
+
+    The watermark's day can appear twice, so callers GROUP BY bucket.
+    """
+    column, query = next((c, q) for c, q in SOURCES if q.rstrip().endswith(f"FROM {table}"))
+    return f"""(
+        SELECT bucket, {', '.join(metrics)} FROM analytics_rollup_daily
+        UNION ALL
+        SELECT DATE(bucket) as bucket, {', '.join(f'SUM({m}) as {m}' for m in metrics)}
+          FROM ({query}
+                WHERE {column} >= COALESCE({WATERMARK}, '1000-01-01')
+                GROUP BY bucket) tail
+         GROUP BY DATE(bucket)
+    )"""
+
+
+def average(values: dict, name: str, digits: int = 2):
+    count = values[f"{name}_count"]
+    return round(values[f"{name}_sum"] / count, digits) if count else 0
+
+
+class RollupCompactor:
+    """Daemon thread that keeps the rollup tables current"""
+
+    def __init__(self, pool, interval: float = 60.0, settle: float = 300.0):
+        self.pool = pool
+        self.interval = interval
+        self.settle = settle
+        self._stop = threading.Event()
+        self._thread = None
+        self.passes = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_run = None
+        self.last_seconds = None
+        self.last_buckets = None
+        self.watermark = None
+
+    @classmethod
+    def from_env(cls, pool) -> "RollupCompactor":
+        return cls(
+            pool,
+            interval=float(os.getenv("ROLLUP_INTERVAL", "60")),
+            settle=float(os.getenv("ROLLUP_SETTLE_SECONDS", "300")),
+        )
+
+    @staticmethod
+    def enabled_from_env() -> bool:
+        return _env_bool("ROLLUPS_ENABLED", True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def compact(self, full: bool = False) -> bool:
+        """One pass; returns False when another worker holds the lock"""
+        start = time.perf_counter()
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT GET_LOCK(%s, 0) as locked", (LOCK_NAME,))
+                if not cursor.fetchall()[0]["locked"]:
+                    self.skipped += 1
+                    return False
+                try:
+                    watermark = read_watermark(cursor)
+                    # First run against existing data: backfill everything
+                    full = full or watermark is None
+                    until = hour_floor(datetime.now() - timedelta(seconds=self.settle))
+                    if not full:
+                        until = max(until, watermark)
+                    # Locking read: a writer marking one of these hours again
+                    # waits for this pass to commit, so its mark is not lost
+                    cursor.execute("SELECT bucket FROM analytics_rollup_dirty FOR UPDATE")
+                    dirty = [row["bucket"] for row in cursor.fetchall()]
+                    if full:
+                        buckets = recompute(cursor, None, until)
+                    else:
+                        ranges = [(bucket, bucket + timedelta(hours=1)) for bucket in dirty]
+                        if until > watermark:
+                            ranges.append((watermark, until))
+                        buckets = recompute(cursor, merge_ranges(ranges), until) if ranges else 0
+                    if dirty:
+                        cursor.execute(
+                            f"DELETE FROM analytics_rollup_dirty WHERE bucket IN ({', '.join(['%s'] * len(dirty))})",
+                            tuple(dirty)
+                        )
+                    cursor.execute(
+                        "REPLACE INTO analytics_rollup_state (id, compacted_until) VALUES (1, %s)", (until,)
+                    )
+                    connection.commit()
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                    cursor.fetchall()
+            finally:
+                cursor.close()
+        self.passes += 1
+        self.last_run = datetime.now().isoformat()
+        self.last_seconds = round(time.perf_counter() - start, 3)
+        self.last_buckets = buckets
+        self.watermark = until.isoformat()
+        if full:
+            print(f"Rebuilt analytics rollups: {buckets} hourly buckets in {self.last_seconds}s")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.compact()
+            except Error as e:
+                self.failures += 1
+                print(f"Error compacting analytics rollups: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "settle": self.settle,
+            "passes": self.passes,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_run": self.last_run,
+            "last_seconds": self.last_seconds,
+            "last_buckets": self.last_buckets,
+            "watermark": self.watermark,
+        }
+
+
+if __name__ == "__main__":
+    from analytics import db_pool
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    if command != "rebuild":
+        sys.exit(f"Unknown command {command!r}; use rebuild")
+    RollupCompactor(db_pool).compact(full=True)
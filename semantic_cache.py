@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+class SemanticCache:
+    """Answer cache keyed on the question embedding.
+
+    A lookup returns the cached answer of the most similar stored question
+    when its cosine similarity is at least `threshold`. Entries expire after
+    `ttl` seconds and the least recently used one is evicted once
+    `max_entries` is reached.
+
+    `version_fn` should return something that changes whenever the vector
+    store is rebuilt (see `index_version` in app.py); the cache empties itself
+    when the value changes, since answers were produced from the old index.
+    It is polled at most every `version_check_interval` seconds.
+
+    Vectors live in one preallocated float32 matrix, one row per entry, that
+    is written on insert and freed on eviction, so a lookup is a single
+    matrix-vector product without copying the entries.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000,
+                 version_fn: Callable[[], object] = None, version_check_interval: float = 1.0):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+
+        self._entries = OrderedDict()  # key -> (matrix row or None, question, answer, created_at)
+        self._next_key = 0
+        # Allocated with the first vector; rows [0, _rows) have been used,
+        # _row_keys maps a row to its entry key (-1 when free)
+        self._matrix = None
+        self._row_keys = np.full(max_entries + 1, -1, dtype=np.int64)
+        self._free_rows = []
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else None
+        self._version_checked_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            if self._entries:
+                print("Vector store changed; clearing semantic answer cache")
+            self._clear()
+            self.invalidations += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._row_keys[:] = -1
+        self._free_rows = []
+        self._rows = 0
+
+    def _remove(self, key):
+        row = self._entries.pop(key)[0]
+        if row is not None:
+            self._row_keys[row] = -1
+            self._free_rows.append(row)
+
+    def _take_row(self, vector: np.ndarray, key: int) -> int:
+        if self._matrix is None:
+            self._matrix = np.zeros((len(self._row_keys), len(vector)), dtype=np.float32)
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = self._rows
+            self._rows += 1
+        self._matrix[row] = vector
+        self._row_keys[row] = key
+        return row
+
+    def _expire(self):
+        if self.ttl <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl
+        # Entries are in insertion/use order, but use refreshes order without
+        # refreshing age, so scan everything
+        expired = [key for key, entry in self._entries.items() if entry[3] < cutoff]
+        for key in expired:
+            self._remove(key)
+            self.evictions += 1
+
+    def lookup(self, vector: List[float]) -> Optional[str]:
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version()
+            self._expire()
+            # Entries stored without a vector only answer lookup_question()
+            if self._matrix is None or not self._rows:
+                self.misses += 1
+                return None
+            scores = self._matrix[:self._rows] @ query
+            scores[self._row_keys[:self._rows] < 0] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = int(self._row_keys[best])
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][2]
+
+    def lookup_question(self, question: str) -> Optional[str]:
+        """Exact match on the normalized question text; needs no embedding"""
+        wanted = normalize_text(question).lower()
+        with self._lock:
+            self._check_version()
+            self._expire()
+            for key, entry in reversed(self._entries.items()):
+                if normalize_text(entry[1]).lower() == wanted:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+            self.misses += 1
+            return None
+
+    def store(self, vector: Optional[List[float]], question: str, answer: str):
+        """`vector` may be None for answers that should only be found by lookup_question()"""
+        vector = self._normalize(vector) if vector is not None else None
+        with self._lock:
+            self._check_version()
+            key = self._next_key
+            self._next_key += 1
+            row = self._take_row(vector, key) if vector is not None else None
+            self._entries[key] = (row, question, answer, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }